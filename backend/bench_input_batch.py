@@ -0,0 +1,82 @@
+# bench_input_batch.py
+# POST /api/input/batch（一次提交 N 条） vs N 次 POST /api/input
+#
+# 用法：python bench_input_batch.py [--items 500] [--authors 10] [--delta]
+# 用 Flask test client 直接调用（不经过网络），只走确定性路由；在临时 DATA_DIR 中运行。
+# 两种方式各写到不同的日期，当天初始都为空，写入的条数相同
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_bench_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import server  # noqa: E402
+
+# 以记录为主，夹杂打卡和查询
+TEXTS = ["完成WMS用例执行", "修复登录页样式问题", "编写接口测试脚本", "打卡", "今天做了啥"]
+
+
+def _items(count: int, authors: int, day: str):
+    return [
+        {"text": TEXTS[i % len(TEXTS)], "author": f"user{i % authors}", "date": day}
+        for i in range(count)
+    ]
+
+
+def _run_single(client, items, delta: bool):
+    size = 0
+    for item in items:
+        body = dict(item, response="delta") if delta else item
+        resp = client.post("/api/input", json=body)
+        assert resp.status_code == 200, resp.get_json()
+        size += len(resp.data)
+    return size
+
+
+def _run_batch(client, items, delta: bool):
+    body = {"items": items, "response": "delta"} if delta else {"items": items}
+    resp = client.post("/api/input/batch", json=body)
+    assert resp.status_code == 200, resp.get_json()
+    result = resp.get_json()
+    assert result["count"] == len(items) and all(r["ok"] for r in result["results"])
+    return len(resp.data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批量输入接口与逐条调用的对比")
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--authors", type=int, default=10)
+    parser.add_argument("--delta", action="store_true", help="写入类动作只返回变更（response=delta）")
+    args = parser.parse_args()
+
+    client = server.app.test_client()
+
+    # 日志输出不计入耗时
+    real_stdout = sys.stdout
+    results = {}
+    try:
+        sys.stdout = open(os.devnull, "w")
+        for label, day, runner in (("single x N", "2020-01-01", _run_single), ("batch", "2020-01-02", _run_batch)):
+            items = _items(args.items, args.authors, day)
+            start = time.perf_counter()
+            size = runner(client, items, args.delta)
+            results[label] = (time.perf_counter() - start, size)
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    mode = "delta" if args.delta else "full"
+    print(f"{args.items} items, {args.authors} authors, response={mode}")
+    for label, (elapsed, size) in results.items():
+        print(f"{label:12s} {elapsed * 1000:9.1f} ms  {args.items / elapsed:9.0f} items/s  response {size / 1024:9.1f} KB")
+    single, batch = results["single x N"][0], results["batch"][0]
+    print(f"speedup      {single / batch:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench_memory.py
+# 内存基准：读路径上的碎片用普通 dict 表示 vs 用 storage.Fragment（__slots__ + 字符串驻留）表示
+#
+# 用法：python bench_memory.py [--count 1000000]（tracemalloc 开销较大，100 万条约需数分钟）
+# 两种表示都从同样的 JSON 行解析得到（与索引从 fragments.jsonl 读取记录的方式一致）
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import Fragment  # noqa: E402
+
+
+def _lines(count: int):
+    authors = [f"同事{i}" for i in range(20)]
+    first_day = date(2026, 1, 1)
+    for i in range(count):
+        yield json.dumps({
+            "id": f"{i:032x}",
+            "type": "fragment",
+            "content": f"完成了第 {i} 项工作",
+            "occurred_date": (first_day + timedelta(days=i % 365)).isoformat(),
+            "source": "user",
+            "author": authors[i % len(authors)],
+            "tags": ["工作"],
+            "created_at": f"2026-01-01T09:{i // 60 % 60:02d}:{i % 60:02d}",
+        }, ensure_ascii=False)
+
+
+def _measure(label: str, count: int, convert) -> int:
+    gc.collect()
+    tracemalloc.start()
+    rows = [convert(json.loads(line)) for line in _lines(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:10s} {current / 1024 / 1024:8.1f} MiB  {current / count:6.0f} B/record")
+    del rows
+    return current
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fragment vs dict 内存基准")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    as_dict = _measure("dict", args.count, lambda item: item)
+    as_fragment = _measure("Fragment", args.count, Fragment.from_dict)
+    print(f"saved      {(as_dict - as_fragment) / 1024 / 1024:8.1f} MiB  ({1 - as_fragment / as_dict:.0%})")
+
+
+if __name__ == "__main__":
+    main()
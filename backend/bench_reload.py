@@ -0,0 +1,76 @@
+# bench_reload.py
+# /api/input 延迟基准：模块只加载一次（默认） vs SERVER_HOT_RELOAD=1（按 mtime 检查） vs 旧的每个请求都重新加载
+#
+# 用法：python bench_reload.py [--requests 300]
+# 用 Flask test client 直接调用（不经过网络），只走确定性路由（不调用模型）；在临时 DATA_DIR 中运行
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_bench_")
+os.environ.setdefault("ZHIPU_API_KEY", "bench")
+
+import server  # noqa: E402
+
+# 拒绝路由不读写存储（只测模块加载开销）；查询路由读当天碎片
+TEXTS = ["日报", "今天做了啥"]
+
+
+def _measure(client, count: int):
+    latencies = {text: [] for text in TEXTS}
+    for i in range(count):
+        text = TEXTS[i % len(TEXTS)]
+        start = time.perf_counter()
+        resp = client.post("/api/input", json={"text": text, "author": "bench"})
+        latencies[text].append(time.perf_counter() - start)
+        assert resp.status_code == 200, resp.get_json()
+    return latencies
+
+
+def _report(label: str, latencies) -> None:
+    for text, values in latencies.items():
+        values = sorted(values)
+        p50 = statistics.median(values) * 1000
+        p95 = values[int(len(values) * 0.95) - 1] * 1000
+        print(f"{label:12s} {text:8s} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="模块加载方式对 /api/input 延迟的影响")
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    client = server.app.test_client()
+    client.post("/api/input", json={"text": "完成WMS用例执行", "author": "bench"})
+
+    # 日志输出不计入延迟
+    real_stdout = sys.stdout
+    results = {}
+    try:
+        sys.stdout = open(os.devnull, "w")
+        server.HOT_RELOAD = False
+        results["once"] = _measure(client, args.requests)
+
+        server.HOT_RELOAD = True
+        results["hot-reload"] = _measure(client, args.requests)
+
+        # 旧行为：每个请求都重新导入 main / tools / input_normalizer
+        get_main_module = server.get_main_module
+        server.get_main_module = server.reload_main_module
+        results["per-request"] = _measure(client, args.requests)
+        server.get_main_module = get_main_module
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    for label, latencies in results.items():
+        _report(label, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench_startup.py
+# 冷启动基准：索引全量解析 fragments.jsonl vs 加载二进制快照（只解析检查点之后的尾部）
+#
+# 用法：python bench_startup.py [--lines 1000000] [--tail 1000]
+# 在临时目录生成数据，不影响 DATA_DIR
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import storage  # noqa: E402
+
+
+def _write_lines(path: str, start: int, count: int, total: int) -> None:
+    """第 i 行落在 2026 年的第 i * 365 // total 天（与真实日志一样按日期大致递增）"""
+    authors = [f"user{i}" for i in range(20)]
+    rnd = random.Random(start)
+    first_day = date(2026, 1, 1)
+    with open(path, "a", encoding="utf-8") as f:
+        for i in range(start, start + count):
+            day = first_day + timedelta(days=min(i * 365 // total, 364))
+            item = {
+                "id": f"{i:032x}",
+                "type": "fragment",
+                "content": f"完成了第 {i} 项工作，记录一些上下文",
+                "occurred_date": day.isoformat(),
+                "source": "user",
+                "author": rnd.choice(authors),
+                "tags": ["工作"],
+                "created_at": "2026-01-01T09:00:00",
+            }
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="fragment 索引冷启动基准")
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=1000, help="快照之后再追加的行数")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="punch_bench_")
+    path = os.path.join(tmp, "fragments.jsonl")
+    try:
+        print(f"generating {args.lines} lines ...")
+        _write_lines(path, 0, args.lines, args.lines)
+        print(f"file size: {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+        probe = "2026-06-15"
+
+        # 1) 没有快照：全量 json.loads
+        storage.SNAPSHOT_LINES = 0
+        full, rows = _timed(lambda: len(storage._FragmentIndex(path).query(probe)))
+        print(f"full parse:                  {full * 1000:8.1f} ms  (first query returned {rows} rows)")
+
+        # 2) 全量解析后写快照（服务运行中每 FRAGMENTS_SNAPSHOT_LINES 行自动发生一次）
+        storage.SNAPSHOT_LINES = 10000
+        index = storage._FragmentIndex(path)
+        with_write, _ = _timed(lambda: index.query(probe))
+        print(f"full parse + write snapshot: {with_write * 1000:8.1f} ms  "
+              f"(snapshot {os.path.getsize(index.snapshot_path) / 1024 / 1024:.1f} MiB)")
+
+        # 3) 快照之后又追加了 tail 行，模拟进程重启
+        _write_lines(path, args.lines, args.tail, args.lines)
+        storage.SNAPSHOT_LINES = 10 ** 9
+        snap, rows = _timed(lambda: len(storage._FragmentIndex(path).query(probe)))
+        print(f"snapshot + {args.tail} tail lines:   {snap * 1000:8.1f} ms  (first query returned {rows} rows)")
+        print(f"speedup:                     {full / snap:8.1f}x")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
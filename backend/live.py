@@ -0,0 +1,170 @@
+# live.py
+# 碎片变更的实时推送：GET /api/fragments/stream 的扇出中心（Server-Sent Events）
+#
+# - 进程内一个 FragmentHub，注册为 storage 的变更监听器：每次写入 / 删除只通知一次，
+#   再按 (date, author) 分发到订阅者各自的队列，不为每个订阅者扫描存储
+# - 其它进程（多 worker 部署）的写入收不到通知：hub 每 LIVE_POLL_SECONDS 秒按订阅的 (date, author)
+#   比对一次 stats.db 的变更计数，计数增加量多于本进程推送的条数时给订阅者发 resync，客户端重新拉取列表
+# - 订阅者消费太慢（队列满）时同样改发 resync
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from storage import add_change_listener, json_default
+
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "2"))
+LIVE_HEARTBEAT_SECONDS = 15.0
+LIVE_QUEUE_SIZE = 1000
+
+# (date, author)；author 为 "" 表示订阅当天所有人
+Key = Tuple[str, str]
+
+
+class Subscriber:
+    def __init__(self, date: str, author: Optional[str]) -> None:
+        self.key: Key = (date, author or "")
+        self.queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.overflow = False
+
+    def put(self, event: str, data: Any) -> None:
+        if self.overflow:
+            return
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            self.overflow = True
+
+
+class FragmentHub:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: Dict[Key, Set[Subscriber]] = {}
+        # 每个订阅 key：上次比对时的变更计数、之后本进程推送的记录条数
+        self._versions: Dict[Key, str] = {}
+        self._published: Dict[Key, int] = {}
+        self._poller: Optional[threading.Thread] = None
+        add_change_listener(self.on_fragments_changed)
+
+    def subscribe(self, date: str, author: Optional[str] = None) -> Subscriber:
+        sub = Subscriber(date, author)
+        with self._lock:
+            if sub.key not in self._subscribers:
+                self._subscribers[sub.key] = set()
+                self._versions[sub.key] = self._changes(sub.key)
+                self._published[sub.key] = 0
+            self._subscribers[sub.key].add(sub)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="live-poller", daemon=True)
+                self._poller.start()
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.key)
+            if subs is None:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.key]
+                self._versions.pop(sub.key, None)
+                self._published.pop(sub.key, None)
+
+    def on_fragments_changed(self, kind: str, items: List[Any]) -> None:
+        """storage 变更通知的回调：按 (date, author) 和 (date, "") 分组后放进订阅者队列"""
+        if not self._subscribers:
+            return
+        groups: Dict[Key, List[Any]] = {}
+        for item in items:
+            if not item.get("id") or item.get("type") == "tombstone":
+                continue
+            date = item.get("occurred_date") or ""
+            for key in ((date, item.get("author") or ""), (date, "")):
+                groups.setdefault(key, []).append(item)
+        with self._lock:
+            targets = [(key, list(self._subscribers[key]), batch) for key, batch in groups.items() if key in self._subscribers]
+            for key, _, batch in targets:
+                self._published[key] += len(batch)
+        for _, subs, batch in targets:
+            data = {"items": batch} if kind == "append" else {"ids": [i.get("id") for i in batch]}
+            for sub in subs:
+                sub.put(kind, data)
+
+    @staticmethod
+    def _changes(key: Key) -> str:
+        from stats import get_daily_stats
+        return get_daily_stats().changes(key[0], key[1] or None)
+
+    def _poll_loop(self) -> None:
+        while True:
+            time.sleep(LIVE_POLL_SECONDS)
+            try:
+                self._poll_once()
+            except Exception as e:
+                print(f"[DEBUG] live: poll failed: {type(e).__name__}: {e}")
+
+    def _poll_once(self) -> None:
+        with self._lock:
+            keys = list(self._subscribers)
+        for key in keys:
+            version = self._changes(key)
+            with self._lock:
+                if key not in self._subscribers:
+                    continue
+                previous, published = self._versions[key], self._published[key]
+                self._versions[key], self._published[key] = version, 0
+                subs = list(self._subscribers[key])
+            if _missed(previous, version, published):
+                for sub in subs:
+                    sub.put("resync", {"version": version})
+
+
+def _missed(previous: str, version: str, published: int) -> bool:
+    """变更计数的增加量多于本进程推送的条数（或 stats.db 重建过）时，说明有本进程没看到的写入"""
+    prev_epoch, _, prev_n = previous.rpartition(":")
+    epoch, _, n = version.rpartition(":")
+    return epoch != prev_epoch or int(n) - int(prev_n) > published
+
+
+def stream(hub: FragmentHub, date: str, author: Optional[str] = None) -> Iterator[str]:
+    """
+    SSE 输出：event: append / delete / resync，data 为 JSON；空闲时每 LIVE_HEARTBEAT_SECONDS 秒发一行注释保活
+
+    开始迭代时才订阅，连接断开（生成器关闭）时退订
+    """
+    sub = hub.subscribe(date, author)
+    try:
+        yield f"event: ready\ndata: {json.dumps({'version': hub._changes(sub.key)})}\n\n"
+        while True:
+            if sub.overflow:
+                with sub.queue.mutex:
+                    sub.queue.queue.clear()
+                sub.overflow = False
+                yield f"event: resync\ndata: {json.dumps({'reason': 'overflow'})}\n\n"
+                continue
+            try:
+                event, data = sub.queue.get(timeout=LIVE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=json_default)}\n\n"
+    finally:
+        hub.unsubscribe(sub)
+
+
+_HUB: Optional[FragmentHub] = None
+_HUB_LOCK = threading.Lock()
+
+
+def get_hub() -> FragmentHub:
+    global _HUB
+    if _HUB is None:
+        with _HUB_LOCK:
+            if _HUB is None:
+                _HUB = FragmentHub()
+    return _HUB
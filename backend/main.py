@@ -4,22 +4,36 @@
 # 目标：先跑起来，行为可控、可回放、可测试
 # 约束：只允许 tools.py 中定义的 5 个工具；其余输入必须兜底，不触发工具
 
+import asyncio
+import functools
+import multiprocessing
 import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime, date
 
 import json
 import os
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 from input_normalizer import normalize_input
 
-from zhipuai import ZhipuAI
+if TYPE_CHECKING:
+    from zhipuai import ZhipuAI
 
-from tools import function_schemas, dispatch_tool_call, FRAGMENTS_PATH, _append_jsonl, _now_iso, _rewrite_jsonl_filtered, generate_fragment_id
+from tools import function_schemas, dispatch_tool_call, _now_iso, generate_fragment_id, PUNCH_CONTENT
+from storage import get_fragment_store, get_summary_store, json_default
 
 
 MODEL_NAME = os.getenv("ZHIPU_MODEL", "glm-4.5")
 API_KEY = os.getenv("ZHIPU_API_KEY", "")
 
+# 只使用确定性路由（run_once_with_structured_response）：不导入 zhipuai、不需要 ZHIPU_API_KEY，可离线运行 / 压测
+DETERMINISTIC_ONLY = os.getenv("DETERMINISTIC_ONLY", "0") == "1"
+
+# 批量生成日报时，需要生成的作者数达到该值才使用进程池（作者少时进程启动开销比生成本身大）
+SUMMARY_POOL_MIN_AUTHORS = int(os.getenv("SUMMARY_POOL_MIN_AUTHORS", "200"))
+
 
 def get_today_str() -> str:
     """统一定义 today，避免散落 date.today()"""
@@ -74,6 +88,106 @@ def generate_summary(fragments: List[Dict[str, Any]]) -> str:
     return "\n".join(summary_lines)
 
 
+def _summary_item(query_date: str, author: str, content: str, version: str) -> Dict[str, Any]:
+    """日报记录（type="summary"），source_version 为生成时该作者当天碎片的版本号"""
+    return {
+        "id": generate_fragment_id(),
+        "type": "summary",
+        "content": content,
+        "occurred_date": query_date,
+        "source": "user",
+        "author": author,
+        "tags": [],
+        "created_at": _now_iso(),
+        "source_version": version,
+    }
+
+
+def summarize_all_authors(query_date: str, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    一次生成某天所有作者的日报（日终批量任务）
+
+    只读一遍当天的碎片并按作者分组；碎片版本号没变的作者复用已有日报，
+    其余作者生成日报（作者数 >= SUMMARY_POOL_MIN_AUTHORS 时用进程池并行），最后一次写入日报存储。
+
+    Args:
+        query_date: YYYY-MM-DD
+        workers: 进程池大小（正整数），默认 os.cpu_count()，超过 CPU 核数时按核数；1 表示不使用进程池
+
+    Returns:
+        {"ok": true, "date": ..., "authors": n, "generated": n, "reused": n, "fragments": n, "workers": n,
+         "elapsed_seconds": x, "authors_per_second": n}
+        或 {"ok": false, "error": "..."}
+    """
+    from stats import get_daily_stats
+
+    try:
+        datetime.strptime(query_date or "", "%Y-%m-%d")
+    except ValueError:
+        return {"ok": False, "error": f"invalid date: {query_date!r}, expected YYYY-MM-DD"}
+    cpu_count = os.cpu_count() or 1
+    if workers is None:
+        workers = cpu_count
+    elif isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+        return {"ok": False, "error": f"invalid workers: {workers!r}, expected a positive integer"}
+    workers = min(workers, cpu_count)
+
+    start = time.perf_counter()
+    store = get_fragment_store()
+    summaries = get_summary_store()
+
+    # 1) 一次读取当天所有作者的碎片
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    legacy_authors = set()
+    fragment_count = 0
+    for item in store.query(query_date):
+        author = item.get("author") or ""
+        if item.get("type") == "summary":
+            legacy_authors.add(author)
+            continue
+        groups.setdefault(author, []).append(item)
+        fragment_count += 1
+
+    # 2) 版本号没变的作者直接复用
+    versions = get_daily_stats().versions(query_date, groups)
+    existing = {s.get("author") or "": s for s in summaries.query(query_date)}
+    todo = []
+    for author, version in versions.items():
+        current = existing.get(author)
+        if current is None or current.get("source_version") != version:
+            todo.append((author, version))
+
+    # 3) 生成：子进程只拿到需要的字段
+    work = [[{"type": f.get("type"), "content": f.get("content")} for f in groups[a]] for a, _ in todo]
+    if workers > 1 and len(todo) >= SUMMARY_POOL_MIN_AUTHORS:
+        # 用 spawn 启动子进程：在请求线程里 fork 会把其它线程持有的锁、打开的 SQLite 连接一起复制进子进程
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            texts = list(pool.map(generate_summary, work, chunksize=max(1, len(work) // (workers * 4))))
+    else:
+        workers = 1
+        texts = [generate_summary(w) for w in work]
+
+    # 4) 一次写入
+    summaries.put_many([_summary_item(query_date, a, text, v) for (a, v), text in zip(todo, texts)])
+    for author in legacy_authors & {a for a, _ in todo}:
+        store.delete_where(date=query_date, type="summary", author=author)
+
+    elapsed = time.perf_counter() - start
+    print(f"[DEBUG] summarize_all_authors: date={query_date}, authors={len(groups)}, "
+          f"generated={len(todo)}, workers={workers}, elapsed={elapsed:.3f}s")
+    return {
+        "ok": True,
+        "date": query_date,
+        "authors": len(groups),
+        "generated": len(todo),
+        "reused": len(groups) - len(todo),
+        "fragments": fragment_count,
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "authors_per_second": int(len(groups) / elapsed) if elapsed > 0 else None,
+    }
+
+
 SYSTEM_PROMPT = """
 你是一个“个人工作风险防御”助手，核心目标是：记录干净事实碎片、执行打卡确认/超时记录、查询碎片与打卡状态。
 
@@ -160,11 +274,32 @@ def _to_tool_message(tool_call_id: str, name: str, result: Any) -> Dict[str, Any
         "role": "tool",
         "tool_call_id": tool_call_id or "",
         "name": name,
-        "content": json.dumps(result, ensure_ascii=False),
+        "content": json.dumps(result, ensure_ascii=False, default=json_default),
     }
 
 
-def call_model(client: ZhipuAI, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> Any:
+_CLIENT: Optional["ZhipuAI"] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> "ZhipuAI":
+    """智谱客户端：第一次真正调用模型时才导入 SDK 并创建（进程内复用）"""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                if DETERMINISTIC_ONLY:
+                    raise RuntimeError("DETERMINISTIC_ONLY=1 时不能调用模型")
+                if not API_KEY:
+                    raise RuntimeError("缺少环境变量 ZHIPU_API_KEY")
+                from zhipuai import ZhipuAI
+                _CLIENT = ZhipuAI(api_key=API_KEY)
+    return _CLIENT
+
+
+def call_model(client: Optional["ZhipuAI"], messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> Any:
+    """client 为 None 时使用 get_client()"""
+    client = client or get_client()
     return client.chat.completions.create(
         model=MODEL_NAME,
         messages=messages,
@@ -173,7 +308,7 @@ def call_model(client: ZhipuAI, messages: List[Dict[str, Any]], tools: List[Dict
     )
 
 
-def run_once(client: ZhipuAI, user_text: str) -> str:
+def _build_messages(user_text: str) -> List[Dict[str, Any]]:
     # ✅ 0) 先做输入归一化（意图 + 相对日期）
     norm = normalize_input(user_text)
     print("NORMALIZED:", norm)  # 调试用：看解析结果
@@ -189,51 +324,39 @@ def run_once(client: ZhipuAI, user_text: str) -> str:
     if norm.get("intent") and norm["intent"] != "unknown":
         system_prompt_runtime += f"【已识别意图】{norm['intent']}\n"
 
-    messages: List[Dict[str, Any]] = [
+    return [
         {"role": "system", "content": system_prompt_runtime},
         {"role": "user", "content": norm.get("clean_text", user_text)},
     ]
 
-    # 2) 第一次模型：决定是否调用工具
-    resp1 = call_model(client, messages, function_schemas)
 
-    tool_calls = _extract_tool_calls(resp1)
-    if not tool_calls:
-        try:
-            return resp1.choices[0].message.content or ""
-        except Exception:
-            return ""
+def _message_text(resp: Any) -> str:
+    try:
+        return resp.choices[0].message.content or ""
+    except Exception:
+        return ""
 
-    last_tool_results = []
 
-    # 3) 执行工具
-    for tc in tool_calls:
-        tc_id = (tc.get("id") or "") if isinstance(tc, dict) else ""
-        fn = tc.get("function", {}) if isinstance(tc, dict) else {}
-        name = fn.get("name")
-        raw_args = fn.get("arguments") or "{}"
-
-        if isinstance(raw_args, str):
-            try:
-                args = json.loads(raw_args)
-            except Exception:
-                args = {}
-        elif isinstance(raw_args, dict):
-            args = raw_args
-        else:
-            args = {}
+def _parse_tool_call(tc: Any) -> Tuple[str, Optional[str], Dict[str, Any]]:
+    """Returns: (tool_call_id, 工具名, 参数 dict)"""
+    tc_id = (tc.get("id") or "") if isinstance(tc, dict) else ""
+    fn = tc.get("function", {}) if isinstance(tc, dict) else {}
+    name = fn.get("name")
+    raw_args = fn.get("arguments") or "{}"
 
-        tool_result = dispatch_tool_call(name=name, args=args)
-        last_tool_results.append((name, tool_result))
-        messages.append(_to_tool_message(tool_call_id=tc_id, name=name or "", result=tool_result))
+    if isinstance(raw_args, str):
+        try:
+            args = json.loads(raw_args)
+        except Exception:
+            args = {}
+    elif isinstance(raw_args, dict):
+        args = raw_args
+    else:
+        args = {}
+    return tc_id, name, args
 
-    # 4) 第二次模型：基于工具结果答复
-    resp2 = call_model(client, messages, function_schemas)
-    try:
-        text = resp2.choices[0].message.content or ""
-    except Exception:
-        text = ""
 
+def _final_reply(text: str, last_tool_results: List[Tuple[Optional[str], Dict[str, Any]]]) -> str:
     if text.strip():
         return text
 
@@ -250,22 +373,172 @@ def run_once(client: ZhipuAI, user_text: str) -> str:
     return "已完成操作（模型未返回文本）。"
 
 
+def run_once(client: Optional["ZhipuAI"], user_text: str) -> str:
+    messages = _build_messages(user_text)
+
+    # 2) 第一次模型：决定是否调用工具
+    resp1 = call_model(client, messages, function_schemas)
+
+    tool_calls = _extract_tool_calls(resp1)
+    if not tool_calls:
+        return _message_text(resp1)
+
+    last_tool_results = []
+
+    # 3) 执行工具
+    for tc in tool_calls:
+        tc_id, name, args = _parse_tool_call(tc)
+        tool_result = dispatch_tool_call(name=name, args=args)
+        last_tool_results.append((name, tool_result))
+        messages.append(_to_tool_message(tool_call_id=tc_id, name=name or "", result=tool_result))
+
+    # 4) 第二次模型：基于工具结果答复
+    resp2 = call_model(client, messages, function_schemas)
+    return _final_reply(_message_text(resp2), last_tool_results)
+
+
+async def run_once_async(client: Optional["ZhipuAI"], user_text: str, executor: Optional[Executor] = None) -> str:
+    """
+    run_once 的 asyncio 版本（model_worker.py 使用）
+
+    SDK 是同步的：模型调用在 executor 线程池里执行，事件循环只 await；同一轮的多个工具调用并发执行。
+    """
+    loop = asyncio.get_running_loop()
+    messages = _build_messages(user_text)
+
+    resp1 = await loop.run_in_executor(executor, call_model, client, messages, function_schemas)
+
+    tool_calls = _extract_tool_calls(resp1)
+    if not tool_calls:
+        return _message_text(resp1)
+
+    parsed = [_parse_tool_call(tc) for tc in tool_calls]
+    results = await asyncio.gather(*(
+        loop.run_in_executor(executor, functools.partial(dispatch_tool_call, name=name, args=args))
+        for _, name, args in parsed
+    ))
+    last_tool_results = []
+    for (tc_id, name, _), tool_result in zip(parsed, results):
+        last_tool_results.append((name, tool_result))
+        messages.append(_to_tool_message(tool_call_id=tc_id, name=name or "", result=tool_result))
+
+    resp2 = await loop.run_in_executor(executor, call_model, client, messages, function_schemas)
+    return _final_reply(_message_text(resp2), last_tool_results)
+
+
+# 确定性路由的关键词
+QUERY_KEYWORDS = ["今天做了啥", "今天干了啥", "今天做了什么", "做了啥", "干了啥", "做了什么"]
+FACT_VERBS = ["完成", "执行", "编写", "测试", "修复", "实现", "开发", "部署", "设计"]
+QUESTION_MARKERS = ["？", "?", "啥", "什么", "吗", "呢"]
+CONFIRM_CONTENT = PUNCH_CONTENT
+
+
+def classify_input(text: str) -> str:
+    """
+    确定性意图路由（不依赖模型），规则见 run_once_with_structured_response
+
+    Args:
+        text: 归一化后的输入（normalize_input 的 clean_text）
+
+    Returns:
+        "summary" | "reject" | "confirm" | "query" | "record"
+    """
+    print(f"[DEBUG] summary check: text='{text}'")
+
+    if "总结今日" in text:
+        return "summary"
+    if any(keyword in text for keyword in ["日报", "周报"]):
+        return "reject"
+    if "打卡" in text:
+        return "confirm"
+    if any(keyword in text for keyword in QUERY_KEYWORDS):
+        return "query"
+
+    # 事实门槛：必须包含明确动词、非空内容（长度 > 3）且不是纯疑问
+    has_fact_verb = any(verb in text for verb in FACT_VERBS)
+    has_content = len(text.strip()) > 3
+    is_question = any(marker in text for marker in QUESTION_MARKERS)
+    can_record = has_fact_verb and has_content and not is_question
+
+    print(f"[DEBUG] record check: has_fact_verb={has_fact_verb}, has_content={has_content}, is_question={is_question}, can_record={can_record}")
+
+    if not can_record:
+        # 不满足事实门槛，当作 query（兜底）
+        print(f"[DEBUG] fallback to query: text='{text}', reason='does not meet fact threshold'")
+        return "query"
+    return "record"
+
+
+def summarize_day(query_date: str, author: str) -> Dict[str, Any]:
+    """
+    生成（或复用）某作者某天的日报，按 (date, author) 覆盖写入日报存储
+
+    Returns:
+        {"changed": [本次写入的日报], "deleted_ids": [被覆盖的旧日报 id], "legacy_deleted": 碎片日志里删掉的旧日报条数}
+        碎片版本号没变时复用已有日报，changed 为空
+    """
+    from stats import get_daily_stats
+    from tools import get_fragments_by_date
+
+    summaries = get_summary_store()
+
+    # 1) 该作者当天碎片的版本号没变（没有新增 / 删除）时，直接复用已生成的日报
+    version = get_daily_stats().version(author, query_date)
+    existing = summaries.get(query_date, author)
+
+    changed: List[Any] = []
+    deleted_ids: List[str] = []
+    deleted = 0
+    if existing is not None and existing.get("source_version") == version:
+        print(f"[DEBUG] summary: unchanged since {existing.get('created_at')} (version={version}), reused")
+    else:
+        # 2) 读取当天的碎片（只取非 summary 类型的）
+        fragments_result = get_fragments_by_date(date=query_date, author=author)
+        work_fragments = [f for f in fragments_result.get("items", []) if f.get("type") != "summary"]
+
+        print(f"[DEBUG] summary: found {len(work_fragments)} work fragments")
+
+        # 3) 生成总结（已过滤打卡类碎片，取前 8 条）
+        summary_text = generate_summary(work_fragments)
+
+        print(f"[DEBUG] summary: generated summary\n{summary_text}")
+
+        # 4) 按 (date, author) 覆盖写入日报存储（不改动碎片文件）
+        summary_item = _summary_item(query_date, author, summary_text, version)
+        previous = summaries.put(summary_item)
+        changed.append(summary_item)
+        if previous is not None:
+            deleted_ids.append(previous.get("id"))
+
+        # 旧版本写在碎片日志里的日报：只删该作者当天的
+        deleted = get_fragment_store().delete_where(date=query_date, type="summary", author=author)
+        print(f"[DEBUG] summary: written (version={version}, removed {deleted} legacy summaries)")
+
+    return {"changed": changed, "deleted_ids": deleted_ids, "legacy_deleted": deleted}
+
+
 def run_once_with_structured_response(
-    client: ZhipuAI,
+    client: Optional["ZhipuAI"],
     user_text: str,
     author: str,
-    target_date: Optional[str] = None  # 新增参数
+    target_date: Optional[str] = None,  # 新增参数
+    delta: bool = False
 ) -> Dict[str, Any]:
     """
     返回结构化响应，供 API 调用
 
-    确定性路由规则（优先级从高到低）：
-    1. reject: 包含"日报/周报/总结"
+    delta=True 时写入类动作（record / confirm / summary）不返回 today_fragments，
+    改为返回 "delta": {"changed": [...], "deleted_ids": [...], "version": "..."}（见 tools.build_delta），
+    响应大小和耗时与当天已有多少条记录无关；query / reject 不受影响
+
+    确定性路由规则（优先级从高到低，见 classify_input）：
+    0. summary: 包含"总结今日"
+    1. reject: 包含"日报/周报"
     2. confirm: 包含"打卡"
     3. query: 包含查询模式 或 不满足 record 事实门槛
     4. record: 满足事实门槛（明确动词 + 非空内容）
     """
-    from tools import get_fragments_by_date, record_fragment
+    from tools import build_delta, get_fragments_by_date, record_fragment
 
     # 1) 归一化输入
     norm = normalize_input(user_text)
@@ -278,55 +551,24 @@ def run_once_with_structured_response(
     print(f"[DEBUG] Using date: {query_date} (target_date={target_date}, today={today_str})")
 
     # 2) 确定性意图路由（不依赖模型）
-    action = None
-
-    # summary 路由（最高优先级）- 包含判断
-    print(f"[DEBUG] summary check: text='{text}', original='{user_text}'")
+    action = classify_input(text)
 
-    if "总结今日" in text:
+    # summary 路由（最高优先级）
+    if action == "summary":
         print(f"[DEBUG] summary route triggered for author={author}")
 
-        # 1) 删除今日所有旧的 summary（幂等性）
-        def filter_old_summaries(item: Dict[str, Any]) -> bool:
-            # 保留非今日 summary，或者今日非 summary 类型的记录
-            is_today_summary = (
-                item.get("occurred_date") == query_date and
-                item.get("type") == "summary"
-            )
-            return not is_today_summary
-
-        _rewrite_jsonl_filtered(FRAGMENTS_PATH, filter_old_summaries)
-        print(f"[DEBUG] summary: deleted old summaries for {query_date}")
+        written = summarize_day(query_date, author)
 
-        # 2) 读取今天的碎片（只取 type=fragment 的）
-        fragments_result = get_fragments_by_date(date=query_date, author=author)
-        all_fragments = fragments_result.get("items", [])
-
-        # 只取非 summary 类型的碎片
-        work_fragments = [f for f in all_fragments if f.get("type") != "summary"]
-
-        print(f"[DEBUG] summary: found {len(work_fragments)} work fragments")
-
-        # 3) 生成总结（已过滤打卡类碎片，取前 8 条）
-        summary_text = generate_summary(work_fragments)
-
-        print(f"[DEBUG] summary: generated summary\n{summary_text}")
-
-        # 4) 手动写入新的 summary fragment（type="summary"）
-        summary_item = {
-            "id": generate_fragment_id(),
-            "type": "summary",
-            "content": summary_text,
-            "occurred_date": query_date,
-            "source": "user",
-            "author": author,
-            "tags": [],
-            "created_at": _now_iso(),
-        }
-        _append_jsonl(FRAGMENTS_PATH, summary_item)
-        print(f"[DEBUG] summary: written to {FRAGMENTS_PATH}")
+        # 5) 返回更新后的碎片列表（碎片日志里的旧日报 id 未知，这种情况下仍返回整个列表）
+        if delta and not written["legacy_deleted"]:
+            return {
+                "ok": True,
+                "action": "summary",
+                "tool_called": "generate_summary",
+                "delta": build_delta(query_date, author, written["changed"], written["deleted_ids"]),
+                "input_text": user_text
+            }
 
-        # 5) 返回更新后的碎片列表
         updated_fragments = get_fragments_by_date(date=query_date, author=author)
 
         print(f"[DEBUG] summary: returning {len(updated_fragments.get('items', []))} fragments")
@@ -340,7 +582,7 @@ def run_once_with_structured_response(
         }
 
     # reject 路由
-    elif any(keyword in text for keyword in ["日报", "周报"]):
+    elif action == "reject":
         return {
             "ok": True,
             "action": "reject",
@@ -350,10 +592,10 @@ def run_once_with_structured_response(
         }
 
     # confirm 路由（打卡）
-    elif "打卡" in text:
+    elif action == "confirm":
         # ✅ 直接写入 fragment 记录（不用 confirm_clock_event）
-        record_fragment(
-            content="今天正常出勤，已完成打卡",
+        saved = record_fragment(
+            content=CONFIRM_CONTENT,
             source="user",
             author=author,
             occurred_date=query_date
@@ -361,6 +603,14 @@ def run_once_with_structured_response(
 
         # ✅ 查询并返回今日碎片
         query_author = None if author == "all" else author
+        if delta:
+            return {
+                "ok": True,
+                "action": "confirm",
+                "tool_called": "record_fragment",
+                "delta": build_delta(query_date, query_author, [saved["saved"]]),
+                "input_text": user_text
+            }
         fragments_result = get_fragments_by_date(
             date=query_date,
             author=query_author
@@ -374,8 +624,45 @@ def run_once_with_structured_response(
             "input_text": user_text
         }
 
-    # query 路由（优先级 3）
-    elif any(keyword in text for keyword in ["今天做了啥", "今天干了啥", "今天做了什么", "做了啥", "干了啥", "做了什么"]):
+    # record 路由（优先级 4，已满足事实门槛）
+    elif action == "record":
+        print(f"[DEBUG] record: query_date={query_date}, author={author}")
+
+        # 1) 写入碎片
+        saved = record_fragment(
+            content=text,
+            source="user",
+            author=author,
+            occurred_date=query_date
+        )
+
+        if delta:
+            return {
+                "ok": True,
+                "action": "record",
+                "tool_called": "record_fragment",
+                "delta": build_delta(query_date, author, [saved["saved"]]),
+                "input_text": user_text
+            }
+
+        # 2) 立刻查询该作者的今日碎片
+        fragments_result = get_fragments_by_date(
+            date=query_date,
+            author=author
+        )
+
+        print(f"[DEBUG] record: returned {fragments_result.get('count', 0)} items")
+
+        return {
+            "ok": True,
+            "action": "record",
+            "tool_called": "record_fragment",
+            "today_fragments": fragments_result.get("items", []),
+            "input_text": user_text
+        }
+
+    # query 路由（优先级 3，含不满足事实门槛的兜底）
+    else:
         # author="all" 时传 None，表示不过滤
         query_author = None if author == "all" else author
 
@@ -396,72 +683,121 @@ def run_once_with_structured_response(
             "input_text": user_text
         }
 
-    # record 路由（优先级 4，必须满足事实门槛）
-    else:
-        # 事实门槛：必须包含明确动词
-        fact_verbs = ["完成", "执行", "编写", "测试", "修复", "实现", "开发", "部署", "设计"]
-        has_fact_verb = any(verb in text for verb in fact_verbs)
 
-        # 事实门槛：非空内容（长度 > 3）且不是纯疑问
-        has_content = len(text.strip()) > 3
-        is_question = any(marker in text for marker in ["？", "?", "啥", "什么", "吗", "呢"])
+# 批量输入的动作 -> 调用的工具（与单条接口的 tool_called 一致）
+_TOOL_CALLED = {
+    "summary": "generate_summary",
+    "reject": None,
+    "confirm": "record_fragment",
+    "record": "record_fragment",
+    "query": "get_fragments_by_date",
+}
 
-        # 判定是否可以 record
-        can_record = has_fact_verb and has_content and not is_question
 
-        print(f"[DEBUG] record check: has_fact_verb={has_fact_verb}, has_content={has_content}, is_question={is_question}, can_record={can_record}")
+def run_batch_structured_response(entries: List[Any], delta: bool = False) -> Dict[str, Any]:
+    """
+    批量输入：每条按 run_once_with_structured_response 相同的规则路由，但
 
-        if can_record:
-            # 满足事实门槛，执行 record
-            print(f"[DEBUG] record: query_date={query_date}, author={author}")
+    - 所有 record / confirm 写入收集后一次 append_many（一次加锁 / 一个事务、一次变更通知）
+    - summary 在写入之后执行，同一 (date, author) 只生成一次
+    - 返回的列表按不同的 (date, 查看的作者) 各读一次存储，多条结果共用（放在 lists 里，结果中用下标引用）；
+      列表反映整批写入之后的状态，而不是逐条调用时每一条之后的状态
 
-            # 1) 写入碎片
-            record_fragment(
-                content=text,
-                source="user",
-                author=author,
-                occurred_date=query_date
-            )
+    Args:
+        entries: [{"text": "...", "author": "...", "date": "YYYY-MM-DD (可选)"}]
+        delta: 写入类动作在结果中附带 delta（见 tools.build_delta），不再为它们读列表
+
+    Returns:
+        {"ok": true, "count": n,
+         "results": [{"ok": true, "action": ..., "tool_called": ..., "input_text": ..., "date": ...,
+                      "list": lists 下标或 null, "delta": {...}（delta 模式的写入类动作）}
+                     或 {"ok": false, "error": "...", "input_text": ...}（缺少 author、date 不合法）],
+         "lists": [{"date": ..., "author": ... 或 null（所有人）, "items": [...]}]}
+    """
+    from tools import build_delta, build_fragment_item, get_fragments_by_date, is_valid_date
 
-            # 2) 立刻查询该作者的今日碎片
-            fragments_result = get_fragments_by_date(
-                date=query_date,
-                author=author
-            )
+    today_str = get_today_str()
+    results: List[Dict[str, Any]] = []
+    planned: List[Tuple[int, str, str, str, Optional[Dict[str, Any]]]] = []
+    pending: List[Dict[str, Any]] = []
+
+    # 1) 逐条归一化、路由；写入类动作只生成记录，不落盘
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("author"):
+            results.append({"ok": False, "error": "missing author field",
+                            "input_text": entry.get("text") if isinstance(entry, dict) else None})
+            continue
 
-            print(f"[DEBUG] record: returned {fragments_result.get('count', 0)} items")
+        user_text = entry.get("text") or ""
+        author = entry["author"]
+        query_date = entry.get("date") or today_str
+        if not is_valid_date(query_date):
+            results.append({"ok": False, "error": f"invalid date: {query_date!r}, expected YYYY-MM-DD",
+                            "input_text": user_text})
+            continue
+        text = normalize_input(user_text).get("clean_text", user_text)
+        action = classify_input(text)
 
-            return {
-                "ok": True,
-                "action": "record",
-                "tool_called": "record_fragment",
-                "today_fragments": fragments_result.get("items", []),
-                "input_text": user_text
-            }
-        else:
-            # 不满足事实门槛，当作 query（兜底）
-            print(f"[DEBUG] fallback to query: text='{text}', reason='does not meet fact threshold'")
+        item = None
+        if action in ("record", "confirm"):
+            content = text if action == "record" else CONFIRM_CONTENT
+            item = build_fragment_item(content, "user", author, query_date)
+            pending.append(item)
 
-            query_author = None if author == "all" else author
-            fragments_result = get_fragments_by_date(
-                date=query_date,
-                author=query_author
-            )
+        planned.append((len(results), action, author, query_date, item))
+        results.append({
+            "ok": True,
+            "action": action,
+            "tool_called": _TOOL_CALLED[action],
+            "input_text": user_text,
+            "date": query_date,
+            "list": None,
+        })
+
+    # 2) 一次写入
+    if pending:
+        get_fragment_store().append_many(pending)
+
+    # 3) 日报：在碎片写入之后生成，同一 (date, author) 只生成一次
+    summarized: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for index, action, author, query_date, _ in planned:
+        if action == "summary" and (query_date, author) not in summarized:
+            summarized[(query_date, author)] = summarize_day(query_date, author)
+
+    # 4) 每条结果要返回的列表：按 (date, 查看的作者) 去重，各读一次
+    lists: List[Dict[str, Any]] = []
+    list_index: Dict[Tuple[str, Optional[str]], int] = {}
+    for index, action, author, query_date, item in planned:
+        if action == "reject":
+            continue
+        # 与单条接口一致：record / summary 看本人，confirm / query 的 author="all" 表示所有人
+        view_author = author if action in ("record", "summary") else (None if author == "all" else author)
+
+        if delta and action != "query":
+            if action == "summary":
+                written = summarized[(query_date, author)]
+                if not written["legacy_deleted"]:
+                    results[index]["delta"] = build_delta(query_date, view_author, written["changed"], written["deleted_ids"])
+                    continue
+            else:
+                results[index]["delta"] = build_delta(query_date, view_author, [item])
+                continue
 
-            return {
-                "ok": True,
-                "action": "query",
-                "tool_called": "get_fragments_by_date",
-                "today_fragments": fragments_result.get("items", []),
-                "input_text": user_text
-            }
+        key = (query_date, view_author)
+        if key not in list_index:
+            list_index[key] = len(lists)
+            lists.append({"date": query_date, "author": view_author,
+                          "items": get_fragments_by_date(date=query_date, author=view_author).get("items", [])})
+        results[index]["list"] = list_index[key]
 
+    print(f"[DEBUG] batch input: {len(results)} items, wrote {len(pending)} fragments, "
+          f"{len(summarized)} summaries, read {len(lists)} lists")
 
-def main():
-    if not API_KEY:
-        raise RuntimeError("缺少环境变量 ZHIPU_API_KEY")
+    return {"ok": True, "count": len(results), "results": results, "lists": lists}
 
-    client = ZhipuAI(api_key=API_KEY)
+
+def main():
+    client = get_client()
 
     print("v1.0 已启动（输入 exit 退出）")
     while True:
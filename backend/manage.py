@@ -0,0 +1,143 @@
+# manage.py
+# 存储维护命令行
+#
+# 用法：
+#   python manage.py migrate-sqlite   # 把 JSONL 碎片与打卡记录导入 punch.db
+#   python manage.py compact          # 立即压缩 fragments.jsonl（清除已删除记录）与打卡事件日志
+#   python manage.py partition        # 把 fragments.jsonl 拆分为 fragments/YYYY/MM/DD.jsonl
+#   python manage.py rebuild-id-index # 从数据文件重建 fragment_ids.idx
+#   python manage.py import FILE      # 从 NDJSON 文件批量导入碎片（FILE 为 - 时读标准输入）
+#   python manage.py rebuild-search-index # 从存储全量重建全文搜索索引 search.db
+#   python manage.py rebuild-tag-index    # 从存储全量重建标签索引 tags.db
+#   python manage.py rebuild-stats [--verify] # 从原始记录重新计算按天统计 stats.db（--verify 只比对）
+#
+# DATA_DIR / STORAGE_BACKEND 等环境变量与 server.py 一致
+
+import argparse
+import json
+import sys
+
+import storage
+
+
+def cmd_migrate_sqlite(args: argparse.Namespace) -> dict:
+    return storage.migrate_jsonl_to_sqlite()
+
+
+def cmd_compact(args: argparse.Namespace) -> dict:
+    return {
+        "ok": True,
+        "fragments": storage.get_fragment_store().compact(),
+        "summaries": storage.get_summary_store().compact(),
+        "clock": storage.get_clock_store().compact(),
+    }
+
+
+def cmd_partition(args: argparse.Namespace) -> dict:
+    return storage.convert_to_partitions()
+
+
+def cmd_rebuild_id_index(args: argparse.Namespace) -> dict:
+    return storage.rebuild_id_index()
+
+
+def cmd_import(args: argparse.Namespace) -> dict:
+    import time
+    from tools import import_fragments, iter_ndjson_lines
+
+    start = time.perf_counter()
+    if args.file == "-":
+        result = import_fragments(iter_ndjson_lines(sys.stdin.buffer), author=args.author, batch_size=args.batch_size)
+    else:
+        with open(args.file, "rb") as f:
+            result = import_fragments(iter_ndjson_lines(f), author=args.author, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    result["elapsed_seconds"] = round(elapsed, 3)
+    result["records_per_second"] = int(result["accepted"] / elapsed) if elapsed > 0 else None
+    return result
+
+
+def cmd_rebuild_search_index(args: argparse.Namespace) -> dict:
+    import time
+    import search
+
+    start = time.perf_counter()
+    result = search.SearchIndex(search.SEARCH_DB_PATH).rebuild(storage.iter_all_records())
+    result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def cmd_rebuild_tag_index(args: argparse.Namespace) -> dict:
+    import tag_index
+
+    return tag_index.TagIndex(tag_index.TAG_DB_PATH).rebuild(storage.iter_all_records())
+
+
+def cmd_rebuild_stats(args: argparse.Namespace) -> dict:
+    import stats
+
+    daily = stats.DailyStats(stats.STATS_DB_PATH)
+    if not args.verify:
+        return daily.rebuild(storage.iter_all_records())
+
+    expected = stats.count_items(storage.iter_all_records())
+    actual = daily.all_counts()
+    mismatches = [
+        {"author": key[0], "date": key[1], "type": key[2], "expected": expected.get(key, 0), "actual": actual.get(key, 0)}
+        for key in sorted(set(expected) | set(actual))
+        if expected.get(key, 0) != actual.get(key, 0)
+    ]
+    return {"ok": not mismatches, "buckets": len(expected), "mismatches": mismatches[:100]}
+
+
+def cmd_summarize_all(args: argparse.Namespace) -> dict:
+    import main as app_main
+
+    return app_main.summarize_all_authors(args.date or app_main.get_today_str(), workers=args.workers)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Punch Agent 存储维护")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate-sqlite", help="一次性把 JSONL 数据导入 SQLite")
+    p.set_defaults(func=cmd_migrate_sqlite)
+
+    p = sub.add_parser("compact", help="压缩 fragments.jsonl（分片布局下压缩所有分片）与 clock_events.jsonl")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("partition", help="把单文件 fragments.jsonl 转换为按日期分片的布局")
+    p.set_defaults(func=cmd_partition)
+
+    p = sub.add_parser("rebuild-id-index", help="从数据文件重建 id -> 文件偏移索引")
+    p.set_defaults(func=cmd_rebuild_id_index)
+
+    p = sub.add_parser("import", help="从 NDJSON 批量导入碎片（每行一个 record_fragment 参数对象）")
+    p.add_argument("file", help="NDJSON 文件路径，- 表示标准输入")
+    p.add_argument("--author", default=None, help="行内没有 author 时使用的默认作者")
+    p.add_argument("--batch-size", type=int, default=5000, help="每批写入条数")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("rebuild-search-index", help="从存储全量重建全文搜索索引")
+    p.set_defaults(func=cmd_rebuild_search_index)
+
+    p = sub.add_parser("rebuild-tag-index", help="从存储全量重建标签索引")
+    p.set_defaults(func=cmd_rebuild_tag_index)
+
+    p = sub.add_parser("rebuild-stats", help="从原始记录重新计算按作者、按天的统计")
+    p.add_argument("--verify", action="store_true", help="只与现有统计比对，不写入")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = sub.add_parser("summarize-all", help="一次生成某天所有作者的日报")
+    p.add_argument("--date", help="YYYY-MM-DD，默认今天")
+    p.add_argument("--workers", type=int, help="进程池大小，默认 CPU 核数；1 表示不用进程池")
+    p.set_defaults(func=cmd_summarize_all)
+
+    args = parser.parse_args(argv)
+    result = args.func(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
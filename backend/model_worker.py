@@ -0,0 +1,185 @@
+# model_worker.py
+# 需要调用模型的输入（main.run_once）走这里异步执行，确定性路由（/api/input）仍在请求线程里同步处理
+#
+# - 每个进程一个后台线程跑 asyncio 事件循环，run_once_async 在其中 await 模型 / 工具调用；
+#   zhipuai SDK 是同步的，每次模型调用放进专用线程池（MODEL_MAX_INFLIGHT，默认 256）执行，事件循环不阻塞。
+#   注意这不是真正的异步 I/O：并发的模型请求各占一个线程（没有引入异步 HTTP 客户端），
+#   事件循环只负责编排同一轮里的多个调用，并发上限就是线程池大小
+# - HTTP 请求只提交任务、立即返回 job_id，不占着 worker 等模型；结果写入 DATA_DIR/jobs.db，
+#   多 worker 部署时任一 worker 都能查询
+# - 已完成（done / error）的任务保留 MODEL_JOB_TTL_SECONDS（默认 1 天）后删除：启动时以及之后每次提交时顺带清理（最多每分钟一次）
+# - 任务记录提交它的进程 pid；启动时把所属进程已经不在的 pending 任务标记为 error（进程退出时正在执行的任务不会再继续）
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from storage import DATA_DIR, _SqliteDatabase, _now_iso
+
+JOBS_DB_PATH = os.path.join(DATA_DIR, "jobs.db")
+
+# 单进程同时进行的模型调用上限（线程池大小），超出的任务排队
+MODEL_MAX_INFLIGHT = max(1, int(os.getenv("MODEL_MAX_INFLIGHT", "256")))
+
+# 已完成任务的保留时间（秒）
+MODEL_JOB_TTL_SECONDS = int(os.getenv("MODEL_JOB_TTL_SECONDS", "86400"))
+
+# 提交时顺带清理过期任务的最小间隔（秒）
+_PRUNE_INTERVAL_SECONDS = 60
+
+_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input TEXT NOT NULL,
+    reply TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    finished_at TEXT,
+    worker_pid INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, finished_at);
+"""
+
+Runner = Callable[..., Awaitable[str]]
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ModelWorker:
+    """
+    submit() 在 jobs.db 写入 pending 任务，把协程交给后台事件循环；完成后写入 done / error
+    """
+
+    def __init__(self, path: str, max_inflight: int = MODEL_MAX_INFLIGHT, ttl_seconds: int = MODEL_JOB_TTL_SECONDS) -> None:
+        self.db = _SqliteDatabase(path, _JOBS_SCHEMA)
+        self.ttl_seconds = ttl_seconds
+        self._pruned_at = 0.0
+        self._migrate()
+        self.fail_orphaned()
+        self.prune()
+        self.executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="model")
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="model-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_text: str, runner: Runner) -> str:
+        """
+        Args:
+            user_text: 用户输入
+            runner: main.run_once_async（由调用方传入，热重载后用的是新模块）
+
+        Returns:
+            job_id
+        """
+        if time.monotonic() - self._pruned_at >= _PRUNE_INTERVAL_SECONDS:
+            self.prune()
+        job_id = uuid.uuid4().hex
+        conn = self.db.conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, input, created_at, worker_pid) VALUES (?, 'pending', ?, ?, ?)",
+                (job_id, user_text, _now_iso(), os.getpid()),
+            )
+        asyncio.run_coroutine_threadsafe(self._run(job_id, user_text, runner), self.loop)
+        return job_id
+
+    async def _run(self, job_id: str, user_text: str, runner: Runner) -> None:
+        try:
+            reply = await runner(None, user_text, executor=self.executor)
+            status, error = "done", None
+        except Exception as e:
+            print(f"[DEBUG] model worker: job {job_id} failed: {type(e).__name__}: {e}")
+            reply, status, error = None, "error", f"{type(e).__name__}: {e}"
+        # 写库是本地 SQLite 的短事务，放到线程池里避免阻塞事件循环上的其它任务
+        await self.loop.run_in_executor(self.executor, self._finish, job_id, status, reply, error)
+
+    def _finish(self, job_id: str, status: str, reply: Optional[str], error: Optional[str]) -> None:
+        conn = self.db.conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, reply = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, reply, error, _now_iso(), job_id),
+            )
+
+    def _migrate(self) -> None:
+        """旧版本的 jobs.db 没有 worker_pid 列"""
+        conn = self.db.conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "worker_pid" not in columns:
+            try:
+                with conn:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN worker_pid INTEGER")
+            except sqlite3.OperationalError:
+                pass  # 另一个 worker 进程同时完成了迁移
+
+    def fail_orphaned(self) -> int:
+        """所属进程已经退出的 pending 任务不会再完成：标记为 error，查询方不必一直轮询"""
+        conn = self.db.conn()
+        rows = conn.execute("SELECT id, worker_pid FROM jobs WHERE status = 'pending'").fetchall()
+        orphaned = [(job_id,) for job_id, pid in rows if pid != os.getpid() and not _pid_alive(pid)]
+        if orphaned:
+            with conn:
+                conn.executemany(
+                    "UPDATE jobs SET status = 'error', error = 'interrupted: worker process exited', finished_at = ? "
+                    "WHERE id = ? AND status = 'pending'",
+                    [(_now_iso(), job_id) for (job_id,) in orphaned],
+                )
+            print(f"[DEBUG] model worker: marked {len(orphaned)} orphaned pending jobs as error")
+        return len(orphaned)
+
+    def prune(self) -> int:
+        """删除完成时间早于 ttl_seconds 的任务（pending 任务不删）"""
+        self._pruned_at = time.monotonic()
+        cutoff = (datetime.now() - timedelta(seconds=self.ttl_seconds)).strftime("%Y-%m-%dT%H:%M:%S")
+        conn = self.db.conn()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM jobs WHERE status != 'pending' AND finished_at < ?", (cutoff,)
+            ).rowcount
+        if removed:
+            print(f"[DEBUG] model worker: pruned {removed} finished jobs")
+        return removed
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.conn().execute(
+            "SELECT id, status, input, reply, error, created_at, finished_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "status", "input", "reply", "error", "created_at", "finished_at")
+        return dict(zip(keys, row))
+
+
+_WORKER: Optional[ModelWorker] = None
+_WORKER_PID: Optional[int] = None
+_WORKER_LOCK = threading.Lock()
+
+
+def get_model_worker() -> ModelWorker:
+    """进程内单例；fork 之后（pre-fork 服务器）子进程重新创建自己的事件循环线程"""
+    global _WORKER, _WORKER_PID
+    if _WORKER is None or _WORKER_PID != os.getpid():
+        with _WORKER_LOCK:
+            if _WORKER is None or _WORKER_PID != os.getpid():
+                _WORKER = ModelWorker(JOBS_DB_PATH)
+                _WORKER_PID = os.getpid()
+    return _WORKER
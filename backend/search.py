@@ -0,0 +1,250 @@
+# search.py
+# 碎片全文搜索：content 的字符二元组（bigram）倒排索引
+#
+# - 索引存放在 DATA_DIR/search.db（SQLite FTS5）：倒排表由 FTS5 压缩存储，结果按 bm25 排序
+# - 分词：中日韩文字的连续片段切成重叠的二元组（"用例执行" -> 用例 / 例执 / 执行），
+#   字母数字按词（小写，"WMS" -> wms）；单个汉字另存一列，供单字查询
+# - 只索引事实碎片（日报不进索引）；通过 storage 的变更通知增量维护（记录碎片 / 删除），与存储后端无关
+# - search.db 不存在（或是旧版本建的）时，第一次使用前从存储全量构建一次；
+#   python manage.py rebuild-search-index 也可手动重建
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from storage import DATA_DIR, _SqliteDatabase
+
+SEARCH_DB_PATH = os.path.join(DATA_DIR, "search.db")
+
+# 索引内容的版本（PRAGMA user_version）：低于该值的 search.db 在第一次使用时重建
+# 1：不再索引日报
+SEARCH_INDEX_VERSION = 1
+
+_SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    docid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    author TEXT,
+    occurred_date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_docs_author_date ON docs(author, occurred_date);
+CREATE VIRTUAL TABLE IF NOT EXISTS fragment_fts USING fts5(grams, chars, author, tokenize = 'unicode61');
+"""
+
+# 中日韩统一表意文字（含扩展 A / 兼容区）、假名、韩文音节
+_CJK_CLASS = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_RUN_RE = re.compile(f"[{_CJK_CLASS}]+|[0-9a-z]+")
+_CJK_RE = re.compile(f"[{_CJK_CLASS}]")
+
+# grams / chars / author 三列的 bm25 权重：二元组 / 词命中比单字命中更重要，作者列只用于过滤
+_BM25_WEIGHTS = (1.0, 0.2, 0.0)
+
+# 参与相关度排序的最新命中条数（FRAGMENTS_SEARCH_RANK_WINDOW）
+RANK_WINDOW = max(1, int(os.getenv("FRAGMENTS_SEARCH_RANK_WINDOW", "2000")))
+
+
+# =========================
+# 1) 分词
+# =========================
+
+def tokenize(text: str) -> Tuple[List[List[str]], Set[str]]:
+    """
+    Returns:
+        (片段列表, 单字集合)；每个片段是连续的 token 序列（CJK 片段为二元组序列，字母数字为单个词），
+        长度为 1 的 CJK 片段不产生二元组，只进入单字集合
+    """
+    runs: List[List[str]] = []
+    chars: Set[str] = set()
+    for m in _RUN_RE.finditer(unicodedata.normalize("NFKC", text or "").lower()):
+        run = m.group()
+        if _CJK_RE.match(run):
+            chars.update(run)
+            if len(run) > 1:
+                runs.append([run[i:i + 2] for i in range(len(run) - 1)])
+        else:
+            runs.append([run])
+    return runs, chars
+
+
+def _document(content: str) -> Tuple[str, str]:
+    runs, chars = tokenize(content)
+    return " ".join(t for run in runs for t in run), " ".join(sorted(chars))
+
+
+def _author_token(author: str) -> str:
+    """作者名可能含空格 / 标点，以 crc32 作为 author 列里的单个 token（碰撞由 docs.author 精确过滤兜底）"""
+    return "a%08x" % zlib.crc32(author.encode("utf-8"))
+
+
+def build_match(q: str) -> Optional[str]:
+    """
+    把用户查询转换成 FTS5 MATCH 表达式：空格分隔的每个词都必须出现（AND）
+
+    词内的二元组 / 词按短语匹配（相邻出现，相当于子串匹配）；词里的单个汉字用单字列匹配。
+    """
+    clauses = []
+    for term in (q or "").split():
+        runs, chars = tokenize(term)
+        tokens = [t for run in runs for t in run]
+        if tokens:
+            clauses.append('grams : "' + " ".join(tokens) + '"')
+        covered = {c for run in runs for t in run for c in t}
+        clauses.extend(f'chars : "{c}"' for c in sorted(chars - covered))
+    return " AND ".join(clauses) if clauses else None
+
+
+# =========================
+# 2) 索引
+# =========================
+
+class SearchIndex:
+    """
+    docs 表保存 fragment id -> docid（以及过滤用的 author / occurred_date），fragment_fts 以 docid 为 rowid
+
+    写入按 id 幂等：重复通知（迁移、分片转换）不会重复建索引。
+    日报（type="summary"）不在碎片存储里，也不是事实碎片，不建索引。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.db = _SqliteDatabase(path, _SEARCH_SCHEMA)
+
+    def add(self, items: Iterable[Any]) -> int:
+        pending: Dict[str, Any] = {}
+        for item in items:
+            fragment_id = item.get("id")
+            if fragment_id and item.get("content") and item.get("type") not in ("tombstone", "summary"):
+                pending.setdefault(fragment_id, item)
+        if not pending:
+            return 0
+        conn = self.db.conn()
+        with conn:
+            # 先拿写锁再分配 docid，多进程同时写入时不会冲突
+            conn.execute("BEGIN IMMEDIATE")
+            ids = list(pending)
+            for k in range(0, len(ids), 500):
+                chunk = ids[k:k + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for (fragment_id,) in conn.execute(f"SELECT id FROM docs WHERE id IN ({placeholders})", chunk):
+                    del pending[fragment_id]
+            base = conn.execute("SELECT IFNULL(MAX(docid), 0) FROM docs").fetchone()[0]
+            doc_rows = []
+            fts_rows = []
+            for docid, (fragment_id, item) in enumerate(pending.items(), start=base + 1):
+                author = item.get("author")
+                grams, chars = _document(item.get("content"))
+                doc_rows.append((docid, fragment_id, author, item.get("occurred_date")))
+                fts_rows.append((docid, grams, chars, _author_token(author) if author else ""))
+            conn.executemany("INSERT INTO docs (docid, id, author, occurred_date) VALUES (?, ?, ?, ?)", doc_rows)
+            conn.executemany("INSERT INTO fragment_fts (rowid, grams, chars, author) VALUES (?, ?, ?, ?)", fts_rows)
+        return len(pending)
+
+    def remove(self, fragment_ids: Iterable[str]) -> int:
+        conn = self.db.conn()
+        removed = 0
+        with conn:
+            for fragment_id in fragment_ids:
+                row = conn.execute("SELECT docid FROM docs WHERE id = ?", (fragment_id,)).fetchone()
+                if row is None:
+                    continue
+                conn.execute("DELETE FROM fragment_fts WHERE rowid = ?", row)
+                conn.execute("DELETE FROM docs WHERE docid = ?", row)
+                removed += 1
+        return removed
+
+    def search(self, q: str, author: Optional[str] = None, start: Optional[str] = None,
+               end: Optional[str] = None, limit: int = 20) -> List[Tuple[str, float]]:
+        """
+        只对最新的 RANK_WINDOW 条命中计算 bm25（常见词可能命中几十万条，全部打分要几百毫秒）；
+        docid 按写入顺序递增，先沿倒排表倒序数出窗口边界，再只对边界之后的命中排序。
+        作者过滤在倒排表里完成（author 列），日期过滤按 docid 回表
+
+        Returns:
+            [(fragment id, bm25 分数), ...]，分数越小越相关；同分时日期新的在前
+        """
+        match = build_match(q)
+        if match is None:
+            return []
+        if author:
+            match = f'({match}) AND author : "{_author_token(author)}"'
+        # CROSS JOIN 固定连接顺序：由倒排表驱动，docs 只按主键回表（否则规划器可能先扫 docs，逐行重跑 MATCH）
+        source = "fragment_fts CROSS JOIN docs d ON d.docid = fragment_fts.rowid WHERE fragment_fts MATCH ?"
+        params: List[Any] = [match]
+        if author:
+            source += " AND d.author = ?"
+            params.append(author)
+        if start:
+            source += " AND d.occurred_date >= ?"
+            params.append(start)
+        if end:
+            source += " AND d.occurred_date <= ?"
+            params.append(end)
+
+        conn = self.db.conn()
+        boundary = conn.execute(
+            f"SELECT fragment_fts.rowid FROM {source} ORDER BY fragment_fts.rowid DESC LIMIT 1 OFFSET ?",
+            [*params, RANK_WINDOW - 1],
+        ).fetchone()
+        if boundary is not None:
+            source += " AND fragment_fts.rowid >= ?"
+            params.append(boundary[0])
+        rows = conn.execute(
+            f"SELECT d.id, bm25(fragment_fts, ?, ?, ?) AS score FROM {source} "
+            "ORDER BY score, d.occurred_date DESC LIMIT ?",
+            [*_BM25_WEIGHTS, *params, limit],
+        )
+        return [(r[0], r[1]) for r in rows]
+
+    def rebuild(self, items: Iterable[Any], batch_size: int = 5000) -> Dict[str, Any]:
+        """清空后从 items 重建，最后合并 FTS5 段（postings 更紧凑）"""
+        conn = self.db.conn()
+        with conn:
+            conn.execute("DELETE FROM fragment_fts")
+            conn.execute("DELETE FROM docs")
+        total = 0
+        batch: List[Any] = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                total += self.add(batch)
+                batch = []
+        total += self.add(batch)
+        with conn:
+            conn.execute("INSERT INTO fragment_fts (fragment_fts) VALUES ('optimize')")
+            conn.execute(f"PRAGMA user_version = {SEARCH_INDEX_VERSION}")
+        print(f"[DEBUG] search index: rebuilt with {total} documents")
+        return {"ok": True, "indexed": total}
+
+    def is_current(self) -> bool:
+        return self.db.conn().execute("PRAGMA user_version").fetchone()[0] >= SEARCH_INDEX_VERSION
+
+
+_INDEX: Optional[SearchIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                # 与 stats / 标签索引一样，search.db 不存在时先从存储构建，升级前的历史记录也能搜到
+                index = SearchIndex(SEARCH_DB_PATH)
+                if not index.is_current():
+                    from storage import iter_all_records
+                    index.rebuild(iter_all_records())
+                _INDEX = index
+    return _INDEX
+
+
+def on_fragments_changed(kind: str, items: List[Any]) -> None:
+    """storage 变更通知的回调"""
+    index = get_search_index()
+    if kind == "append":
+        index.add(items)
+    elif kind == "delete":
+        index.remove(i.get("id") for i in items if i.get("id"))
@@ -1,36 +1,80 @@
 # server.py
 # Flask API 入口：提供 POST /api/input 接口
 
+import hashlib
+import json
 import os
 import sys
 import importlib
-from flask import Flask, request, jsonify
-from zhipuai import ZhipuAI
+import threading
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+# 业务模块默认只在启动时加载一次；开发时设置 SERVER_HOT_RELOAD=1，
+# 源文件的 mtime 变化后在下一个请求前重新加载（没有改动时只多几次 stat）
+HOT_RELOAD = os.getenv("SERVER_HOT_RELOAD", "0") == "1"
+_RELOAD_MODULES = ['main', 'tools', 'input_normalizer']
+_RELOAD_DIR = os.path.dirname(os.path.abspath(__file__))
+_RELOAD_LOCK = threading.Lock()
+
+
+def _source_mtimes():
+    mtimes = {}
+    for mod in _RELOAD_MODULES:
+        try:
+            mtimes[mod] = os.stat(os.path.join(_RELOAD_DIR, mod + ".py")).st_mtime_ns
+        except OSError:
+            mtimes[mod] = None
+    return mtimes
+
 
-# 强制重新加载 main 模块（避免缓存）
 def reload_main_module():
-    """每次请求前重新加载 main 模块"""
-    modules_to_clear = ['main', 'tools', 'input_normalizer']
-    for mod in modules_to_clear:
+    """丢弃已加载的业务模块并重新导入 main"""
+    for mod in _RELOAD_MODULES:
         if mod in sys.modules:
             del sys.modules[mod]
     return importlib.import_module('main')
 
+
+def get_main_module():
+    """返回 main 模块；HOT_RELOAD 开启且源文件有改动时先重新加载"""
+    global main_module, _loaded_mtimes
+    if not HOT_RELOAD:
+        return main_module
+    mtimes = _source_mtimes()
+    if mtimes != _loaded_mtimes:
+        with _RELOAD_LOCK:
+            if mtimes != _loaded_mtimes:
+                changed = [mod for mod in _RELOAD_MODULES if mtimes[mod] != _loaded_mtimes.get(mod)]
+                print(f"[SERVER] Source changed ({', '.join(changed)}), reloading modules...")
+                main_module = reload_main_module()
+                _loaded_mtimes = mtimes
+    return main_module
+
+
 # 首次导入
+_loaded_mtimes = _source_mtimes()
 main_module = reload_main_module()
-run_once_with_structured_response = main_module.run_once_with_structured_response
 
-app = Flask(__name__)
 
-# 环境变量
-MODEL_NAME = os.getenv("ZHIPU_MODEL", "glm-4.5")
-API_KEY = os.getenv("ZHIPU_API_KEY", "")
+class _JSONProvider(DefaultJSONProvider):
+    """存储层返回的 Fragment 在这里（响应边界）才转换成 dict"""
 
-if not API_KEY:
-    raise RuntimeError("缺少环境变量 ZHIPU_API_KEY")
+    @staticmethod
+    def default(o):
+        from storage import Fragment
+        if isinstance(o, Fragment):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
-# 初始化智谱客户端
-client = ZhipuAI(api_key=API_KEY)
+
+app = Flask(__name__)
+app.json = _JSONProvider(app)
+
+# 环境变量：启动时只检查配置，智谱客户端在第一次调用模型时才创建（main.get_client）；
+# DETERMINISTIC_ONLY=1 时完全不需要 ZHIPU_API_KEY / zhipuai
+if not main_module.DETERMINISTIC_ONLY and not main_module.API_KEY:
+    raise RuntimeError("缺少环境变量 ZHIPU_API_KEY（只用确定性路由时可设置 DETERMINISTIC_ONLY=1）")
 
 
 @app.route('/api/input', methods=['POST'])
@@ -42,7 +86,8 @@ def api_input():
     {
         "text": "用户输入文本",
         "author": "作者名称",
-        "date": "YYYY-MM-DD (可选，默认今天)"
+        "date": "YYYY-MM-DD (可选，默认今天；格式不对或不是有效日期时 400)",
+        "response": "delta (可选：写入类动作只返回变更，见 main.run_once_with_structured_response)"
     }
 
     响应体：
@@ -56,11 +101,8 @@ def api_input():
     """
     data = None  # Initialize before try block
     try:
-        # ✅ 每次请求前重新加载 main 模块
-        print("[SERVER] Reloading main module...")
-        main_module = reload_main_module()
-        run_once_with_structured_response = main_module.run_once_with_structured_response
-        print("[SERVER] Module reloaded, function:", run_once_with_structured_response)
+        from tools import is_valid_date
+        run_once_with_structured_response = get_main_module().run_once_with_structured_response
 
         data = request.get_json()
 
@@ -74,15 +116,21 @@ def api_input():
         author = data['author']
         text = data.get('text', '')
         target_date = data.get('date')  # 新增：可选的目标日期
+        if target_date and not is_valid_date(target_date):
+            return jsonify({
+                "ok": False,
+                "error": f"invalid date: {target_date!r}, expected YYYY-MM-DD"
+            }), 400
 
         print(f"[SERVER] Processing request: text='{text}', author='{author}', date='{target_date}'")
 
         # 2) 调用结构化响应函数（传递 target_date）
         result = run_once_with_structured_response(
-            client=client,
+            client=None,
             user_text=text,
             author=author,
-            target_date=target_date  # 新增参数
+            target_date=target_date,  # 新增参数
+            delta=data.get('response') == 'delta'
         )
 
         print(f"[SERVER] Result: action={result.get('action')}, tool_called={result.get('tool_called')}")
@@ -105,10 +153,475 @@ def api_input():
         }), 500
 
 
+# 一次批量输入的最大条数
+INPUT_BATCH_MAX_ITEMS = int(os.getenv("INPUT_BATCH_MAX_ITEMS", "1000"))
+
+
+@app.route('/api/input/batch', methods=['POST'])
+def api_input_batch():
+    """
+    批量输入：每条走与 /api/input 相同的确定性路由，写入合并为一次，
+    列表按不同的 (date, author) 各读一次（见 main.run_batch_structured_response）
+
+    请求体：
+    {
+        "items": [{"text": "...", "author": "...", "date": "YYYY-MM-DD (可选)"}, ...],
+        "response": "delta (可选)"
+    }
+
+    Returns:
+        {"ok": true, "count": n, "results": [...], "lists": [{"date", "author", "items"}]}
+        缺少 author 或 date 不合法的条目在 results 中为 {"ok": false, "error": "..."}，不影响其它条目；
+        items 不是数组或超过 INPUT_BATCH_MAX_ITEMS 条时 400
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        if not isinstance(items, list):
+            return jsonify({"ok": False, "error": "items must be an array"}), 400
+        if len(items) > INPUT_BATCH_MAX_ITEMS:
+            return jsonify({"ok": False, "error": f"too many items: {len(items)} > {INPUT_BATCH_MAX_ITEMS}"}), 400
+
+        print(f"[SERVER] Processing batch input: {len(items)} items")
+
+        result = get_main_module().run_batch_structured_response(items, delta=data.get('response') == 'delta')
+        return jsonify(result)
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in api_input_batch: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """健康检查"""
-    return jsonify({"status": "ok", "version": "v2-fixed"})
+    return jsonify({"status": "ok", "version": "v2-fixed", "deterministic_only": main_module.DETERMINISTIC_ONLY})
+
+
+@app.route('/api/fragments', methods=['GET'])
+def list_fragments():
+    """
+    按日期范围分页查询碎片；只给 ?date= 时返回当天列表（前端刷新用，支持条件请求）
+
+    Args:
+        ?date=YYYY-MM-DD: 当天列表（碎片 + 日报），可带 ?author=（"all" 或空表示所有人）、?limit=、?order=asc|desc、?tag=；
+            响应带 ETag，请求带 If-None-Match 且列表没有变化时返回 304（不读取记录）
+        ?start=YYYY-MM-DD&end=YYYY-MM-DD: 必填，含两端
+        ?author=xxx: 可选，按作者过滤
+        ?cursor=...: 可选，上一页返回的 next_cursor
+        ?limit=n: 可选，每页条数（默认 200，最大 1000）
+        ?tag=xxx: 可选，可重复；只返回带有全部这些标签的碎片
+
+    Returns:
+        {"ok": true, "items": [...], "count": n, "next_cursor": "..." | null}
+        或 {"ok": false, "error": "..."}（400）
+    """
+    try:
+        if request.args.get('date') and not (request.args.get('start') or request.args.get('end')):
+            return _list_fragments_of_day()
+
+        from tools import get_fragments_by_range, RANGE_DEFAULT_LIMIT
+        try:
+            limit = int(request.args.get('limit', RANGE_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+        result = get_fragments_by_range(
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            author=request.args.get('author'),
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            tags=request.args.getlist('tag'),
+        )
+        status_code = 200 if result.get("ok") else 400
+        return jsonify(result), status_code
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in list_fragments: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+def _list_fragments_of_day():
+    from tools import _DATE_RE, get_fragments_by_date, get_fragments_version
+
+    query_date = request.args.get('date')
+    author = request.args.get('author')
+    if author == 'all':
+        author = None
+    tags = request.args.getlist('tag')
+    order = request.args.get('order', 'asc')
+    if not _DATE_RE.match(query_date) or order not in ('asc', 'desc'):
+        return jsonify({"ok": False, "error": "date must be YYYY-MM-DD and order asc or desc"}), 400
+    try:
+        limit = int(request.args.get('limit', 200))
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+
+    # 先取版本再读数据：两者之间有写入时 ETag 偏旧，下次请求会拿到新内容，不会把新内容标成旧版本
+    version = get_fragments_version(query_date, author)
+    key = f"{version}|{query_date}|{author or ''}|{limit}|{order}|{json.dumps(sorted(tags), ensure_ascii=False)}"
+    etag = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(get_fragments_by_date(date=query_date, limit=limit, order=order, author=author, tags=tags))
+    response.set_etag(etag)
+    # 允许浏览器缓存，但每次使用前都要验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/search', methods=['GET'])
+def search_fragments():
+    """
+    全文搜索碎片内容
+
+    Args:
+        ?q=xxx: 必填，搜索词（空格分隔的多个词需同时出现）
+        ?author=xxx: 可选，按作者过滤
+        ?start=YYYY-MM-DD&end=YYYY-MM-DD: 可选，日期范围（含两端）
+        ?limit=n: 可选，返回条数（默认 20，最大 100）
+
+    Returns:
+        {"ok": true, "q": "...", "count": n, "items": [...]}（按相关度排序）
+        或 {"ok": false, "error": "..."}（400）
+    """
+    try:
+        from tools import search_fragments as _search_fragments, SEARCH_DEFAULT_LIMIT
+        try:
+            limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+        result = _search_fragments(
+            q=request.args.get('q', ''),
+            author=request.args.get('author'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            limit=limit,
+        )
+        status_code = 200 if result.get("ok") else 400
+        return jsonify(result), status_code
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in search_fragments: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/tags', methods=['GET'])
+def tag_facets():
+    """
+    每个作者的标签使用次数
+
+    Args:
+        ?author=xxx: 可选，只返回该作者
+        ?start=YYYY-MM-DD&end=YYYY-MM-DD: 可选，日期范围（含两端）
+        ?limit=n: 可选，每个作者最多返回的标签数（默认 50）
+
+    Returns:
+        {"ok": true, "facets": {"作者": [{"tag": "...", "count": n}, ...]}}
+        或 {"ok": false, "error": "..."}（400）
+    """
+    try:
+        from tools import get_tag_facets, TAG_FACETS_DEFAULT_LIMIT
+        try:
+            limit = int(request.args.get('limit', TAG_FACETS_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+        result = get_tag_facets(
+            author=request.args.get('author'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            limit=limit,
+        )
+        status_code = 200 if result.get("ok") else 400
+        return jsonify(result), status_code
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in tag_facets: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """
+    按作者、按天的记录统计与打卡覆盖情况
+
+    Args:
+        ?start=YYYY-MM-DD&end=YYYY-MM-DD: 必填，含两端（最多 366 天）
+        ?author=xxx: 可选，只返回该作者
+
+    Returns:
+        {"ok": true, "authors": {"作者": {"totals": {...}, "active_days": n, "last_active_date": "...", "days": {...},
+                                   "punched_days": n, "punched_dates": [...]}},
+         "clock": {"days": n, "start_work": {"confirmed": n, ...}, ...}}
+        或 {"ok": false, "error": "..."}（400）
+    """
+    try:
+        from tools import get_stats
+        result = get_stats(
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            author=request.args.get('author'),
+        )
+        status_code = 200 if result.get("ok") else 400
+        return jsonify(result), status_code
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in stats: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/chat', methods=['POST'])
+def chat_submit():
+    """
+    需要模型参与的自由对话（main.run_once）：提交后立即返回，结果用 GET /api/chat/<job_id> 查询
+
+    请求体：{"text": "用户输入"}
+
+    Returns:
+        {"ok": true, "job_id": "...", "status": "pending"}（202）
+        或 {"ok": false, "error": "..."}（400 / 503）
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        text = (data.get('text') or '').strip()
+        if not text:
+            return jsonify({"ok": False, "error": "missing text field"}), 400
+
+        app_main = get_main_module()
+        if app_main.DETERMINISTIC_ONLY:
+            return jsonify({"ok": False, "error": "model calls are disabled (DETERMINISTIC_ONLY=1)"}), 503
+
+        from model_worker import get_model_worker
+        job_id = get_model_worker().submit(text, app_main.run_once_async)
+        return jsonify({"ok": True, "job_id": job_id, "status": "pending"}), 202
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in chat_submit: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/chat/<job_id>', methods=['GET'])
+def chat_result(job_id):
+    """
+    查询对话任务
+
+    Returns:
+        {"ok": true, "job_id": "...", "status": "pending" | "done" | "error", "reply": "...", "error": "...", ...}
+        或 {"ok": false, "error": "job not found: ..."}（404）
+    """
+    try:
+        from model_worker import get_model_worker
+        job = get_model_worker().get(job_id)
+        if job is None:
+            return jsonify({"ok": False, "error": f"job not found: {job_id}"}), 404
+        return jsonify({"ok": True, **job}), 200
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in chat_result: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/summaries/batch', methods=['POST'])
+def summaries_batch():
+    """
+    日终批量生成所有作者的日报
+
+    请求体（可选）：{"date": "YYYY-MM-DD（默认今天）", "workers": 进程池大小（正整数，最多 CPU 核数）}
+
+    Returns:
+        {"ok": true, "date": ..., "authors": n, "generated": n, "reused": n, "elapsed_seconds": x, ...}
+        或 {"ok": false, "error": "..."}（400）
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        app_main = get_main_module()
+        query_date = data.get('date') or app_main.get_today_str()
+        result = app_main.summarize_all_authors(query_date, workers=data.get('workers'))
+        status_code = 200 if result.get("ok") else 400
+        return jsonify(result), status_code
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in summaries_batch: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/fragments/import', methods=['POST'])
+def import_fragments():
+    """
+    批量导入事实碎片（NDJSON 流式读取，不把整个请求体读进内存）
+
+    请求体每行一个 record_fragment 参数对象：
+        {"content": "...", "source": "user", "author": "...", "occurred_date": "YYYY-MM-DD", "tags": [...]}
+    ?author=xxx: 可选，行内没有 author 时使用
+
+    Returns:
+        {"ok": true, "accepted": n, "rejected": m, "errors": [{"line": 行号, "error": "..."}]}
+    """
+    try:
+        from tools import import_fragments as _import_fragments, iter_ndjson_lines
+        result = _import_fragments(iter_ndjson_lines(request.stream), author=request.args.get('author'))
+        return jsonify(result), 200
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in import_fragments: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/fragments/export', methods=['GET'])
+def export_fragments():
+    """
+    按日期范围流式导出碎片
+
+    Args:
+        ?start=YYYY-MM-DD&end=YYYY-MM-DD: 必填，含两端
+        ?author=xxx: 可选，按作者过滤
+        ?format=ndjson|csv: 默认 ndjson
+
+    请求头带 Accept-Encoding: gzip 时以 gzip 压缩输出（Content-Encoding: gzip）
+
+    Returns:
+        ndjson / csv 文件流；参数错误时 {"ok": false, "error": "..."}（400）
+    """
+    try:
+        from tools import check_export_args, export_fragments as _export_fragments, gzip_chunks
+        start = request.args.get('start')
+        end = request.args.get('end')
+        author = request.args.get('author')
+        fmt = request.args.get('format', 'ndjson')
+        error = check_export_args(start, end, fmt)
+        if error:
+            return jsonify({"ok": False, "error": error}), 400
+
+        chunks = _export_fragments(start, end, author=author, fmt=fmt)
+        headers = {
+            "Content-Disposition": f'attachment; filename="fragments_{start}_{end}.{fmt}"',
+            "Vary": "Accept-Encoding",
+        }
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            chunks = gzip_chunks(chunks)
+            headers["Content-Encoding"] = "gzip"
+        mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in export_fragments: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/fragments/stream', methods=['GET'])
+def stream_fragments():
+    """
+    当天碎片变更的实时推送（Server-Sent Events）
+
+    Args:
+        ?date=YYYY-MM-DD: 必填
+        ?author=xxx: 可选，"all" 或空表示所有人
+
+    事件：
+        ready   {"version": "..."}：连接建立，之后的变更都会推送（先用 GET /api/fragments?date= 取初始列表）
+        append  {"items": [...]}：新增 / 覆盖的记录（碎片、日报）
+        delete  {"ids": [...]}：删除的记录 id
+        resync  {...}：可能漏掉了变更（其它进程写入 / 消费太慢），客户端应重新拉取列表
+    """
+    try:
+        from tools import _DATE_RE
+        from live import get_hub, stream
+
+        query_date = request.args.get('date') or ''
+        if not _DATE_RE.match(query_date):
+            return jsonify({"ok": False, "error": "date must be YYYY-MM-DD"}), 400
+        author = request.args.get('author')
+        if author == 'all':
+            author = None
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        events = stream(get_hub(), query_date, author)
+        return Response(stream_with_context(events), mimetype="text/event-stream", headers=headers)
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in stream_fragments: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/fragments/<fragment_id>', methods=['GET'])
+def get_fragment(fragment_id: str):
+    """
+    按 id 查询单条 fragment
+
+    Returns:
+        {"ok": true, "item": {...}}
+        或 {"ok": false, "error": "..."}（404）
+    """
+    try:
+        from tools import get_fragment_by_id
+        result = get_fragment_by_id(fragment_id)
+        status_code = 200 if result.get("ok") else 404
+        return jsonify(result), status_code
+    except Exception as e:
+        import traceback
+        print(f"[SERVER] ERROR in get_fragment: {str(e)}")
+        print(f"[SERVER] TRACEBACK:\n{traceback.format_exc()}")
+        return jsonify({
+            "ok": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
 
 
 @app.route('/api/fragments/<fragment_id>', methods=['DELETE'])
@@ -118,14 +631,21 @@ def delete_fragment(fragment_id: str):
 
     Args:
         fragment_id: fragment 的 id
+        ?date=YYYY-MM-DD: 可选，碎片所在日期（分片布局下用于直接定位分片）
+        ?response=delta: 可选，只返回被删 id 与版本号，不返回 today_fragments
 
     Returns:
         {"ok": true, "deleted_id": "...", "today_fragments": [...]}
+        或 {"ok": true, "deleted_id": "...", "delta": {...}}（response=delta）
         或 {"ok": false, "error": "..."}
     """
     try:
         from tools import delete_fragment_by_id
-        result = delete_fragment_by_id(fragment_id)
+        result = delete_fragment_by_id(
+            fragment_id,
+            occurred_date=request.args.get('date'),
+            delta=request.args.get('response') == 'delta',
+        )
         status_code = 200 if result.get("ok") else 404
         return jsonify(result), status_code
     except Exception as e:
@@ -0,0 +1,312 @@
+# stats.py
+# 按作者、按天的物化统计：每天各类型记录（fragment / summary ...）条数
+#
+# - 计数存放在 DATA_DIR/stats.db（SQLite），通过 storage 的变更通知在写入 / 删除后同步更新
+#   （记录碎片、删除、日报、批量导入都会触发），与存储后端无关
+# - 查询只读取范围内有数据的 (author, date) 行，不扫描原始记录
+# - stats.db 不存在时从存储全量构建一次；python manage.py rebuild-stats 重新计算，--verify 只比对不写入
+# - 另外维护每个 (author, date) 的碎片版本号：该作者当天的碎片（不含日报）每次新增 / 删除 +1，
+#   日报据此判断内容是否需要重新生成（见 main.py 的日报路由）；
+#   以及包含日报在内的变更计数，作为 GET /api/fragments?date= 的 ETag
+# - 打卡覆盖：打卡路由写入的是一条内容固定的碎片（tools.PUNCH_CONTENT），punches 表按 id 记录这些碎片，
+#   统计接口据此给出每个作者范围内打卡的日期；stats.db 的 user_version 低于 STATS_VERSION 时自动重建一次
+
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import DATA_DIR, _SqliteDatabase
+from tools import is_punch
+
+STATS_DB_PATH = os.path.join(DATA_DIR, "stats.db")
+
+# stats.db 的结构 / 内容版本；新增 punches 表时升到 1
+STATS_VERSION = 1
+
+_STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counted (
+    id TEXT PRIMARY KEY,
+    author TEXT NOT NULL,
+    occurred_date TEXT NOT NULL,
+    type TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_counts (
+    author TEXT NOT NULL,
+    occurred_date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (author, occurred_date, type)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_daily_counts_date ON daily_counts(occurred_date, author, type, n);
+CREATE TABLE IF NOT EXISTS day_versions (
+    author TEXT NOT NULL,
+    occurred_date TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (author, occurred_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_day_versions_date ON day_versions(occurred_date, author, version);
+CREATE TABLE IF NOT EXISTS day_changes (
+    author TEXT NOT NULL,
+    occurred_date TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (author, occurred_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_day_changes_date ON day_changes(occurred_date, n);
+CREATE TABLE IF NOT EXISTS punches (
+    id TEXT PRIMARY KEY,
+    author TEXT NOT NULL,
+    occurred_date TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_punches_date ON punches(occurred_date, author);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# (author, occurred_date, type) -> 条数
+Counts = Dict[Tuple[str, str, str], int]
+
+
+def _key(item: Any) -> Tuple[str, str, str]:
+    return (item.get("author") or "", item.get("occurred_date") or "", item.get("type") or "fragment")
+
+
+class DailyStats:
+    """
+    counted 记录已计入的记录 id（重复通知按 id 幂等，删除时按 id 撤销）；daily_counts 是按天的计数；
+    day_versions 是碎片版本号，day_changes 是所有记录（含日报）的变更次数，meta.epoch 在建库 / 重建时重新生成（版本号清零后旧版本串不会被误认为相同）；
+    punches 是打卡碎片的 id
+    """
+
+    def __init__(self, path: str) -> None:
+        self.db = _SqliteDatabase(path, _STATS_SCHEMA)
+        conn = self.db.conn()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+
+    def add(self, items: Iterable[Any]) -> int:
+        pending: Dict[str, Tuple[str, str, str]] = {}
+        punches = set()
+        for item in items:
+            fragment_id = item.get("id")
+            if fragment_id and item.get("type") != "tombstone":
+                pending.setdefault(fragment_id, _key(item))
+                if is_punch(item):
+                    punches.add(fragment_id)
+        if not pending:
+            return 0
+        conn = self.db.conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = list(pending)
+            for k in range(0, len(ids), 500):
+                chunk = ids[k:k + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for (fragment_id,) in conn.execute(f"SELECT id FROM counted WHERE id IN ({placeholders})", chunk):
+                    del pending[fragment_id]
+            conn.executemany(
+                "INSERT INTO counted (id, author, occurred_date, type) VALUES (?, ?, ?, ?)",
+                [(fragment_id, *key) for fragment_id, key in pending.items()],
+            )
+            conn.executemany(
+                "INSERT INTO punches (id, author, occurred_date) VALUES (?, ?, ?)",
+                [(fragment_id, key[0], key[1]) for fragment_id, key in pending.items() if fragment_id in punches],
+            )
+            deltas: Counts = {}
+            for key in pending.values():
+                deltas[key] = deltas.get(key, 0) + 1
+            self._apply(conn, deltas)
+        return len(pending)
+
+    def remove(self, fragment_ids: Iterable[str]) -> int:
+        conn = self.db.conn()
+        deltas: Counts = {}
+        with conn:
+            for fragment_id in fragment_ids:
+                row = conn.execute(
+                    "SELECT author, occurred_date, type FROM counted WHERE id = ?", (fragment_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                conn.execute("DELETE FROM counted WHERE id = ?", (fragment_id,))
+                conn.execute("DELETE FROM punches WHERE id = ?", (fragment_id,))
+                key = (row[0], row[1], row[2])
+                deltas[key] = deltas.get(key, 0) - 1
+            self._apply(conn, deltas)
+        return -sum(deltas.values())
+
+    @staticmethod
+    def _apply(conn, deltas: Counts) -> None:
+        conn.executemany(
+            "INSERT INTO daily_counts (author, occurred_date, type, n) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(author, occurred_date, type) DO UPDATE SET n = n + excluded.n",
+            [(*key, n) for key, n in deltas.items() if n],
+        )
+        if any(n < 0 for n in deltas.values()):
+            conn.execute("DELETE FROM daily_counts WHERE n <= 0")
+        bumps: Dict[Tuple[str, str], int] = {}
+        changes: Dict[Tuple[str, str], int] = {}
+        for (author, occurred_date, kind), n in deltas.items():
+            if not n:
+                continue
+            changes[(author, occurred_date)] = changes.get((author, occurred_date), 0) + abs(n)
+            if kind != "summary":
+                bumps[(author, occurred_date)] = bumps.get((author, occurred_date), 0) + abs(n)
+        conn.executemany(
+            "INSERT INTO day_versions (author, occurred_date, version) VALUES (?, ?, ?) "
+            "ON CONFLICT(author, occurred_date) DO UPDATE SET version = version + excluded.version",
+            [(*key, n) for key, n in bumps.items()],
+        )
+        conn.executemany(
+            "INSERT INTO day_changes (author, occurred_date, n) VALUES (?, ?, ?) "
+            "ON CONFLICT(author, occurred_date) DO UPDATE SET n = n + excluded.n",
+            [(*key, n) for key, n in changes.items()],
+        )
+
+    @staticmethod
+    def _epoch(conn) -> str:
+        return conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def version(self, author: str, occurred_date: str) -> str:
+        """
+        该作者当天碎片（不含日报）的版本号，形如 "<epoch>:<n>"；碎片没有变化时返回值不变
+        """
+        conn = self.db.conn()
+        epoch = self._epoch(conn)
+        row = conn.execute(
+            "SELECT version FROM day_versions WHERE author = ? AND occurred_date = ?", (author or "", occurred_date)
+        ).fetchone()
+        return f"{epoch}:{row[0] if row else 0}"
+
+    def versions(self, occurred_date: str, authors: Iterable[str]) -> Dict[str, str]:
+        """一次取多个作者当天的版本号（批量生成日报用），与逐个调用 version() 结果相同"""
+        conn = self.db.conn()
+        epoch = self._epoch(conn)
+        rows = conn.execute("SELECT author, version FROM day_versions WHERE occurred_date = ?", (occurred_date,))
+        found = {r[0]: r[1] for r in rows}
+        return {author: f"{epoch}:{found.get(author or '', 0)}" for author in authors}
+
+    def changes(self, occurred_date: str, author: Optional[str] = None) -> str:
+        """
+        当天（某作者或所有人）记录的变更版本，形如 "<epoch>:<n>"；任一碎片 / 日报新增、删除后改变
+        """
+        conn = self.db.conn()
+        epoch = self._epoch(conn)
+        if author:
+            row = conn.execute(
+                "SELECT n FROM day_changes WHERE author = ? AND occurred_date = ?", (author, occurred_date)
+            ).fetchone()
+        else:
+            row = conn.execute("SELECT SUM(n) FROM day_changes WHERE occurred_date = ?", (occurred_date,)).fetchone()
+        return f"{epoch}:{(row[0] if row else None) or 0}"
+
+    def query(self, start: str, end: str, author: Optional[str] = None) -> List[Tuple[str, str, str, int]]:
+        """
+        Returns:
+            [(author, occurred_date, type, n), ...]，按 author, occurred_date 排序
+        """
+        if author:
+            sql = ("SELECT author, occurred_date, type, n FROM daily_counts "
+                   "WHERE author = ? AND occurred_date >= ? AND occurred_date <= ? ORDER BY occurred_date")
+            params: List[Any] = [author, start, end]
+        else:
+            sql = ("SELECT author, occurred_date, type, n FROM daily_counts "
+                   "WHERE occurred_date >= ? AND occurred_date <= ? ORDER BY author, occurred_date")
+            params = [start, end]
+        return [(r[0], r[1], r[2], r[3]) for r in self.db.conn().execute(sql, params)]
+
+    def last_active_dates(self, author: Optional[str] = None) -> Dict[str, str]:
+        """每个作者最近一次有记录的日期（不限于查询范围）"""
+        sql = "SELECT author, MAX(occurred_date) FROM daily_counts"
+        params: List[Any] = []
+        if author:
+            sql += " WHERE author = ?"
+            params.append(author)
+        sql += " GROUP BY author"
+        return {r[0]: r[1] for r in self.db.conn().execute(sql, params) if r[1] is not None}
+
+    def punched_dates(self, start: str, end: str, author: Optional[str] = None) -> Dict[str, List[str]]:
+        """每个作者范围内有打卡记录的日期（升序，同一天打卡多次只算一次）"""
+        sql = "SELECT DISTINCT author, occurred_date FROM punches WHERE occurred_date >= ? AND occurred_date <= ?"
+        params: List[Any] = [start, end]
+        if author:
+            sql += " AND author = ?"
+            params.append(author)
+        out: Dict[str, List[str]] = {}
+        for row_author, occurred_date in self.db.conn().execute(sql + " ORDER BY author, occurred_date", params):
+            out.setdefault(row_author, []).append(occurred_date)
+        return out
+
+    def is_current(self) -> bool:
+        return self.db.conn().execute("PRAGMA user_version").fetchone()[0] >= STATS_VERSION
+
+    def all_counts(self) -> Counts:
+        return {(r[0], r[1], r[2]): r[3] for r in self.db.conn().execute(
+            "SELECT author, occurred_date, type, n FROM daily_counts")}
+
+    def rebuild(self, items: Iterable[Any], batch_size: int = 5000) -> Dict[str, Any]:
+        """清空后从 items 重新计数"""
+        conn = self.db.conn()
+        with conn:
+            conn.execute("DELETE FROM daily_counts")
+            conn.execute("DELETE FROM counted")
+            conn.execute("DELETE FROM day_versions")
+            conn.execute("DELETE FROM day_changes")
+            conn.execute("DELETE FROM punches")
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'epoch'", (uuid.uuid4().hex,))
+        total = 0
+        batch: List[Any] = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                total += self.add(batch)
+                batch = []
+        total += self.add(batch)
+        conn.execute(f"PRAGMA user_version = {STATS_VERSION}")
+        print(f"[DEBUG] stats: rebuilt from {total} records")
+        return {"ok": True, "counted": total}
+
+
+def count_items(items: Iterable[Any]) -> Counts:
+    """直接从原始记录计数（校验用，不读写 stats.db）"""
+    counts: Counts = {}
+    seen = set()
+    for item in items:
+        fragment_id = item.get("id")
+        if not fragment_id or fragment_id in seen or item.get("type") == "tombstone":
+            continue
+        seen.add(fragment_id)
+        key = _key(item)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+_STATS: Optional[DailyStats] = None
+_STATS_LOCK = threading.Lock()
+
+
+def get_daily_stats() -> DailyStats:
+    global _STATS
+    if _STATS is None:
+        with _STATS_LOCK:
+            if _STATS is None:
+                # 首次使用，或旧版本的 stats.db（没有打卡覆盖）：从现有数据构建
+                stats = DailyStats(STATS_DB_PATH)
+                if not stats.is_current():
+                    from storage import iter_all_records
+                    stats.rebuild(iter_all_records())
+                _STATS = stats
+    return _STATS
+
+
+def on_fragments_changed(kind: str, items: List[Any]) -> None:
+    """storage 变更通知的回调"""
+    stats = get_daily_stats()
+    if kind == "append":
+        stats.add(items)
+    elif kind == "delete":
+        stats.remove(i.get("id") for i in items if i.get("id"))
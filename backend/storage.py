@@ -0,0 +1,2396 @@
+# storage.py
+# 存储抽象：FragmentStore / ClockStore
+#
+# 后端（环境变量 STORAGE_BACKEND 选择）：
+# - jsonl（默认）：fragments.jsonl + clock_events.jsonl（打卡事件日志，首次使用时自动导入旧的 clock.json）
+#   + summaries.jsonl（日报，按 (date, author) 覆盖写入）
+#   FRAGMENTS_LAYOUT=partitioned 时按日期分片：fragments/YYYY/MM/DD.jsonl（迁移期间兼容读取 fragments.jsonl）
+# - sqlite：DATA_DIR/punch.db，WAL 模式，(occurred_date, author) 与 id 上建索引
+#
+# 迁移：python manage.py migrate-sqlite（把现有 fragments.jsonl / clock.json / summaries.jsonl 导入 SQLite）
+#      python manage.py partition（把 fragments.jsonl 拆分到按日期分片的目录）
+#
+# 多进程：所有追加 / 重写 / 读-改-写都持有 DATA_DIR/.storage.lock 文件锁，重写一律“写临时文件 + rename”；
+# 进程内索引通过 tail read + inode 检测感知其它进程的修改，fork 之后子进程重新创建存储对象。
+#
+# JSONL 后端另有持久化的 id 索引 fragment_ids.idx（id -> 文件 / 字节偏移 / 日期），
+# 按 id 查找和删除不必扫描数据文件；python manage.py rebuild-id-index 可从数据文件重建
+#
+# 派生索引（search.py 全文搜索、tag_index.py 标签索引、stats.py 按天统计）通过 add_change_listener 注册的变更通知增量维护，与后端无关
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+DATA_DIR = os.getenv("DATA_DIR", ".")
+FRAGMENTS_PATH = os.path.join(DATA_DIR, "fragments.jsonl")
+CLOCK_PATH = os.path.join(DATA_DIR, "clock.json")
+CLOCK_EVENTS_PATH = os.path.join(DATA_DIR, "clock_events.jsonl")
+SUMMARIES_PATH = os.path.join(DATA_DIR, "summaries.jsonl")
+SQLITE_PATH = os.path.join(DATA_DIR, "punch.db")
+PARTITIONS_DIR = os.path.join(DATA_DIR, "fragments")
+ID_INDEX_PATH = os.path.join(DATA_DIR, "fragment_ids.idx")
+DATA_LOCK_PATH = os.path.join(DATA_DIR, ".storage.lock")
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "jsonl")
+# single：单个 fragments.jsonl；partitioned：fragments/YYYY/MM/DD.jsonl
+FRAGMENTS_LAYOUT = os.getenv("FRAGMENTS_LAYOUT", "single")
+# 分片布局下同时保留索引和文件句柄的分片数（最近使用的），超出时关闭最久未用的分片
+PARTITION_CACHE_SIZE = int(os.getenv("FRAGMENTS_PARTITION_CACHE", "128"))
+
+_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+
+# 压缩阈值：文件不小于 COMPACT_MIN_BYTES 且死记录占比不低于 COMPACT_DEAD_RATIO 时，删除后触发后台压缩
+COMPACT_MIN_BYTES = int(os.getenv("FRAGMENTS_COMPACT_MIN_BYTES", str(1024 * 1024)))
+COMPACT_DEAD_RATIO = float(os.getenv("FRAGMENTS_COMPACT_DEAD_RATIO", "0.3"))
+
+# 组提交：FRAGMENTS_GROUP_COMMIT=1 时，并发的 JSONL 追加合并成一次 write，文件句柄常驻
+# FRAGMENTS_FSYNC：always（每个请求 fsync）/ batch（每个合并批次 fsync 一次）/ interval（后台定时 fsync）
+GROUP_COMMIT = os.getenv("FRAGMENTS_GROUP_COMMIT", "0") == "1"
+FSYNC_POLICY = os.getenv("FRAGMENTS_FSYNC", "batch")
+FSYNC_INTERVAL_MS = int(os.getenv("FRAGMENTS_FSYNC_INTERVAL_MS", "1000"))
+_FSYNC_POLICIES = ("always", "batch", "interval")
+
+# 索引快照：每新解析 SNAPSHOT_LINES 行重写一次 {数据文件}.snap（0 表示不写）；冷启动时只解析快照之后的尾部
+SNAPSHOT_LINES = int(os.getenv("FRAGMENTS_SNAPSHOT_LINES", "10000"))
+_SNAPSHOT_MAGIC = b"PFSNAP01"
+# 每个数据文件缓存最近读取的记录条数
+ROW_CACHE_SIZE = int(os.getenv("FRAGMENTS_ROW_CACHE", "20000"))
+
+# 派生索引（全文搜索等）：FRAGMENTS_SEARCH_INDEX=0 时不维护搜索索引
+SEARCH_INDEX_ENABLED = os.getenv("FRAGMENTS_SEARCH_INDEX", "1") == "1"
+
+
+def _ensure_data_dir() -> None:
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+
+def _now_iso() -> str:
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+# =========================
+# 0) 跨进程锁
+# =========================
+
+try:
+    import fcntl
+
+    def _lock_file(f) -> None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f) -> None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(f) -> None:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f) -> None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _InterProcessLock:
+    """
+    线程锁 + 文件锁：同一进程内可重入，不同进程之间互斥
+
+    锁文件在第一次加锁时打开并一直保持，fork 后由子进程重新创建（见 _data_lock）。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._file = None
+        self._depth = 0
+
+    def __enter__(self) -> "_InterProcessLock":
+        self._thread_lock.acquire()
+        try:
+            if self._depth == 0:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a+b")
+                _lock_file(self._file)
+            self._depth += 1
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                _unlock_file(self._file)
+        finally:
+            self._thread_lock.release()
+
+
+_DATA_LOCKS: Dict[int, _InterProcessLock] = {}
+
+
+def _data_lock() -> _InterProcessLock:
+    """DATA_DIR 级别的写锁；按 pid 区分，fork 出来的 worker 不会继承父进程的锁状态"""
+    pid = os.getpid()
+    lock = _DATA_LOCKS.get(pid)
+    if lock is None:
+        lock = _DATA_LOCKS.setdefault(pid, _InterProcessLock(DATA_LOCK_PATH))
+    return lock
+
+
+# =========================
+# 1) 接口
+# =========================
+
+_MISSING = object()
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Fragment:
+    """
+    读路径上的碎片记录：__slots__ 存字段，type / source / author / occurred_date 与 tags 做字符串驻留
+
+    提供 dict 的只读接口（get / [] / in / keys），现有代码按 dict 用即可；
+    只在输出 JSON 时（json_default / server.py 的 JSON provider）才转换成 dict。
+    """
+
+    FIELDS = ("id", "type", "content", "occurred_date", "source", "author", "tags", "created_at")
+    __slots__ = FIELDS + ("extra",)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Fragment":
+        f = cls.__new__(cls)
+        f.id = data.get("id", _MISSING)
+        f.type = _intern(data.get("type", _MISSING))
+        f.content = data.get("content", _MISSING)
+        f.occurred_date = _intern(data.get("occurred_date", _MISSING))
+        f.source = _intern(data.get("source", _MISSING))
+        f.author = _intern(data.get("author", _MISSING))
+        tags = data.get("tags", _MISSING)
+        f.tags = tuple(_intern(t) for t in tags) if isinstance(tags, list) else tags
+        f.created_at = data.get("created_at", _MISSING)
+        # 未知字段原样保留
+        f.extra = {k: v for k, v in data.items() if k not in _FRAGMENT_FIELDS} or None
+        return f
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for k in self.FIELDS:
+            v = getattr(self, k)
+            if v is not _MISSING:
+                out[k] = list(v) if k == "tags" and isinstance(v, tuple) else v
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.FIELDS:
+            v = getattr(self, key)
+            return default if v is _MISSING else v
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        v = self.get(key, _MISSING)
+        if v is _MISSING:
+            raise KeyError(key)
+        return v
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> List[str]:
+        return list(self.to_dict().keys())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Fragment):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"Fragment({self.to_dict()!r})"
+
+
+_FRAGMENT_FIELDS = frozenset(Fragment.FIELDS)
+
+
+def json_default(obj: Any) -> Any:
+    """json.dumps(..., default=json_default)：把 Fragment 转成 dict"""
+    if isinstance(obj, Fragment):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# 变更通知：碎片写入 / 删除后通知派生索引（search.py 等）增量更新
+# kind 为 "append" 或 "delete"，items 为写入的记录 / 被删除的记录；在写锁之外、写入成功后调用。
+# 通知失败只打印日志，不影响写入本身（派生索引可以用 manage.py 重建）。
+_CHANGE_LISTENERS: List[Callable[[str, List[Any]], None]] = []
+_LISTENERS_INSTALLED = False
+
+
+def add_change_listener(fn: Callable[[str, List[Any]], None]) -> None:
+    if fn not in _CHANGE_LISTENERS:
+        _CHANGE_LISTENERS.append(fn)
+
+
+def _install_default_listeners() -> None:
+    global _LISTENERS_INSTALLED
+    if _LISTENERS_INSTALLED:
+        return
+    _LISTENERS_INSTALLED = True
+    import stats
+    import tag_index
+    add_change_listener(stats.on_fragments_changed)
+    add_change_listener(tag_index.on_fragments_changed)
+    if SEARCH_INDEX_ENABLED:
+        import search
+        add_change_listener(search.on_fragments_changed)
+
+
+def _emit_change(kind: str, items: List[Any]) -> None:
+    if not items:
+        return
+    _install_default_listeners()
+    for fn in list(_CHANGE_LISTENERS):
+        try:
+            fn(kind, items)
+        except Exception as e:
+            print(f"[DEBUG] change listener {getattr(fn, '__qualname__', fn)} failed: {type(e).__name__}: {e}")
+
+
+class FragmentStore:
+    """
+    碎片存储接口
+
+    写入 dict（字段见 tools.record_fragment）；读取返回 Fragment（兼容 dict 的只读接口）。
+    同一 (date, author) 下按写入顺序返回。
+    """
+
+    def append(self, item: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def append_many(self, items: List[Dict[str, Any]]) -> None:
+        """批量追加（导入用）；默认逐条 append"""
+        for item in items:
+            self.append(item)
+
+    def get(self, fragment_id: str) -> Optional[Fragment]:
+        raise NotImplementedError
+
+    def get_many(self, fragment_ids: List[str]) -> List[Fragment]:
+        """按给定顺序返回存在的记录（派生索引查出 id 后取数用）；默认逐条 get"""
+        found = (self.get(fragment_id) for fragment_id in fragment_ids)
+        return [item for item in found if item is not None]
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        """author 为 None 或 "" 时不过滤"""
+        raise NotImplementedError
+
+    def delete(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        """
+        删除并返回被删记录；不存在时返回 None
+
+        occurred_date 是可选的定位提示（分片布局下只需打开这一天的分片）
+        """
+        raise NotImplementedError
+
+    def delete_where(self, date: str, type: Optional[str] = None, author: Optional[str] = None) -> int:
+        """删除某天满足条件的记录，返回删除条数"""
+        raise NotImplementedError
+
+    def iter_range(self, start: str, end: str, author: Optional[str] = None,
+                   after: Optional[Tuple[str, str, str]] = None) -> Iterator[Fragment]:
+        """
+        按 (occurred_date, created_at, id) 升序遍历 start <= occurred_date <= end 的有效记录
+
+        只读取范围内的日期（分片 / 索引桶 / SQL 范围扫描），边读边产出（导出 / 分页用）。
+        after 为上一页最后一条的 keyset_key()，只返回排在它之后的记录。
+        """
+        raise NotImplementedError
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        """按写入顺序遍历所有有效记录（迁移 / 重建用）"""
+        raise NotImplementedError
+
+    def compact(self) -> Dict[str, Any]:
+        return {"ok": True, "skipped": "not_supported"}
+
+
+class ClockStore:
+    """打卡状态存储接口：按 date -> event_type -> state 组织"""
+
+    def get_day(self, date: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def set_event(self, date: str, event_type: str, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def load_all(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def lock(self) -> _InterProcessLock:
+        """读-改-写（如 mark_clock_timeout 的“已确认不覆盖”）期间持有；跨进程互斥"""
+        return _data_lock()
+
+    def compact(self) -> Dict[str, Any]:
+        return {"ok": True, "skipped": "not_supported"}
+
+
+class SummaryStore:
+    """
+    日报存储接口：每个 (occurred_date, author) 一条日报，put 即覆盖（upsert）
+
+    记录字段与碎片相同（type="summary"），另带 source_version：生成时该作者当天碎片的版本号（见 stats.py）。
+    覆盖 / 删除同样发出变更通知（旧记录 "delete"、新记录 "append"），派生索引与碎片一视同仁。
+    """
+
+    def get(self, date: str, author: str) -> Optional[Fragment]:
+        raise NotImplementedError
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        """author 为 None 或 "" 时返回当天所有人的日报"""
+        raise NotImplementedError
+
+    def put(self, item: Dict[str, Any]) -> Optional[Fragment]:
+        """写入日报，返回被覆盖的旧记录（没有时为 None）"""
+        raise NotImplementedError
+
+    def put_many(self, items: List[Dict[str, Any]]) -> List[Fragment]:
+        """批量写入（批量生成日报用），返回被覆盖的旧记录；默认逐条 put"""
+        previous = (self.put(item) for item in items)
+        return [p for p in previous if p is not None]
+
+    def get_by_id(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        raise NotImplementedError
+
+    def delete(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        """按 id 删除并返回被删记录；不存在时返回 None"""
+        raise NotImplementedError
+
+    def iter_all(self) -> Iterator[Fragment]:
+        raise NotImplementedError
+
+    def compact(self) -> Dict[str, Any]:
+        return {"ok": True, "skipped": "not_supported"}
+
+
+# =========================
+# 2) JSONL 后端
+# =========================
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    out: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line))
+            except Exception:
+                continue
+    return out
+
+
+def keyset_key(item: Dict[str, Any]) -> Tuple[str, str, str]:
+    """范围遍历 / 分页的排序键"""
+    return (item.get("occurred_date") or "", item.get("created_at") or "", item.get("id") or "")
+
+
+def _keyset_rows(rows: List[Dict[str, Any]], after: Optional[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    """一天内的记录按 keyset_key 排序，并去掉不在 after 之后的"""
+    rows = sorted(rows, key=keyset_key)
+    if after is not None and rows and rows[0].get("occurred_date") == after[0]:
+        rows = [r for r in rows if keyset_key(r) > after]
+    return rows
+
+
+def _scan_live_rows(path: str, author: Optional[str] = None) -> Tuple[List[Dict[str, Any]], set]:
+    """
+    一次性读取一个（小）数据文件的有效记录，不建立常驻索引
+
+    Returns:
+        (按写入顺序的有效记录, 文件中所有 tombstone 目标 id)
+    """
+    rows: List[Dict[str, Any]] = []
+    tombstoned: set = set()
+    for item in _read_jsonl(path):
+        if item.get("type") == "tombstone":
+            tombstoned.add(item.get("target_id"))
+        elif not author or item.get("author") == author:
+            rows.append(Fragment.from_dict(item))
+    if tombstoned:
+        rows = [r for r in rows if r.get("id") not in tombstoned]
+    return rows, tombstoned
+
+
+def _iter_lines_with_offsets(path: str) -> Iterator[Tuple[int, bytes]]:
+    """逐行读取文件，返回 (行首字节偏移, 行内容)；末尾不完整的行不返回"""
+    if not os.path.exists(path):
+        return
+    offset = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            yield offset, raw
+            offset += len(raw)
+
+
+def _parse_json_line(raw: bytes) -> Optional[Dict[str, Any]]:
+    line = raw.strip()
+    if not line:
+        return None
+    try:
+        item = json.loads(line)
+    except Exception:
+        return None
+    return item if isinstance(item, dict) else None
+
+
+# POSIX 上保持已索引文件的句柄：文件被 rename 替换后旧 inode 不会被回收复用，替换一定能被识别
+_KEEP_OPEN = os.name == "posix"
+
+
+class _TailReader:
+    """
+    追踪只追加文件的读取位置：每次只返回上次之后新增的完整行
+
+    文件被替换（inode 变化）、变短、或 offset 不再落在行边界时从头读，并通知调用方重建。
+    其它进程的追加 / 压缩也由此感知，不需要额外的缓存失效通知。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.ino: Optional[int] = None
+        self.offset = 0
+        self._file = None
+        self._pid = os.getpid()
+
+    def reset(self) -> None:
+        self.ino = None
+        self.offset = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def needs_reset(self) -> bool:
+        """还没读过、fork 之后、或文件被替换 / 变短：调用方应重建（可先尝试快照再 start_at）"""
+        if self.ino is None or self._pid != os.getpid():
+            return True
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return st.st_ino != self.ino or st.st_size < self.offset
+
+    def start_at(self, ino: int, offset: int) -> bool:
+        """从检查点 offset 继续读（文件 inode 必须仍是 ino）"""
+        self.reset()
+        self._pid = os.getpid()
+        try:
+            if _KEEP_OPEN:
+                self._file = open(self.path, "rb")
+                st = os.fstat(self._file.fileno())
+            else:
+                st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if st.st_ino != ino or st.st_size < offset:
+            self.reset()
+            return False
+        self.ino = ino
+        self.offset = offset
+        return True
+
+    def _pread(self, size: int, offset: int) -> bytes:
+        if self._file is not None:
+            # pread 不移动共享的文件偏移，fork 后父子进程共用句柄也安全
+            return os.pread(self._file.fileno(), size, offset)
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def read(self) -> Tuple[bool, List[Tuple[int, bytes]]]:
+        """
+        Returns:
+            (rebuilt, [(行首偏移, 行内容), ...])；rebuilt=True 表示从头读，调用方应先清空已有状态
+        """
+        if self._pid != os.getpid():
+            self._file = None
+            self._pid = os.getpid()
+            self.ino = None
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            rebuilt = self.ino is not None
+            self.reset()
+            return rebuilt, []
+
+        rebuilt = False
+        if st.st_ino != self.ino or st.st_size < self.offset:
+            if self.ino is not None:
+                print(f"[DEBUG] tail reader: {self.path} rewritten, rebuilding")
+            self.reset()
+            if _KEEP_OPEN:
+                try:
+                    self._file = open(self.path, "rb")
+                except FileNotFoundError:
+                    return True, []
+                st = os.fstat(self._file.fileno())
+            self.ino = st.st_ino
+            rebuilt = True
+        elif self._file is not None:
+            st = os.fstat(self._file.fileno())
+        if st.st_size == self.offset:
+            return rebuilt, []
+
+        if self.offset > 0 and self._pread(1, self.offset - 1) != b"\n":
+            # 同一 inode 被原地截断重写后又变长：不能接着读
+            print(f"[DEBUG] tail reader: {self.path} offset misaligned, rebuilding")
+            self.offset = 0
+            rebuilt = True
+        chunk = self._pread(st.st_size - self.offset, self.offset)
+
+        out: List[Tuple[int, bytes]] = []
+        offset = self.offset
+        for raw in chunk.splitlines(keepends=True):
+            if not raw.endswith(b"\n"):
+                # 写入方还没写完这一行，下次再读
+                break
+            out.append((offset, raw))
+            offset += len(raw)
+        self.offset = offset
+        return rebuilt, out
+
+
+class _FragmentIndex:
+    """
+    数据文件的进程内索引：每条有效记录只保存 (作者编码, 字节偏移, 行长度)，查询时按偏移读取并解析当天的行
+
+    - 列式存储：作者按字典编码，三列分别放在 array 里（每行十几个字节）；日期按桶组织
+    - 冷启动时优先 mmap 加载二进制快照 {path}.snap，只解析快照检查点之后追加的尾部；
+      没有可用快照时全量解析一次，此后每新解析 SNAPSHOT_LINES 行重写一次快照
+    - 之后每次查询只读取上次 offset 之后追加的字节（tail read）
+    - 文件被重写（inode 变化 / 文件变短 / offset 不在行边界）时自动重建
+    - 读到 tombstone 时把目标记录标记为删除（按 tombstone 上的日期 / 作者定位目标）
+    - 最近读取过的记录按行号缓存（ROW_CACHE_SIZE 条）
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.snapshot_path = path + ".snap"
+        self._lock = threading.Lock()
+        self._tail = _TailReader(path)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._dates: List[str] = []
+        self._date_code: Dict[str, int] = {}
+        self._authors: List[str] = []
+        self._author_code: Dict[str, int] = {}
+        # 每行一个元素，下标即行号
+        self._author_col = array("i")
+        self._offset_col = array("q")
+        self._length_col = array("i")
+        # 快照里的行按日期排好序：日期编码 c 的行号区间是 [_snap_starts[c], _snap_starts[c + 1])
+        self._snap_starts = array("q", [0])
+        # 快照之后解析的行：日期编码 -> 行号
+        self._tail_rows: Dict[int, array] = {}
+        self._live: Dict[int, int] = {}
+        self._deleted: set = set()
+        # 快照之后解析的行：id -> 行号（tombstone 定位的捷径）
+        self._tail_ids: Dict[str, int] = {}
+        # 本文件中出现过的所有 tombstone 目标（目标可能在另一个文件里，见分片布局）
+        self._tombstoned: set = set()
+        self._cache: Dict[int, Dict[str, Any]] = {}
+        self._lines = 0
+        self._dead = 0
+        self._since_snapshot = 0
+
+    def invalidate(self) -> None:
+        """本进程重写了文件：下次查询时重建"""
+        with self._lock:
+            self._tail.reset()
+            self._reset()
+
+    @staticmethod
+    def _encode(values: List[str], codes: Dict[str, int], value: str) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def _add(self, offset: int, raw: bytes, item: Dict[str, Any]) -> None:
+        self._lines += 1
+        if item.get("type") == "tombstone":
+            self._apply_tombstone(item)
+            return
+        d = item.get("occurred_date")
+        if not d:
+            return
+        row = len(self._offset_col)
+        dc = self._encode(self._dates, self._date_code, d)
+        self._author_col.append(self._encode(self._authors, self._author_code, item.get("author") or ""))
+        self._offset_col.append(offset)
+        self._length_col.append(len(raw))
+        rows = self._tail_rows.get(dc)
+        if rows is None:
+            rows = self._tail_rows[dc] = array("q")
+        rows.append(row)
+        self._live[dc] = self._live.get(dc, 0) + 1
+        if item.get("id"):
+            self._tail_ids[item["id"]] = row
+
+    def _apply_tombstone(self, tombstone: Dict[str, Any]) -> None:
+        target_id = tombstone.get("target_id")
+        self._tombstoned.add(target_id)
+        found = self._find_row(target_id, tombstone.get("occurred_date"), tombstone.get("author"))
+        if found is None:
+            # 目标在另一个文件里（分片布局下删除旧文件中的记录）：压缩时要保留，不算作可回收的行
+            return
+        row, dc, _ = found
+        self._dead += 2
+        self._deleted.add(row)
+        self._live[dc] -= 1
+        self._tail_ids.pop(target_id, None)
+        self._cache.pop(row, None)
+
+    def _rows_of(self, dc: int, author_code: Optional[int] = None) -> List[int]:
+        """某天的有效行号（文件顺序），可按作者编码过滤"""
+        rows: List[int] = []
+        if dc < len(self._snap_starts) - 1:
+            rows.extend(range(self._snap_starts[dc], self._snap_starts[dc + 1]))
+        tail = self._tail_rows.get(dc)
+        if tail:
+            rows.extend(tail)
+        if self._deleted:
+            rows = [r for r in rows if r not in self._deleted]
+        if author_code is not None:
+            col = self._author_col
+            rows = [r for r in rows if col[r] == author_code]
+        return rows
+
+    def _read_rows(self, rows: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        """按偏移读取并解析若干行；相邻的行合并成一次 pread"""
+        offsets, lengths = self._offset_col, self._length_col
+        pending = [r for r in rows if r not in self._cache]
+        parsed: Dict[int, Dict[str, Any]] = {}
+        i = 0
+        while i < len(pending):
+            start = offsets[pending[i]]
+            end = start + lengths[pending[i]]
+            j = i + 1
+            while j < len(pending) and offsets[pending[j]] == end and end - start < (1 << 20):
+                end += lengths[pending[j]]
+                j += 1
+            data = self._tail._pread(end - start, start)
+            pos = 0
+            for r in pending[i:j]:
+                item = _parse_json_line(data[pos:pos + lengths[r]])
+                pos += lengths[r]
+                if item is None:
+                    # 文件在索引之外被改写（没有保持句柄的平台上可能读到新文件）：下次查询重建
+                    print(f"[DEBUG] fragment index: {self.path} changed under index, rebuilding")
+                    self._tail.reset()
+                    continue
+                parsed[r] = Fragment.from_dict(item)
+            i = j
+
+        for r, item in parsed.items():
+            if len(self._cache) >= ROW_CACHE_SIZE:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[r] = item
+        out = []
+        for r in rows:
+            item = self._cache.get(r) or parsed.get(r)
+            if item is not None:
+                out.append((r, item))
+        return out
+
+    def _find_row(self, fragment_id: str, date: Optional[str],
+                  author: Optional[str]) -> Optional[Tuple[int, int, Dict[str, Any]]]:
+        """按 id 定位有效行：优先用日期 / 作者缩小范围，缺少日期时扫描全部"""
+        if date is not None and date not in self._date_code:
+            return None
+        codes = [self._date_code[date]] if date is not None else range(len(self._dates))
+        author_code = self._author_code.get(author) if date is not None and author else None
+        row = self._tail_ids.get(fragment_id)
+        for dc in codes:
+            candidates = self._rows_of(dc, author_code)
+            if row is not None:
+                candidates = [row] if row in candidates else candidates
+            for r, item in self._read_rows(candidates):
+                if item.get("id") == fragment_id:
+                    return r, dc, item
+        return None
+
+    def _refresh(self) -> None:
+        if self._tail.needs_reset():
+            self._tail.reset()
+            self._reset()
+            self._load_snapshot()
+        rebuilt, lines = self._tail.read()
+        if rebuilt:
+            self._reset()
+        for offset, raw in lines:
+            item = _parse_json_line(raw)
+            if item is not None:
+                self._add(offset, raw, item)
+        self._since_snapshot += len(lines)
+        if SNAPSHOT_LINES and self._since_snapshot >= SNAPSHOT_LINES:
+            self._write_snapshot()
+
+    # ---- 快照 ----
+    # 格式：_SNAPSHOT_MAGIC | uint32 头长度 | JSON 头 | 各列（本机字节序）
+    #   JSON 头：文件 inode、检查点 offset、检查点前 4KB 的 crc32、行数统计、日期 / 作者字典、tombstone 目标
+    #   列：日期行号区间 int64[日期数 + 1]、作者编码 int32[行数]、偏移 int64[行数]、行长度 int32[行数]
+
+    def _tail_crc(self, checkpoint: int) -> int:
+        start = max(0, checkpoint - 4096)
+        return zlib.crc32(self._tail._pread(checkpoint - start, start))
+
+    def _load_snapshot(self) -> bool:
+        try:
+            with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+                    return False
+                pos = len(_SNAPSHOT_MAGIC)
+                (header_len,) = struct.unpack_from("<I", mm, pos)
+                pos += 4
+                header = json.loads(mm[pos:pos + header_len])
+                pos += header_len
+                if header.get("byteorder") != sys.byteorder:
+                    return False
+                if not self._tail.start_at(header["ino"], header["checkpoint"]):
+                    return False
+                if self._tail_crc(header["checkpoint"]) != header["tail_crc"]:
+                    self._tail.reset()
+                    return False
+
+                n_dates, n_rows = len(header["dates"]), header["rows"]
+                columns = []
+                for typecode, count in (("q", n_dates + 1), ("i", n_rows), ("q", n_rows), ("i", n_rows)):
+                    col = array(typecode)
+                    size = col.itemsize * count
+                    col.frombytes(mm[pos:pos + size])
+                    pos += size
+                    columns.append(col)
+        except (OSError, ValueError, KeyError, struct.error):
+            self._tail.reset()
+            return False
+
+        self._snap_starts, self._author_col, self._offset_col, self._length_col = columns
+        self._dates = header["dates"]
+        self._date_code = {d: i for i, d in enumerate(self._dates)}
+        self._authors = header["authors"]
+        self._author_code = {a: i for i, a in enumerate(self._authors)}
+        self._live = {i: self._snap_starts[i + 1] - self._snap_starts[i] for i in range(n_dates)}
+        self._tombstoned = set(header["tombstoned"])
+        self._lines = header["lines"]
+        self._dead = header["dead"]
+        print(f"[DEBUG] fragment index: loaded snapshot {self.snapshot_path} ({n_rows} rows, checkpoint {header['checkpoint']})")
+        return True
+
+    def _write_snapshot(self) -> None:
+        """把当前状态写成快照，并把内存布局换成与快照相同的按日期排序布局"""
+        if self._tail.ino is None:
+            return
+        dates = sorted(d for d, dc in self._date_code.items() if self._live.get(dc))
+        starts = array("q", [0])
+        author_col, offset_col, length_col = array("i"), array("q"), array("i")
+        for d in dates:
+            dc = self._date_code[d]
+            rows = self._rows_of(dc)
+            if not self._deleted and dc < len(self._snap_starts) - 1:
+                # 上一个快照里的区间原样整段拷贝，只逐行处理之后追加的行
+                a, b = self._snap_starts[dc], self._snap_starts[dc + 1]
+                author_col.extend(self._author_col[a:b])
+                offset_col.extend(self._offset_col[a:b])
+                length_col.extend(self._length_col[a:b])
+                rows = rows[b - a:]
+            for r in rows:
+                author_col.append(self._author_col[r])
+                offset_col.append(self._offset_col[r])
+                length_col.append(self._length_col[r])
+            starts.append(len(offset_col))
+
+        checkpoint = self._tail.offset
+        header = json.dumps({
+            "byteorder": sys.byteorder,
+            "ino": self._tail.ino,
+            "checkpoint": checkpoint,
+            "tail_crc": self._tail_crc(checkpoint),
+            "lines": self._lines,
+            "dead": self._dead,
+            "rows": len(offset_col),
+            "dates": dates,
+            "authors": self._authors,
+            "tombstoned": [t for t in self._tombstoned if t is not None],
+        }, ensure_ascii=False).encode("utf-8")
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_SNAPSHOT_MAGIC)
+                f.write(struct.pack("<I", len(header)))
+                f.write(header)
+                for col in (starts, author_col, offset_col, length_col):
+                    col.tofile(f)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            print(f"[DEBUG] fragment index: failed to write snapshot {self.snapshot_path}: {type(e).__name__}: {e}")
+            return
+
+        self._dates = dates
+        self._date_code = {d: i for i, d in enumerate(dates)}
+        self._snap_starts, self._author_col, self._offset_col, self._length_col = starts, author_col, offset_col, length_col
+        self._live = {i: starts[i + 1] - starts[i] for i in range(len(dates))}
+        self._tail_rows = {}
+        self._deleted = set()
+        self._tail_ids = {}
+        self._cache = {}
+        self._since_snapshot = 0
+        print(f"[DEBUG] fragment index: wrote snapshot {self.snapshot_path} ({len(offset_col)} rows)")
+
+    def checkpoint(self) -> None:
+        """追平文件后立即写快照（压缩之后调用，其它进程重建时可直接加载）"""
+        with self._lock:
+            self._refresh()
+            if SNAPSHOT_LINES and self._lines >= SNAPSHOT_LINES and self._since_snapshot:
+                self._write_snapshot()
+
+    # ---- 查询 ----
+
+    def _query(self, date: str, author: Optional[str]) -> List[Dict[str, Any]]:
+        dc = self._date_code.get(date)
+        if dc is None:
+            return []
+        author_code = None
+        if author is not None and author != "":
+            author_code = self._author_code.get(author)
+            if author_code is None:
+                return []
+        return [item for _, item in self._read_rows(self._rows_of(dc, author_code))]
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        with self._lock:
+            self._refresh()
+            return self._query(date, author)
+
+    def query_with_tombstones(self, date: str, author: Optional[str] = None) -> Tuple[List[Dict[str, Any]], set]:
+        """同 query，另外返回本文件中所有 tombstone 目标 id（用于过滤其他文件里的记录）"""
+        with self._lock:
+            self._refresh()
+            return self._query(date, author), set(self._tombstoned)
+
+    def get(self, fragment_id: str) -> Optional[Fragment]:
+        """没有 id 索引时的兜底：不在最近解析的尾部时需要扫描所有记录"""
+        with self._lock:
+            self._refresh()
+            found = self._find_row(fragment_id, None, None)
+            return found[2] if found else None
+
+    def dates(self, start: str, end: str) -> List[str]:
+        """start..end 之间有记录的日期（升序）"""
+        with self._lock:
+            self._refresh()
+            return sorted(d for d, dc in self._date_code.items() if self._live.get(dc) and start <= d <= end)
+
+    def is_tombstoned(self, fragment_id: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return fragment_id in self._tombstoned
+
+    def dead_ratio(self) -> float:
+        """已删除记录 + 指向它们的 tombstone 占总行数的比例（即压缩能去掉的行）"""
+        with self._lock:
+            self._refresh()
+            return self._dead / self._lines if self._lines else 0.0
+
+
+def _read_record_at(path: str, offset: int) -> Optional[Fragment]:
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            item = _parse_json_line(f.readline())
+    except OSError:
+        return None
+    return Fragment.from_dict(item) if item is not None else None
+
+
+class _IdIndex:
+    """
+    持久化的 id -> (文件, 字节偏移, 日期) 索引，保存在 fragment_ids.idx
+
+    - 每行 "id<TAB>相对 DATA_DIR 的路径<TAB>偏移<TAB>日期"；删除写 "id<TAB>-"；后写覆盖先写
+    - 写入数据时同步追加，进程内缓存整个映射，其它进程追加的行通过 tail read 追上
+    - 索引文件不存在时从数据文件全量重建一次；读到的记录 id 对不上时重新扫描该数据文件；
+      两种情况都把整个索引文件写临时文件后 rename，不会随压缩次数增长
+    - 数据文件压缩时由压缩方提供新的偏移（prepare_swap / commit_swap）：新索引文件在锁外写好，
+      持锁时只追平期间追加的索引行并 rename，不重新解析数据文件
+    - 文件写入都在 _data_lock() 下进行；self._lock 只保护进程内的映射，持有它时不再去拿文件锁
+    """
+
+    def __init__(self, path: str, base_dir: str, data_files: Callable[[], List[str]]) -> None:
+        self.path = path
+        self.base_dir = base_dir
+        self._data_files = data_files
+        self._lock = threading.Lock()
+        self._tail = _TailReader(path)
+        self._entries: Dict[str, Tuple[str, int, str]] = {}
+        self._checked = False
+
+    def _ensure_built(self) -> bool:
+        """索引文件不存在时从数据文件重建；返回本次是否重建"""
+        if self._checked:
+            return False
+        with _data_lock():
+            if self._checked:
+                return False
+            rebuilt = not os.path.exists(self.path)
+            if rebuilt:
+                self._rebuild()
+            self._checked = True
+            return rebuilt
+
+    @staticmethod
+    def _apply_line(entries: Dict[str, Tuple[str, int, str]], raw: bytes) -> None:
+        parts = raw.decode("utf-8", errors="replace").rstrip("\n").split("\t")
+        if len(parts) == 4:
+            try:
+                entries[parts[0]] = (parts[1], int(parts[2]), parts[3])
+            except ValueError:
+                return
+        elif len(parts) == 2 and parts[1] == "-":
+            entries.pop(parts[0], None)
+
+    def _refresh(self) -> None:
+        rebuilt, lines = self._tail.read()
+        if rebuilt:
+            self._entries = {}
+        for _, raw in lines:
+            self._apply_line(self._entries, raw)
+
+    def _write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    @staticmethod
+    def _entry_line(fragment_id: str, rel: str, offset: int, d: str) -> str:
+        return f"{fragment_id}\t{rel}\t{offset}\t{d}\n"
+
+    def record(self, path: str, written: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """数据文件 path 刚追加了 written=[(偏移, 记录)]：登记新记录，移除 tombstone 目标（调用方持有 _data_lock）"""
+        rel = os.path.relpath(path, self.base_dir)
+        lines = []
+        for offset, item in written:
+            if item.get("type") == "tombstone":
+                if item.get("target_id"):
+                    lines.append(f"{item['target_id']}\t-\n")
+            elif item.get("id"):
+                lines.append(self._entry_line(item["id"], rel, offset, item.get("occurred_date") or ""))
+        with _data_lock():
+            # 刚重建的索引已包含这批记录
+            if not self._ensure_built():
+                self._write(lines)
+
+    def _scan_file(self, path: str, entries: Dict[str, Tuple[str, int, str]]) -> None:
+        rel = os.path.relpath(path, self.base_dir)
+        for offset, raw in _iter_lines_with_offsets(path):
+            item = _parse_json_line(raw)
+            if item is None:
+                continue
+            if item.get("type") == "tombstone":
+                entries.pop(item.get("target_id"), None)
+            elif item.get("id"):
+                entries[item["id"]] = (rel, offset, item.get("occurred_date") or "")
+
+    def reindex_file(self, path: str) -> None:
+        """
+        数据文件被重写（压缩）后更新其中记录的偏移
+
+        整个索引文件写临时文件后 rename（不追加），文件大小保持与有效记录数成正比。
+        只更新原本就登记在这个文件下的 id：tombstone 可能在另一个文件里（分片布局下删除旧文件中的记录），
+        已被它移除的 id 不能因为重新扫描这个文件而复活。
+        """
+        rel = os.path.relpath(path, self.base_dir)
+        entries: Dict[str, Tuple[str, int, str]] = {}
+        with _data_lock():
+            self._ensure_built()
+            self._scan_file(path, entries)
+            with self._lock:
+                self._refresh()
+                merged = {i: e for i, e in self._entries.items() if e[0] != rel}
+                known = {i for i, e in self._entries.items() if e[0] == rel}
+            merged.update((i, e) for i, e in entries.items() if i in known)
+            self._replace(merged)
+
+    def mark(self) -> Optional[Tuple[int, int]]:
+        """
+        索引文件当前的 (inode, 大小)，供 prepare_swap 在锁外读取这一时刻的索引（调用方持有 _data_lock）
+
+        索引文件还不存在时返回 None（此时索引会从数据文件重建，不需要换偏移）
+        """
+        if self._ensure_built():
+            return None
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    def prepare_swap(self, path: str, mark: Tuple[int, int], offsets: Dict[str, Tuple[int, str]]) -> Optional[str]:
+        """
+        压缩数据文件 path 时在锁外调用：读取 mark 时刻的索引，把登记在 path 下的 id 换成 offsets 里的新偏移
+        （不在 offsets 里的已被压缩掉），写入临时文件并返回其路径；索引文件已被替换时返回 None
+
+        只换原本就登记在 path 下的 id，理由同 reindex_file。
+        """
+        rel = os.path.relpath(path, self.base_dir)
+        entries: Dict[str, Tuple[str, int, str]] = {}
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_ino != mark[0]:
+                    return None
+                data = f.read(mark[1])
+        except FileNotFoundError:
+            return None
+        for raw in data.splitlines(keepends=True):
+            self._apply_line(entries, raw)
+
+        tmp_path = f"{self.path}.swap.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for fragment_id, entry in entries.items():
+                if entry[0] == rel:
+                    moved = offsets.get(fragment_id)
+                    if moved is None:
+                        continue
+                    entry = (rel, moved[0], moved[1])
+                f.write(self._entry_line(fragment_id, *entry))
+        return tmp_path
+
+    def commit_swap(self, path: str, mark: Tuple[int, int], tmp_path: Optional[str],
+                    offsets: Dict[str, Tuple[int, str]], tail: Dict[str, Tuple[int, str]]) -> None:
+        """
+        数据文件 path 压缩后的 rename 之后调用（调用方持有 _data_lock）
+
+        tail：压缩期间追加、随尾部一起搬到新文件的记录 id -> (新偏移, 日期)；它们的索引行写在 mark 之后，偏移是旧的。
+        把 mark 之后追加的索引行原样接到 prepare_swap 的临时文件后面，再追加 tail 的新偏移，然后 rename。
+        索引文件在此期间被替换过（另一次压缩 / 重建）时，改为在当前索引后追加所有搬动记录的新偏移。
+        """
+        rel = os.path.relpath(path, self.base_dir)
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if tmp_path is not None and st is not None and st.st_ino == mark[0] and st.st_size >= mark[1]:
+            with open(tmp_path, "ab") as out, open(self.path, "rb") as f:
+                f.seek(mark[1])
+                out.write(f.read())
+                out.write("".join(self._entry_line(i, rel, o, d) for i, (o, d) in tail.items()).encode("utf-8"))
+            os.replace(tmp_path, self.path)
+            return
+
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with self._lock:
+            self._refresh()
+            known = {i for i, e in self._entries.items() if e[0] == rel}
+        moved = dict(offsets)
+        moved.update(tail)
+        self._write([self._entry_line(i, rel, o, d) for i, (o, d) in moved.items() if i in known])
+
+    def _replace(self, entries: Dict[str, Tuple[str, int, str]]) -> None:
+        """用 entries 原子替换索引文件（调用方持有 _data_lock）"""
+        tmp_path = self.path + ".tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for fragment_id, entry in entries.items():
+                f.write(self._entry_line(fragment_id, *entry))
+        os.replace(tmp_path, self.path)
+
+    def _rebuild(self) -> int:
+        entries: Dict[str, Tuple[str, int, str]] = {}
+        for path in self._data_files():
+            self._scan_file(path, entries)
+        self._replace(entries)
+        print(f"[DEBUG] id index: rebuilt {self.path} with {len(entries)} entries")
+        return len(entries)
+
+    def rebuild(self) -> Dict[str, Any]:
+        with _data_lock():
+            count = self._rebuild()
+            self._checked = True
+        return {"ok": True, "entries": count, "path": self.path}
+
+    def lookup(self, fragment_id: str) -> Optional[Tuple[str, int, str]]:
+        """返回 (数据文件绝对路径, 偏移, 日期)"""
+        self._ensure_built()
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(fragment_id)
+        if entry is None:
+            return None
+        rel, offset, d = entry
+        return os.path.join(self.base_dir, rel), offset, d
+
+    def fetch(self, fragment_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """按 id 读取记录：一次 seek + 一行解析；返回 (数据文件路径, 记录)"""
+        for attempt in range(2):
+            entry = self.lookup(fragment_id)
+            if entry is None:
+                return None
+            path, offset, _ = entry
+            item = _read_record_at(path, offset)
+            if item is not None and item.get("id") == fragment_id:
+                return path, item
+            if attempt == 0:
+                print(f"[DEBUG] id index: stale entry for {fragment_id}, reindexing {path}")
+                self.reindex_file(path)
+        return None
+
+
+class _GroupCommitWriter:
+    """
+    组提交写入器：把并发的追加请求合并成一次 write（+ fsync）
+
+    第一个进入的请求成为 leader，把队列里已有的请求一次写完；其余请求等 leader 写完后返回，
+    leader 写入期间到达的请求组成下一批。返回即代表数据已写入文件（读方立即可见），
+    落盘程度由 fsync 策略决定：
+    - always：每个请求写入后各自 fsync
+    - batch：每个合并批次 fsync 一次
+    - interval：请求路径上不 fsync，后台线程每 FSYNC_INTERVAL_MS 对有新写入的文件 fsync 一次
+    """
+
+    def __init__(self, store: "JsonlFragmentStore", policy: str = FSYNC_POLICY,
+                 interval_ms: int = FSYNC_INTERVAL_MS) -> None:
+        if policy not in _FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {policy}（可选 {', '.join(_FSYNC_POLICIES)}）")
+        # 通过 store 取 id_index：enable_id_index() 可能在创建之后才挂上索引
+        self.store = store
+        self.path = store.path
+        self.policy = policy
+        self.interval_ms = interval_ms
+        self._cond = threading.Condition()
+        self._queue: List[Dict[str, Any]] = []
+        self._writing = False
+        # 常驻的追加句柄（只在 _data_lock() 下使用）；fork 之后按 pid 重新打开
+        self._file = None
+        self._pid = os.getpid()
+        self._dirty = False
+        self._fsync_thread: Optional[threading.Thread] = None
+
+    def submit(self, lines: List[bytes], items: List[Dict[str, Any]]) -> None:
+        req: Dict[str, Any] = {"lines": lines, "items": items, "done": False, "error": None}
+        with self._cond:
+            self._queue.append(req)
+            while not req["done"]:
+                if self._writing:
+                    self._cond.wait()
+                    continue
+                self._writing = True
+                batch, self._queue = self._queue, []
+                error: Optional[BaseException] = None
+                self._cond.release()
+                try:
+                    self._write_batch(batch)
+                except BaseException as e:
+                    error = e
+                finally:
+                    self._cond.acquire()
+                for r in batch:
+                    r["done"] = True
+                    r["error"] = error
+                self._writing = False
+                self._cond.notify_all()
+        if req["error"] is not None:
+            raise req["error"]
+
+    def _handle(self):
+        """返回当前数据文件的追加句柄；文件被压缩 / 迁移替换后重新打开（调用方持有 _data_lock()）"""
+        if self._pid != os.getpid():
+            self._file = None
+            self._fsync_thread = None
+            self._pid = os.getpid()
+        if self._file is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return self._file
+            except FileNotFoundError:
+                pass
+            self._close()
+        self._file = open(self.path, "ab")
+        return self._file
+
+    def _close(self) -> None:
+        if self._file is None:
+            return
+        try:
+            if self._dirty:
+                os.fsync(self._file.fileno())
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        self._dirty = False
+
+    def close(self) -> None:
+        """关闭常驻的追加句柄（有未 fsync 的写入时先 fsync）；之后再写入会重新打开"""
+        with _data_lock():
+            self._close()
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with _data_lock():
+            f = self._handle()
+            offset = f.seek(0, os.SEEK_END)
+            written = []
+            if self.policy == "always":
+                for req in batch:
+                    f.write(b"".join(req["lines"]))
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                f.write(b"".join(line for req in batch for line in req["lines"]))
+                f.flush()
+                if self.policy == "batch":
+                    os.fsync(f.fileno())
+                else:
+                    self._dirty = True
+                    self._ensure_fsync_thread()
+            for req in batch:
+                for line, item in zip(req["lines"], req["items"]):
+                    written.append((offset, item))
+                    offset += len(line)
+            if self.store.id_index is not None:
+                self.store.id_index.record(self.path, written)
+            if not _KEEP_OPEN:
+                # Windows 下打开的句柄会挡住压缩的 rename
+                self._close()
+
+    def _ensure_fsync_thread(self) -> None:
+        """调用方持有 _data_lock()"""
+        if self._fsync_thread is not None and self._fsync_thread.is_alive():
+            return
+        self._fsync_thread = threading.Thread(target=self._fsync_loop, name="fragments-fsync", daemon=True)
+        self._fsync_thread.start()
+
+    def _fsync_loop(self) -> None:
+        pid = os.getpid()
+        while pid == os.getpid():
+            time.sleep(self.interval_ms / 1000.0)
+            with _data_lock():
+                if self._file is None:
+                    # 句柄已关闭（close() 时已 fsync）：线程退出，下次写入时再启动
+                    self._fsync_thread = None
+                    return
+                if not self._dirty:
+                    continue
+                try:
+                    os.fsync(self._file.fileno())
+                    self._dirty = False
+                except OSError as e:
+                    print(f"[DEBUG] fsync {self.path} failed: {type(e).__name__}: {e}")
+
+
+class JsonlFragmentStore(FragmentStore):
+    """
+    fragments.jsonl 后端
+
+    - 写入：追加一行；删除：追加 tombstone（O(1)）
+    - 读取：走 _FragmentIndex
+    - 压缩：阈值触发的后台线程或手动 compact()，写临时文件后原子 rename
+    - GROUP_COMMIT 打开时追加走 _GroupCommitWriter
+    """
+
+    def __init__(self, path: str, id_index: Optional[_IdIndex] = None) -> None:
+        self.path = path
+        self.index = _FragmentIndex(path)
+        self.id_index = id_index
+        self._writer = _GroupCommitWriter(self) if GROUP_COMMIT else None
+        # 追加 / 压缩的 rename 都在 _data_lock() 下进行，避免压缩时丢掉（其它进程的）并发追加
+        self._compaction_lock = threading.Lock()
+
+    def close(self) -> None:
+        """释放常驻的文件句柄和进程内索引（分片移出缓存时调用）；之后再使用会重新打开、重建"""
+        self.index.invalidate()
+        if self._writer is not None:
+            self._writer.close()
+
+    def _append_lines(self, items: List[Dict[str, Any]], direct: bool = False) -> None:
+        """direct=True：调用方已持有 _data_lock()，不经过组提交写入器（其 leader 需要同一把锁）"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lines = [(json.dumps(item, ensure_ascii=False, default=json_default) + "\n").encode("utf-8") for item in items]
+        if self._writer is not None and not direct:
+            self._writer.submit(lines, items)
+            return
+        with _data_lock():
+            with open(self.path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(b"".join(lines))
+            if self.id_index is not None:
+                written = []
+                for line, item in zip(lines, items):
+                    written.append((offset, item))
+                    offset += len(line)
+                self.id_index.record(self.path, written)
+
+    def append(self, item: Dict[str, Any]) -> None:
+        self._append_lines([item])
+        _emit_change("append", [item])
+
+    def append_many(self, items: List[Dict[str, Any]]) -> None:
+        if items:
+            self._append_lines(items)
+            _emit_change("append", items)
+
+    def get(self, fragment_id: str) -> Optional[Fragment]:
+        if self.id_index is None:
+            return self.index.get(fragment_id)
+        found = self.id_index.fetch(fragment_id)
+        if found is None or found[0] != self.path:
+            return None
+        return found[1]
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        return self.index.query(date, author)
+
+    def _tombstone(self, target: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": "tombstone",
+            "target_id": target.get("id"),
+            "occurred_date": target.get("occurred_date"),
+            "author": target.get("author"),
+            "created_at": _now_iso(),
+        }
+
+    def delete(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        # 查找和追加 tombstone 在同一个临界区内：并发删除同一条记录时只有一个成功，变更只通知一次
+        with _data_lock():
+            target = self.get(fragment_id)
+            if target is None:
+                return None
+            self.append_tombstones([target], locked=True)
+        self._after_delete([target])
+        return target
+
+    def append_tombstones(self, targets: List[Dict[str, Any]], locked: bool = False) -> None:
+        """
+        追加 tombstone，读取方（索引 / 压缩）据此忽略目标记录；目标可以位于其他文件
+
+        locked=True：调用方持有 _data_lock()，只写入，变更通知由调用方在释放锁后调用 _after_delete
+        """
+        self._append_lines([self._tombstone(t) for t in targets], direct=locked)
+        if not locked:
+            self._after_delete(targets)
+
+    def _after_delete(self, targets: List[Dict[str, Any]]) -> None:
+        _emit_change("delete", targets)
+        self._maybe_schedule_compaction()
+
+    def delete_where(self, date: str, type: Optional[str] = None, author: Optional[str] = None) -> int:
+        with _data_lock():
+            targets = [
+                r for r in self.index.query(date, author)
+                if r.get("id") and (type is None or r.get("type") == type)
+            ]
+            if targets:
+                self.append_tombstones(targets, locked=True)
+        if targets:
+            self._after_delete(targets)
+        return len(targets)
+
+    def iter_range(self, start: str, end: str, author: Optional[str] = None,
+                   after: Optional[Tuple[str, str, str]] = None) -> Iterator[Fragment]:
+        if after is not None:
+            start = max(start, after[0])
+        for d in self.index.dates(start, end):
+            yield from _keyset_rows(self.index.query(d, author), after)
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        items = _read_jsonl(self.path)
+        dead_ids = {i.get("target_id") for i in items if i.get("type") == "tombstone"}
+        for item in items:
+            if item.get("type") == "tombstone" or item.get("id") in dead_ids:
+                continue
+            yield item
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        压缩 JSONL：去掉 tombstone 及其目标记录，写入临时文件后原子 rename
+
+        目标不在本文件里的 tombstone 原样保留：分片布局下删除旧 fragments.jsonl 中的记录时，
+        tombstone 写在分片里，去掉它旧记录就会复活。
+
+        大部分工作在写锁之外完成（包括 id 索引的新文件）；只有追平压缩期间新追加的尾部字节、
+        搬动尾部记录的索引偏移和 rename 时持有写锁。
+
+        Returns:
+            {"ok": true, "before": 行数, "after": 行数} 或 {"ok": true, "skipped": "..."}
+        """
+        path = self.path
+        if not self._compaction_lock.acquire(blocking=False):
+            return {"ok": True, "skipped": "already_running"}
+        try:
+            if not os.path.exists(path):
+                return {"ok": True, "skipped": "missing_file"}
+
+            # 数据文件和 id 索引取同一时刻：在这之前追加的记录，索引行都已写在 mark 之前
+            with _data_lock():
+                st = os.stat(path)
+                mark = self.id_index.mark() if self.id_index is not None else None
+            with open(path, "rb") as f:
+                data = f.read(st.st_size)
+            cut = data.rfind(b"\n") + 1
+            lines = data[:cut].splitlines()
+
+            parsed: List[Tuple[bytes, Dict[str, Any]]] = []
+            ids = set()
+            dead_ids = set()
+            for raw in lines:
+                if not raw.strip():
+                    continue
+                try:
+                    item = json.loads(raw)
+                except Exception:
+                    continue
+                if not isinstance(item, dict):
+                    continue
+                if item.get("type") == "tombstone":
+                    dead_ids.add(item.get("target_id"))
+                elif item.get("id"):
+                    ids.add(item["id"])
+                parsed.append((raw, item))
+
+            # 临时文件按 pid 区分：多个 worker 可能同时压缩，只有一个能通过下面的 inode 检查
+            tmp_path = f"{path}.compact.{os.getpid()}.tmp"
+            kept = 0
+            # 保留下来的记录：id -> (新文件中的偏移, 日期)
+            offsets: Dict[str, Tuple[int, str]] = {}
+            size = 0
+            with open(tmp_path, "wb") as out:
+                for raw, item in parsed:
+                    if item.get("type") == "tombstone":
+                        if item.get("target_id") in ids:
+                            continue
+                    elif item.get("id") in dead_ids:
+                        continue
+                    elif item.get("id"):
+                        offsets[item["id"]] = (size, item.get("occurred_date") or "")
+                    out.write(raw + b"\n")
+                    size += len(raw) + 1
+                    kept += 1
+            idx_tmp = self.id_index.prepare_swap(path, mark, offsets) if mark is not None else None
+
+            with open(tmp_path, "ab") as out, _data_lock():
+                cur = os.stat(path)
+                if cur.st_ino != st.st_ino or cur.st_size < cut:
+                    out.close()
+                    os.remove(tmp_path)
+                    if idx_tmp is not None:
+                        os.remove(idx_tmp)
+                    return {"ok": True, "skipped": "file_changed"}
+                # 追平压缩期间追加的字节（其中的 tombstone 原样保留）
+                with open(path, "rb") as f:
+                    f.seek(cut)
+                    appended = f.read()
+                out.write(appended)
+                out.flush()
+                os.fsync(out.fileno())
+                os.replace(tmp_path, path)
+                if mark is not None:
+                    self.id_index.commit_swap(path, mark, idx_tmp, offsets, _moved_tail(appended, size))
+                elif self.id_index is not None:
+                    self.id_index.reindex_file(path)
+
+            self.index.invalidate()
+            print(f"[DEBUG] Compacted {path}: {len(lines)} -> {kept} lines")
+            # 旧快照随 inode 一起失效：马上为新文件写快照，避免每个进程各自全量重建
+            self.index.checkpoint()
+            return {"ok": True, "before": len(lines), "after": kept}
+        finally:
+            self._compaction_lock.release()
+
+    def _maybe_schedule_compaction(self) -> None:
+        """删除后检查阈值，满足时在后台线程压缩，不占用请求路径"""
+        if self._compaction_lock.locked():
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < COMPACT_MIN_BYTES:
+            return
+        if self.index.dead_ratio() < COMPACT_DEAD_RATIO:
+            return
+        threading.Thread(target=self.compact, name="fragments-compaction", daemon=True).start()
+
+
+def _moved_tail(appended: bytes, base: int) -> Dict[str, Tuple[int, str]]:
+    """压缩时原样搬到新文件末尾（从 base 开始）的记录：id -> (新偏移, 日期)，去掉同在尾部被 tombstone 的"""
+    out: Dict[str, Tuple[int, str]] = {}
+    offset = base
+    for raw in appended.splitlines(keepends=True):
+        item = _parse_json_line(raw)
+        if item is not None:
+            if item.get("type") == "tombstone":
+                out.pop(item.get("target_id"), None)
+            elif item.get("id"):
+                out[item["id"]] = (offset, item.get("occurred_date") or "")
+        offset += len(raw)
+    return out
+
+
+class PartitionedFragmentStore(FragmentStore):
+    """
+    按日期分片的 JSONL 后端：fragments/YYYY/MM/DD.jsonl
+
+    - 写入 / 按日查询 / 删除 / summary 重写都只打开对应日期的分片
+    - 迁移期间旧的 fragments.jsonl 仍然可读：同一天的结果 = 旧文件中未被分片 tombstone、
+      也未被拷贝到分片的记录 + 分片中的记录；删除旧文件中的记录时 tombstone 写到对应日期的分片
+    - 最近使用的 PARTITION_CACHE_SIZE 个分片保留进程内索引和文件句柄，更早的分片被关闭，
+      按日期扫描大范围时打开的文件数不随范围增长
+    """
+
+    def __init__(self, root: str, legacy_path: str) -> None:
+        self.root = root
+        self.id_index: Optional[_IdIndex] = None
+        self.legacy = JsonlFragmentStore(legacy_path)
+        self._partitions: "OrderedDict[str, JsonlFragmentStore]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def partition_path(self, date: str) -> str:
+        m = _DATE_RE.match(date or "")
+        if not m:
+            raise ValueError(f"invalid occurred_date: {date!r}")
+        year, month, day = m.groups()
+        return os.path.join(self.root, year, month, f"{day}.jsonl")
+
+    def partition(self, date: str) -> JsonlFragmentStore:
+        path = self.partition_path(date)
+        evicted: List[JsonlFragmentStore] = []
+        with self._lock:
+            store = self._partitions.get(date)
+            if store is None:
+                store = self._partitions[date] = JsonlFragmentStore(path, self.id_index)
+                while len(self._partitions) > max(PARTITION_CACHE_SIZE, 1):
+                    evicted.append(self._partitions.popitem(last=False)[1])
+            else:
+                self._partitions.move_to_end(date)
+        # 关闭写入句柄要拿 _data_lock()：在本锁之外进行（持有 _data_lock() 的调用方也会进来取分片）
+        for old in evicted:
+            old.close()
+        return store
+
+    def enable_id_index(self, path: str) -> None:
+        self.id_index = self.legacy.id_index = _IdIndex(path, DATA_DIR, self.data_files)
+
+    def data_files(self) -> List[str]:
+        """旧文件在前，分片按日期升序（id 索引重建时后出现的 tombstone 覆盖先出现的记录）"""
+        files = [self.legacy.path] if self._has_legacy() else []
+        return files + [self.partition_path(d) for d in self.partition_dates()]
+
+    def partition_dates(self) -> List[str]:
+        """磁盘上已有分片的日期（升序）"""
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for year in sorted(os.listdir(self.root)):
+            year_dir = os.path.join(self.root, year)
+            if not os.path.isdir(year_dir):
+                continue
+            for month in sorted(os.listdir(year_dir)):
+                month_dir = os.path.join(year_dir, month)
+                if not os.path.isdir(month_dir):
+                    continue
+                for name in sorted(os.listdir(month_dir)):
+                    if name.endswith(".jsonl"):
+                        d = f"{year}-{month}-{name[:-len('.jsonl')]}"
+                        if _DATE_RE.match(d):
+                            out.append(d)
+        return out
+
+    def _has_legacy(self) -> bool:
+        return os.path.exists(self.legacy.path)
+
+    def append(self, item: Dict[str, Any]) -> None:
+        self.partition(item.get("occurred_date")).append(item)
+
+    def append_many(self, items: List[Dict[str, Any]]) -> None:
+        by_date: Dict[str, List[Dict[str, Any]]] = {}
+        for item in items:
+            by_date.setdefault(item.get("occurred_date"), []).append(item)
+        for d, group in by_date.items():
+            self.partition(d).append_many(group)
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        if not _DATE_RE.match(date or ""):
+            return []
+        rows, tombstoned = self.partition(date).index.query_with_tombstones(date, author)
+        return self._with_legacy(date, author, rows, tombstoned)
+
+    def _with_legacy(self, date: str, author: Optional[str], rows: List[Dict[str, Any]],
+                     tombstoned: set) -> List[Dict[str, Any]]:
+        """迁移期间：把旧文件里这一天的记录（去掉分片中已删除 / 已复制的）合并到分片记录之前"""
+        if not self._has_legacy():
+            return rows
+        seen = {r.get("id") for r in rows}
+        legacy_rows = [
+            r for r in self.legacy.query(date, author)
+            if r.get("id") not in tombstoned and r.get("id") not in seen
+        ]
+        return legacy_rows + rows
+
+    def _find(self, fragment_id: str, occurred_date: Optional[str]) -> Optional[Fragment]:
+        if self.id_index is not None:
+            found = self.id_index.fetch(fragment_id)
+            if found is not None:
+                return found[1]
+            # id 索引没有登记（例如索引文件落后于数据文件）：退回到扫描分片
+        if occurred_date and _DATE_RE.match(occurred_date):
+            found = self.partition(occurred_date).index.get(fragment_id)
+            if found is not None:
+                return found
+        if self._has_legacy():
+            found = self.legacy.index.get(fragment_id)
+            if found is not None and not self.partition(found.get("occurred_date")).index.is_tombstoned(fragment_id):
+                return found
+        if occurred_date:
+            return None
+        # 没有日期提示：从最新的分片往前找
+        for d in reversed(self.partition_dates()):
+            found = self.partition(d).index.get(fragment_id)
+            if found is not None:
+                if self.id_index is not None:
+                    print(f"[DEBUG] id index: {fragment_id} missing from index, found in partition {d}")
+                return found
+        return None
+
+    def get(self, fragment_id: str) -> Optional[Fragment]:
+        return self._find(fragment_id, None)
+
+    def delete(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        # 同 JsonlFragmentStore.delete：查找和追加 tombstone 在同一个临界区内
+        with _data_lock():
+            target = self._find(fragment_id, occurred_date)
+            if target is None and occurred_date:
+                # 日期提示不准：退回到全量查找
+                target = self._find(fragment_id, None)
+            if target is None:
+                return None
+            part = self.partition(target.get("occurred_date"))
+            part.append_tombstones([target], locked=True)
+        part._after_delete([target])
+        return target
+
+    def delete_where(self, date: str, type: Optional[str] = None, author: Optional[str] = None) -> int:
+        part = self.partition(date)
+        with _data_lock():
+            targets = [
+                r for r in self.query(date, author)
+                if r.get("id") and (type is None or r.get("type") == type)
+            ]
+            if targets:
+                part.append_tombstones(targets, locked=True)
+        if targets:
+            part._after_delete(targets)
+        return len(targets)
+
+    def iter_range(self, start: str, end: str, author: Optional[str] = None,
+                   after: Optional[Tuple[str, str, str]] = None) -> Iterator[Fragment]:
+        if after is not None:
+            start = max(start, after[0])
+        dates = {d for d in self.partition_dates() if start <= d <= end}
+        if self._has_legacy():
+            dates.update(d for d in self.legacy.index.dates(start, end) if _DATE_RE.match(d))
+        for d in sorted(dates):
+            # 已加载的分片走索引；其余分片直接读文件，不为一次导出常驻整个范围的索引
+            store = self._partitions.get(d)
+            if store is not None:
+                rows, tombstoned = store.index.query_with_tombstones(d, author)
+            else:
+                rows, tombstoned = _scan_live_rows(self.partition_path(d), author)
+            yield from _keyset_rows(self._with_legacy(d, author, rows, tombstoned), after)
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        dates = self.partition_dates()
+        if self._has_legacy():
+            legacy_dates = sorted({r.get("occurred_date") for r in self.legacy.iter_all() if r.get("occurred_date")})
+            dates = sorted(set(dates) | {d for d in legacy_dates if _DATE_RE.match(d)})
+        for d in dates:
+            yield from self.query(d)
+
+    def compact(self) -> Dict[str, Any]:
+        results = {
+            d: self.partition(d).compact()
+            for d in self.partition_dates()
+            if self.partition(d).index.dead_ratio() > 0
+        }
+        if self._has_legacy():
+            results["legacy"] = self.legacy.compact()
+        return {"ok": True, "partitions": results}
+
+    def convert_legacy(self) -> Dict[str, Any]:
+        """
+        把旧的 fragments.jsonl 拆分到分片，完成后重命名为 fragments.jsonl.migrated
+
+        转换过程中服务可以继续读写：查询会按 id 去重，已被分片 tombstone 的记录不会复活。
+        """
+        if not self._has_legacy():
+            return {"ok": True, "skipped": "no_legacy_file"}
+
+        by_date: Dict[str, List[Dict[str, Any]]] = {}
+        skipped = 0
+        for item in self.legacy.iter_all():
+            d = item.get("occurred_date")
+            if not _DATE_RE.match(d or ""):
+                skipped += 1
+                continue
+            by_date.setdefault(d, []).append(item)
+
+        copied = 0
+        for d, items in sorted(by_date.items()):
+            part = self.partition(d)
+            rows, tombstoned = part.index.query_with_tombstones(d)
+            existing = {r.get("id") for r in rows} | tombstoned
+            todo = [i for i in items if not i.get("id") or i.get("id") not in existing]
+            if todo:
+                part._append_lines(todo)
+                copied += len(todo)
+
+        backup = self.legacy.path + ".migrated"
+        with _data_lock():
+            os.replace(self.legacy.path, backup)
+            # 旧文件里的条目指向已改名的文件：同一临界区内按分片重建 id 索引
+            if self.id_index is not None:
+                self.id_index.rebuild()
+        self.legacy.index.invalidate()
+        print(f"[DEBUG] partition: copied {copied} fragments into {len(by_date)} partitions, legacy -> {backup}")
+        return {"ok": True, "copied": copied, "partitions": len(by_date), "skipped": skipped, "backup": backup}
+
+
+def _load_clock_json(path: str) -> Dict[str, Dict[str, Any]]:
+    """读取 v1.0 的 clock.json：{date: {event_type: state}}"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f) or {}
+    except Exception:
+        return {}
+
+
+class EventLogClockStore(ClockStore):
+    """
+    打卡事件日志后端：clock_events.jsonl，每次打卡追加一行 {"date", "event_type", "state"}
+
+    - 写入 O(1)：只追加一行，不再整体重写 clock.json
+    - 读取：进程内维护 date -> event_type -> state 的快照，tail read 追上新事件，按日查询 O(1)
+    - 首次使用时若只有旧的 clock.json，自动导入为事件并重命名为 clock.json.migrated
+    - compact() 只保留每个 (date, event_type) 的最新状态
+    """
+
+    def __init__(self, path: str, legacy_path: str) -> None:
+        self.path = path
+        self.legacy_path = legacy_path
+        # 只保护进程内快照；文件写入在 _data_lock() 下进行，持有本锁时不去拿文件锁
+        self._state_lock = threading.Lock()
+        self._tail = _TailReader(path)
+        self._days: Dict[str, Dict[str, Any]] = {}
+        self._imported = False
+
+    @staticmethod
+    def _event_line(date: str, event_type: str, state: Dict[str, Any]) -> str:
+        return json.dumps({"date": date, "event_type": event_type, "state": state}, ensure_ascii=False) + "\n"
+
+    def _write_snapshot(self, days: Dict[str, Dict[str, Any]]) -> None:
+        """把 days 写成新的事件日志（临时文件 + 原子 rename；调用方持有 _data_lock）"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for d, day in days.items():
+                for event_type, state in (day or {}).items():
+                    f.write(self._event_line(d, event_type, state))
+        os.replace(tmp_path, self.path)
+
+    def _import_legacy(self) -> None:
+        if self._imported:
+            return
+        with _data_lock():
+            if not self._imported:
+                if not os.path.exists(self.path) and os.path.exists(self.legacy_path):
+                    days = _load_clock_json(self.legacy_path)
+                    self._write_snapshot(days)
+                    os.replace(self.legacy_path, self.legacy_path + ".migrated")
+                    print(f"[DEBUG] clock: imported {len(days)} days from {self.legacy_path}")
+                self._imported = True
+
+    def _refresh(self) -> None:
+        rebuilt, lines = self._tail.read()
+        if rebuilt:
+            self._days = {}
+        for _, raw in lines:
+            event = _parse_json_line(raw)
+            if event is None or not event.get("date") or not event.get("event_type"):
+                continue
+            self._days.setdefault(event["date"], {})[event["event_type"]] = event.get("state")
+
+    def get_day(self, date: str) -> Dict[str, Any]:
+        self._import_legacy()
+        with self._state_lock:
+            self._refresh()
+            return dict(self._days.get(date, {}))
+
+    def set_event(self, date: str, event_type: str, state: Dict[str, Any]) -> None:
+        line = self._event_line(date, event_type, state)
+        with _data_lock():
+            self._import_legacy()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def load_all(self) -> Dict[str, Dict[str, Any]]:
+        self._import_legacy()
+        with self._state_lock:
+            self._refresh()
+            return {d: dict(day) for d, day in self._days.items()}
+
+    def compact(self) -> Dict[str, Any]:
+        with _data_lock():
+            days = self.load_all()
+            self._write_snapshot(days)
+        return {"ok": True, "days": len(days)}
+
+
+class EventLogSummaryStore(SummaryStore):
+    """
+    日报日志后端：summaries.jsonl，每次生成日报追加一行完整记录，同一 (occurred_date, author) 以最后一行为准
+
+    - 写入 O(1)：只追加一行，不必在碎片文件里删除旧日报
+    - 删除追加 {"type": "tombstone", "target_id", "occurred_date", "author"}
+    - 读取：进程内维护 date -> author -> 记录，tail read 追上其它进程的写入
+    - compact() 只保留每个 (date, author) 的当前记录
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._state_lock = threading.Lock()
+        self._tail = _TailReader(path)
+        self._days: Dict[str, Dict[str, Fragment]] = {}
+
+    def _refresh(self) -> None:
+        rebuilt, lines = self._tail.read()
+        if rebuilt:
+            self._days = {}
+        for _, raw in lines:
+            item = _parse_json_line(raw)
+            if item is None or not item.get("occurred_date"):
+                continue
+            day = self._days.setdefault(item["occurred_date"], {})
+            author = item.get("author") or ""
+            if item.get("type") == "tombstone":
+                current = day.get(author)
+                if current is not None and current.get("id") == item.get("target_id"):
+                    del day[author]
+            else:
+                day[author] = Fragment.from_dict(item)
+
+    def _write_lines(self, items: List[Dict[str, Any]]) -> None:
+        """调用方持有 _data_lock"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(i, ensure_ascii=False, default=json_default) + "\n" for i in items))
+
+    def get(self, date: str, author: str) -> Optional[Fragment]:
+        with self._state_lock:
+            self._refresh()
+            return self._days.get(date, {}).get(author or "")
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        with self._state_lock:
+            self._refresh()
+            day = self._days.get(date, {})
+            if author:
+                return [day[author]] if author in day else []
+            return list(day.values())
+
+    def put(self, item: Dict[str, Any]) -> Optional[Fragment]:
+        previous = self.put_many([item])
+        return previous[0] if previous else None
+
+    def put_many(self, items: List[Dict[str, Any]]) -> List[Fragment]:
+        # 在文件锁内读取旧记录再追加：并发覆盖时每个写入者看到的“旧记录”都是前一个写入者的
+        if not items:
+            return []
+        with _data_lock():
+            with self._state_lock:
+                self._refresh()
+                found = (self._days.get(i.get("occurred_date"), {}).get(i.get("author") or "") for i in items)
+                previous = [p for p in found if p is not None]
+            self._write_lines(items)
+        if previous:
+            _emit_change("delete", previous)
+        _emit_change("append", items)
+        return previous
+
+    def _find(self, fragment_id: str, occurred_date: Optional[str]) -> Optional[Fragment]:
+        """调用方持有 _state_lock 且已 _refresh"""
+        days = [self._days.get(occurred_date, {})] if occurred_date else self._days.values()
+        for day in days:
+            for item in day.values():
+                if item.get("id") == fragment_id:
+                    return item
+        return None
+
+    def get_by_id(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        with self._state_lock:
+            self._refresh()
+            return self._find(fragment_id, occurred_date)
+
+    def delete(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        with _data_lock():
+            target = self.get_by_id(fragment_id, occurred_date)
+            if target is None:
+                return None
+            self._write_lines([{
+                "type": "tombstone",
+                "target_id": fragment_id,
+                "occurred_date": target.get("occurred_date"),
+                "author": target.get("author"),
+                "created_at": _now_iso(),
+            }])
+        _emit_change("delete", [target])
+        return target
+
+    def iter_all(self) -> Iterator[Fragment]:
+        with self._state_lock:
+            self._refresh()
+            items = [item for day in self._days.values() for item in day.values()]
+        return iter(items)
+
+    def compact(self) -> Dict[str, Any]:
+        with _data_lock():
+            items = list(self.iter_all())
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False, default=json_default) + "\n")
+            os.replace(tmp_path, self.path)
+        return {"ok": True, "summaries": len(items)}
+
+
+# =========================
+# 3) SQLite 后端
+# =========================
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fragments (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    type TEXT,
+    occurred_date TEXT,
+    author TEXT,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_fragments_id ON fragments(id);
+CREATE INDEX IF NOT EXISTS idx_fragments_date_author ON fragments(occurred_date, author, seq);
+CREATE INDEX IF NOT EXISTS idx_fragments_keyset ON fragments(occurred_date, created_at, id);
+CREATE TABLE IF NOT EXISTS clock (
+    date TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (date, event_type)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    occurred_date TEXT NOT NULL,
+    author TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (occurred_date, author)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_summaries_id ON summaries(id);
+"""
+
+
+class _SqliteDatabase:
+    """每个线程一个连接（sqlite3 连接不能跨线程共享，也不能跨 fork 使用）"""
+
+    def __init__(self, path: str, schema: str = _SQLITE_SCHEMA) -> None:
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) != os.getpid():
+            conn = None
+        if conn is None:
+            _ensure_data_dir()
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SqliteFragmentStore(FragmentStore):
+    def __init__(self, db: _SqliteDatabase) -> None:
+        self.db = db
+
+    @staticmethod
+    def _row(item: Dict[str, Any]) -> Tuple[Any, ...]:
+        return (
+            item.get("id"),
+            item.get("type"),
+            item.get("occurred_date"),
+            item.get("author"),
+            item.get("created_at"),
+            json.dumps(item, ensure_ascii=False, default=json_default),
+        )
+
+    def append(self, item: Dict[str, Any]) -> None:
+        self.append_many([item])
+
+    def append_many(self, items: List[Dict[str, Any]]) -> None:
+        conn = self.db.conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO fragments (id, type, occurred_date, author, created_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [self._row(item) for item in items],
+            )
+        _emit_change("append", items)
+
+    def get_many(self, fragment_ids: List[str]) -> List[Fragment]:
+        found: Dict[str, Fragment] = {}
+        conn = self.db.conn()
+        for k in range(0, len(fragment_ids), 500):
+            chunk = fragment_ids[k:k + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for fragment_id, data in conn.execute(f"SELECT id, data FROM fragments WHERE id IN ({placeholders})", chunk):
+                found[fragment_id] = Fragment.from_dict(json.loads(data))
+        return [found[i] for i in fragment_ids if i in found]
+
+    def get(self, fragment_id: str) -> Optional[Fragment]:
+        row = self.db.conn().execute("SELECT data FROM fragments WHERE id = ?", (fragment_id,)).fetchone()
+        return Fragment.from_dict(json.loads(row[0])) if row else None
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        conn = self.db.conn()
+        if author is None or author == "":
+            rows = conn.execute(
+                "SELECT data FROM fragments WHERE occurred_date = ? ORDER BY seq", (date,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT data FROM fragments WHERE occurred_date = ? AND author = ? ORDER BY seq",
+                (date, author),
+            ).fetchall()
+        return [Fragment.from_dict(json.loads(r[0])) for r in rows]
+
+    def delete(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        conn = self.db.conn()
+        with conn:
+            row = conn.execute("SELECT data FROM fragments WHERE id = ?", (fragment_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM fragments WHERE id = ?", (fragment_id,))
+        target = Fragment.from_dict(json.loads(row[0]))
+        _emit_change("delete", [target])
+        return target
+
+    def delete_where(self, date: str, type: Optional[str] = None, author: Optional[str] = None) -> int:
+        where = "occurred_date = ?"
+        params: List[Any] = [date]
+        if type is not None:
+            where += " AND type = ?"
+            params.append(type)
+        if author:
+            where += " AND author = ?"
+            params.append(author)
+        conn = self.db.conn()
+        with conn:
+            rows = conn.execute(f"SELECT data FROM fragments WHERE {where}", params).fetchall()
+            conn.execute(f"DELETE FROM fragments WHERE {where}", params)
+        _emit_change("delete", [Fragment.from_dict(json.loads(r[0])) for r in rows])
+        return len(rows)
+
+    def iter_range(self, start: str, end: str, author: Optional[str] = None,
+                   after: Optional[Tuple[str, str, str]] = None) -> Iterator[Fragment]:
+        sql = "SELECT data FROM fragments WHERE occurred_date BETWEEN ? AND ?"
+        params: List[Any] = [start, end]
+        if author:
+            sql += " AND author = ?"
+            params.append(author)
+        if after is not None:
+            # 行值比较可以直接从 (occurred_date, created_at, id) 索引上定位
+            sql += " AND (occurred_date, created_at, id) > (?, ?, ?)"
+            params.extend(after)
+        sql += " ORDER BY occurred_date, created_at, id"
+        for (data,) in self.db.conn().execute(sql, params):
+            yield Fragment.from_dict(json.loads(data))
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        for (data,) in self.db.conn().execute("SELECT data FROM fragments ORDER BY seq"):
+            yield json.loads(data)
+
+
+class SqliteClockStore(ClockStore):
+    def __init__(self, db: _SqliteDatabase) -> None:
+        self.db = db
+
+    def get_day(self, date: str) -> Dict[str, Any]:
+        rows = self.db.conn().execute("SELECT event_type, data FROM clock WHERE date = ?", (date,)).fetchall()
+        return {event_type: json.loads(data) for event_type, data in rows}
+
+    def set_event(self, date: str, event_type: str, state: Dict[str, Any]) -> None:
+        conn = self.db.conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO clock (date, event_type, data) VALUES (?, ?, ?)",
+                (date, event_type, json.dumps(state, ensure_ascii=False)),
+            )
+
+    def load_all(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for date, event_type, data in self.db.conn().execute("SELECT date, event_type, data FROM clock"):
+            out.setdefault(date, {})[event_type] = json.loads(data)
+        return out
+
+
+class SqliteSummaryStore(SummaryStore):
+    def __init__(self, db: _SqliteDatabase) -> None:
+        self.db = db
+
+    def get(self, date: str, author: str) -> Optional[Fragment]:
+        row = self.db.conn().execute(
+            "SELECT data FROM summaries WHERE occurred_date = ? AND author = ?", (date, author or "")
+        ).fetchone()
+        return Fragment.from_dict(json.loads(row[0])) if row else None
+
+    def query(self, date: str, author: Optional[str] = None) -> List[Fragment]:
+        if author:
+            item = self.get(date, author)
+            return [item] if item is not None else []
+        rows = self.db.conn().execute("SELECT data FROM summaries WHERE occurred_date = ? ORDER BY author", (date,))
+        return [Fragment.from_dict(json.loads(r[0])) for r in rows]
+
+    def put(self, item: Dict[str, Any]) -> Optional[Fragment]:
+        previous = self.put_many([item])
+        return previous[0] if previous else None
+
+    def put_many(self, items: List[Dict[str, Any]]) -> List[Fragment]:
+        if not items:
+            return []
+        conn = self.db.conn()
+        previous: List[Fragment] = []
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for item in items:
+                key = (item.get("occurred_date"), item.get("author") or "")
+                row = conn.execute("SELECT data FROM summaries WHERE occurred_date = ? AND author = ?", key).fetchone()
+                if row:
+                    previous.append(Fragment.from_dict(json.loads(row[0])))
+            conn.executemany(
+                "INSERT OR REPLACE INTO summaries (occurred_date, author, id, data) VALUES (?, ?, ?, ?)",
+                [(i.get("occurred_date"), i.get("author") or "", i.get("id"),
+                  json.dumps(i, ensure_ascii=False, default=json_default)) for i in items],
+            )
+        if previous:
+            _emit_change("delete", previous)
+        _emit_change("append", items)
+        return previous
+
+    def get_by_id(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        row = self.db.conn().execute("SELECT data FROM summaries WHERE id = ?", (fragment_id,)).fetchone()
+        return Fragment.from_dict(json.loads(row[0])) if row else None
+
+    def delete(self, fragment_id: str, occurred_date: Optional[str] = None) -> Optional[Fragment]:
+        conn = self.db.conn()
+        with conn:
+            row = conn.execute("SELECT data FROM summaries WHERE id = ?", (fragment_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM summaries WHERE id = ?", (fragment_id,))
+        target = Fragment.from_dict(json.loads(row[0]))
+        _emit_change("delete", [target])
+        return target
+
+    def iter_all(self) -> Iterator[Fragment]:
+        for (data,) in self.db.conn().execute("SELECT data FROM summaries ORDER BY occurred_date, author"):
+            yield Fragment.from_dict(json.loads(data))
+
+
+# =========================
+# 4) 后端选择（进程内单例）
+# =========================
+
+_STORES: Dict[str, Any] = {}
+_STORES_LOCK = threading.Lock()
+_STORES_PID = os.getpid()
+
+
+def _check_fork() -> None:
+    """pre-fork 服务器的 worker：丢弃从父进程继承的存储对象（索引、线程锁、句柄），按需重建"""
+    global _STORES_PID, _STORES_LOCK
+    if _STORES_PID != os.getpid():
+        _STORES_LOCK = threading.Lock()
+        _STORES.clear()
+        _STORES_PID = os.getpid()
+
+
+def _get_sqlite_db() -> _SqliteDatabase:
+    _check_fork()
+    with _STORES_LOCK:
+        db = _STORES.get("sqlite_db")
+        if db is None:
+            db = _STORES["sqlite_db"] = _SqliteDatabase(SQLITE_PATH)
+        return db
+
+
+def get_fragment_store() -> FragmentStore:
+    _check_fork()
+    store = _STORES.get("fragments")
+    if store is None:
+        if STORAGE_BACKEND == "sqlite":
+            store = SqliteFragmentStore(_get_sqlite_db())
+        elif STORAGE_BACKEND == "jsonl" and FRAGMENTS_LAYOUT == "partitioned":
+            store = PartitionedFragmentStore(PARTITIONS_DIR, FRAGMENTS_PATH)
+            store.enable_id_index(ID_INDEX_PATH)
+        elif STORAGE_BACKEND == "jsonl":
+            store = JsonlFragmentStore(FRAGMENTS_PATH, _IdIndex(ID_INDEX_PATH, DATA_DIR, lambda: [FRAGMENTS_PATH]))
+        else:
+            raise RuntimeError(f"未知的 STORAGE_BACKEND: {STORAGE_BACKEND}")
+        with _STORES_LOCK:
+            store = _STORES.setdefault("fragments", store)
+    return store
+
+
+def get_clock_store() -> ClockStore:
+    _check_fork()
+    store = _STORES.get("clock")
+    if store is None:
+        if STORAGE_BACKEND == "sqlite":
+            store = SqliteClockStore(_get_sqlite_db())
+        elif STORAGE_BACKEND == "jsonl":
+            store = EventLogClockStore(CLOCK_EVENTS_PATH, CLOCK_PATH)
+        else:
+            raise RuntimeError(f"未知的 STORAGE_BACKEND: {STORAGE_BACKEND}")
+        with _STORES_LOCK:
+            store = _STORES.setdefault("clock", store)
+    return store
+
+
+def get_summary_store() -> SummaryStore:
+    _check_fork()
+    store = _STORES.get("summaries")
+    if store is None:
+        if STORAGE_BACKEND == "sqlite":
+            store = SqliteSummaryStore(_get_sqlite_db())
+        elif STORAGE_BACKEND == "jsonl":
+            store = EventLogSummaryStore(SUMMARIES_PATH)
+        else:
+            raise RuntimeError(f"未知的 STORAGE_BACKEND: {STORAGE_BACKEND}")
+        with _STORES_LOCK:
+            store = _STORES.setdefault("summaries", store)
+    return store
+
+
+def iter_all_records() -> Iterator[Dict[str, Any]]:
+    """碎片与日报的全部有效记录（派生索引重建 / 校验用）"""
+    yield from get_fragment_store().iter_all()
+    yield from get_summary_store().iter_all()
+
+
+def migrate_jsonl_to_sqlite() -> Dict[str, Any]:
+    """
+    一次性迁移：fragments.jsonl / 分片（已应用 tombstone）、打卡记录与日报导入 SQLite
+
+    按 id 去重（INSERT OR IGNORE），日报只导入 SQLite 里还没有的 (date, author)，重复执行是安全的。
+    """
+    db = _get_sqlite_db()
+    fragments = SqliteFragmentStore(db)
+    clock = SqliteClockStore(db)
+
+    batch: List[Dict[str, Any]] = []
+    total = 0
+    source = PartitionedFragmentStore(PARTITIONS_DIR, FRAGMENTS_PATH) if FRAGMENTS_LAYOUT == "partitioned" else JsonlFragmentStore(FRAGMENTS_PATH)
+    for item in source.iter_all():
+        batch.append(item)
+        if len(batch) >= 1000:
+            fragments.append_many(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        fragments.append_many(batch)
+        total += len(batch)
+
+    days = EventLogClockStore(CLOCK_EVENTS_PATH, CLOCK_PATH).load_all()
+    events = 0
+    for d, day in days.items():
+        for event_type, state in (day or {}).items():
+            clock.set_event(d, event_type, state)
+            events += 1
+
+    summaries = SqliteSummaryStore(db)
+    summary_count = 0
+    for item in EventLogSummaryStore(SUMMARIES_PATH).iter_all():
+        if summaries.get(item.get("occurred_date"), item.get("author")) is None:
+            summaries.put(item.to_dict())
+            summary_count += 1
+
+    print(f"[DEBUG] migrate: {total} fragments, {events} clock events, {summary_count} summaries -> {SQLITE_PATH}")
+    return {"ok": True, "fragments": total, "clock_events": events, "summaries": summary_count, "path": SQLITE_PATH}
+
+
+def convert_to_partitions() -> Dict[str, Any]:
+    """把单文件 fragments.jsonl 转换为按日期分片的布局（同时更新 id 索引）"""
+    store = PartitionedFragmentStore(PARTITIONS_DIR, FRAGMENTS_PATH)
+    store.enable_id_index(ID_INDEX_PATH)
+    return store.convert_legacy()
+
+
+def rebuild_id_index() -> Dict[str, Any]:
+    """从数据文件重建 fragment_ids.idx"""
+    store = get_fragment_store()
+    id_index = getattr(store, "id_index", None)
+    if id_index is None:
+        return {"ok": True, "skipped": "backend_has_no_id_index"}
+    return id_index.rebuild()
@@ -0,0 +1,226 @@
+# tag_index.py
+# 标签倒排索引：tag -> 碎片（按 occurred_date, created_at, id 排序），以及每个作者的标签计数
+#
+# - 索引存放在 DATA_DIR/tags.db（SQLite），通过 storage 的变更通知在写入 / 删除后同步更新，与存储后端无关
+# - 按标签过滤的查询只在索引里取出 id，再按 id 从存储读取记录（不扫描当天 / 范围内的全部记录）
+# - tags.db 不存在时（首次启用）从存储全量构建一次；python manage.py rebuild-tag-index 可手动重建
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import DATA_DIR, _SqliteDatabase
+
+TAG_DB_PATH = os.path.join(DATA_DIR, "tags.db")
+
+_TAG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tagged (
+    id TEXT PRIMARY KEY,
+    author TEXT NOT NULL,
+    occurred_date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    tags TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tag_postings (
+    tag TEXT NOT NULL,
+    occurred_date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    id TEXT NOT NULL,
+    author TEXT NOT NULL,
+    PRIMARY KEY (tag, occurred_date, created_at, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_tag_postings_author ON tag_postings(tag, author, occurred_date, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tag_postings_date ON tag_postings(occurred_date, author, tag);
+CREATE TABLE IF NOT EXISTS tag_counts (
+    author TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (author, tag)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_tags(tags: Any) -> List[str]:
+    """去掉首尾空白、空标签和重复标签（保持原顺序）"""
+    if isinstance(tags, str):
+        tags = [tags]
+    if not isinstance(tags, (list, tuple)):
+        return []
+    out: List[str] = []
+    for tag in tags:
+        tag = str(tag).strip()
+        if tag and tag not in out:
+            out.append(tag)
+    return out
+
+
+class TagIndex:
+    """
+    tagged 保存已建索引的碎片（删除时据此撤销 postings / 计数，重复通知按 id 幂等）；
+    tag_postings 是倒排表；tag_counts 是每个作者的标签计数（不带日期范围的 facets 直接读它）
+    """
+
+    def __init__(self, path: str) -> None:
+        self.db = _SqliteDatabase(path, _TAG_SCHEMA)
+
+    def add(self, items: Iterable[Any]) -> int:
+        conn = self.db.conn()
+        added = 0
+        with conn:
+            for item in items:
+                fragment_id = item.get("id")
+                tags = normalize_tags(item.get("tags"))
+                if not fragment_id or not tags or item.get("type") == "tombstone":
+                    continue
+                author = item.get("author") or ""
+                occurred_date = item.get("occurred_date") or ""
+                created_at = item.get("created_at") or ""
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO tagged (id, author, occurred_date, created_at, tags) VALUES (?, ?, ?, ?, ?)",
+                    (fragment_id, author, occurred_date, created_at, json.dumps(tags, ensure_ascii=False)),
+                )
+                if cur.rowcount == 0:
+                    continue
+                conn.executemany(
+                    "INSERT OR IGNORE INTO tag_postings (tag, occurred_date, created_at, id, author) VALUES (?, ?, ?, ?, ?)",
+                    [(tag, occurred_date, created_at, fragment_id, author) for tag in tags],
+                )
+                conn.executemany(
+                    "INSERT INTO tag_counts (author, tag, n) VALUES (?, ?, 1) "
+                    "ON CONFLICT(author, tag) DO UPDATE SET n = n + 1",
+                    [(author, tag) for tag in tags],
+                )
+                added += 1
+        return added
+
+    def remove(self, fragment_ids: Iterable[str]) -> int:
+        conn = self.db.conn()
+        removed = 0
+        with conn:
+            for fragment_id in fragment_ids:
+                row = conn.execute(
+                    "SELECT author, occurred_date, created_at, tags FROM tagged WHERE id = ?", (fragment_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                author, occurred_date, created_at, tags = row[0], row[1], row[2], json.loads(row[3])
+                conn.executemany(
+                    "DELETE FROM tag_postings WHERE tag = ? AND occurred_date = ? AND created_at = ? AND id = ?",
+                    [(tag, occurred_date, created_at, fragment_id) for tag in tags],
+                )
+                conn.executemany("UPDATE tag_counts SET n = n - 1 WHERE author = ? AND tag = ?", [(author, tag) for tag in tags])
+                conn.execute("DELETE FROM tag_counts WHERE author = ? AND n <= 0", (author,))
+                conn.execute("DELETE FROM tagged WHERE id = ?", (fragment_id,))
+                removed += 1
+        return removed
+
+    def query_keys(self, tags: List[str], start: str, end: str, author: Optional[str] = None,
+                   after: Optional[Tuple[str, str, str]] = None, limit: Optional[int] = None) -> List[Tuple[str, str, str]]:
+        """
+        带有 tags 中全部标签、start <= occurred_date <= end 的碎片
+
+        由第一个标签的 postings 驱动，其余标签按主键逐条确认；after 为上一页最后一条的 keyset_key()
+
+        Returns:
+            [(occurred_date, created_at, id), ...]，按该顺序升序
+        """
+        tags = normalize_tags(tags)
+        if not tags:
+            return []
+        sql = "SELECT p.occurred_date, p.created_at, p.id FROM tag_postings p WHERE p.tag = ?"
+        params: List[Any] = [tags[0]]
+        if author:
+            sql += " AND p.author = ?"
+            params.append(author)
+        sql += " AND p.occurred_date >= ? AND p.occurred_date <= ?"
+        params.extend([start, end])
+        if after is not None:
+            sql += " AND (p.occurred_date, p.created_at, p.id) > (?, ?, ?)"
+            params.extend(after)
+        for tag in tags[1:]:
+            sql += (
+                " AND EXISTS (SELECT 1 FROM tag_postings q WHERE q.tag = ? AND q.occurred_date = p.occurred_date"
+                " AND q.created_at = p.created_at AND q.id = p.id)"
+            )
+            params.append(tag)
+        sql += " ORDER BY p.occurred_date, p.created_at, p.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [(r[0], r[1], r[2]) for r in self.db.conn().execute(sql, params)]
+
+    def facets(self, author: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+               limit: int = 50) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Returns:
+            {author: [{"tag": ..., "count": n}, ...]}，每个作者按次数降序取前 limit 个
+        """
+        if start or end:
+            sql = "SELECT author, tag, COUNT(*) AS n FROM tag_postings WHERE occurred_date >= ? AND occurred_date <= ?"
+            params: List[Any] = [start or "", end or "9999-12-31"]
+            if author:
+                sql += " AND author = ?"
+                params.append(author)
+            sql += " GROUP BY author, tag"
+        else:
+            sql = "SELECT author, tag, n FROM tag_counts"
+            params = []
+            if author:
+                sql += " WHERE author = ?"
+                params.append(author)
+        sql += " ORDER BY author, n DESC, tag"
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        for row_author, tag, n in self.db.conn().execute(sql, params):
+            bucket = out.setdefault(row_author, [])
+            if len(bucket) < limit:
+                bucket.append({"tag": tag, "count": n})
+        return out
+
+    def rebuild(self, items: Iterable[Any], batch_size: int = 5000) -> Dict[str, Any]:
+        """清空后从 items 重建"""
+        conn = self.db.conn()
+        with conn:
+            conn.execute("DELETE FROM tag_postings")
+            conn.execute("DELETE FROM tag_counts")
+            conn.execute("DELETE FROM tagged")
+        total = 0
+        batch: List[Any] = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                total += self.add(batch)
+                batch = []
+        total += self.add(batch)
+        print(f"[DEBUG] tag index: rebuilt with {total} tagged fragments")
+        return {"ok": True, "indexed": total}
+
+
+_INDEX: Optional[TagIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_tag_index() -> TagIndex:
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                # 标签过滤依赖索引完整，所以 tags.db 不存在时先从存储构建
+                fresh = not os.path.exists(TAG_DB_PATH)
+                index = TagIndex(TAG_DB_PATH)
+                if fresh:
+                    from storage import iter_all_records
+                    index.rebuild(iter_all_records())
+                _INDEX = index
+    return _INDEX
+
+
+def on_fragments_changed(kind: str, items: List[Any]) -> None:
+    """storage 变更通知的回调"""
+    index = get_tag_index()
+    if kind == "append":
+        index.add(items)
+    elif kind == "delete":
+        index.remove(i.get("id") for i in items if i.get("id"))
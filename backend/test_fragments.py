@@ -0,0 +1,258 @@
+# test_fragments.py
+# 碎片查询接口测试（GET /api/fragments 等）：python test_fragments.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；用 Flask test client 调用接口，各用例使用各自的作者
+
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import server  # noqa: E402
+from storage import get_fragment_store  # noqa: E402
+from tools import build_fragment_item, get_fragments_version  # noqa: E402
+
+client = server.app.test_client()
+
+
+def _item(content: str, author: str, day: str, tags, second: int):
+    # 标签过滤按 (created_at, id) 排序：固定 created_at，顺序不受随机 id 影响
+    item = build_fragment_item(content, "user", author, day, tags)
+    item["created_at"] = f"{day}T09:00:{second:02d}"
+    return item
+
+
+def _day(author: str, **params):
+    return client.get("/api/fragments", query_string={"author": author, **params})
+
+
+# =========================
+# 按标签过滤与标签统计
+# =========================
+
+def test_day_listing_filters_by_tag():
+    author = uuid.uuid4().hex
+    get_fragment_store().append_many([
+        _item("完成发布", author, "2024-10-01", ["发布", "后端"], 1),
+        _item("修复样式", author, "2024-10-01", ["前端"], 2),
+        _item("完成回滚演练", author, "2024-10-01", ["发布"], 3),
+    ])
+
+    result = _day(author, date="2024-10-01", tag="发布").get_json()
+    assert [i["content"] for i in result["items"]] == ["完成发布", "完成回滚演练"]
+    result = client.get("/api/fragments", query_string=[("date", "2024-10-01"), ("author", author),
+                                                        ("tag", "发布"), ("tag", "后端")]).get_json()
+    assert [i["content"] for i in result["items"]] == ["完成发布"]
+    assert _day(author, date="2024-10-01", tag="不存在").get_json()["count"] == 0
+    assert _day(author, date="2024-10-01").get_json()["count"] == 3
+
+
+def test_day_listing_etag_depends_on_tag():
+    author = uuid.uuid4().hex
+    get_fragment_store().append_many([
+        _item("完成发布", author, "2024-10-02", ["发布"], 1),
+        _item("修复样式", author, "2024-10-02", ["前端"], 2),
+    ])
+    etag_all = _day(author, date="2024-10-02").headers["ETag"]
+    tagged = _day(author, date="2024-10-02", tag="前端")
+    assert tagged.headers["ETag"] != etag_all
+
+    # 全量列表的 ETag 不能让带标签的请求返回 304
+    resp = client.get("/api/fragments", query_string={"date": "2024-10-02", "author": author, "tag": "前端"},
+                      headers={"If-None-Match": etag_all})
+    assert resp.status_code == 200 and resp.get_json()["count"] == 1
+    resp = client.get("/api/fragments", query_string={"date": "2024-10-02", "author": author, "tag": "前端"},
+                      headers={"If-None-Match": tagged.headers["ETag"]})
+    assert resp.status_code == 304
+
+
+def test_tag_facets_follow_writes_and_deletes():
+    author = uuid.uuid4().hex
+    items = [
+        _item("完成发布", author, "2024-10-03", ["发布", "后端"], 1),
+        _item("完成回滚演练", author, "2024-10-03", ["发布"], 2),
+        _item("修复样式", author, "2024-10-04", ["前端", "前端", " "], 3),
+    ]
+    get_fragment_store().append_many(items)
+
+    def facets(**params):
+        result = client.get("/api/tags", query_string={"author": author, **params}).get_json()
+        return [(f["tag"], f["count"]) for f in result["facets"].get(author, [])]
+
+    assert facets() == [("发布", 2), ("前端", 1), ("后端", 1)]
+    assert facets(start="2024-10-04", end="2024-10-04") == [("前端", 1)]
+    assert facets(limit=1) == [("发布", 2)]
+    get_fragment_store().delete(items[0]["id"])
+    assert facets() == [("前端", 1), ("发布", 1)]
+    assert client.get("/api/tags", query_string={"start": "2024/10/03"}).status_code == 400
+
+
+# =========================
+# 日期范围查询与游标分页
+# =========================
+
+def _pages(author: str, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = {"author": author, **params, **({"cursor": cursor} if cursor else {})}
+        result = client.get("/api/fragments", query_string=query).get_json()
+        assert result["ok"], result
+        ids += [i["id"] for i in result["items"]]
+        pages += 1
+        cursor = result["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+def test_range_pages_follow_keyset_order():
+    author = uuid.uuid4().hex
+    items = [_item(f"完成第{i}项", author, f"2024-10-1{i % 5}", ["分页"] if i % 2 else [], i) for i in range(23)]
+    get_fragment_store().append_many(items)
+    expected = sorted(items, key=lambda i: (i["occurred_date"], i["created_at"], i["id"]))
+
+    ids, pages = _pages(author, start="2024-10-10", end="2024-10-14", limit=5)
+    assert ids == [i["id"] for i in expected] and pages == 5
+    ids, _ = _pages(author, start="2024-10-11", end="2024-10-12", limit=3)
+    assert ids == [i["id"] for i in expected if "2024-10-11" <= i["occurred_date"] <= "2024-10-12"]
+    ids, _ = _pages(author, start="2024-10-10", end="2024-10-14", limit=4, tag="分页")
+    assert ids == [i["id"] for i in expected if i["tags"]]
+
+
+def test_range_cursor_is_stable_under_inserts():
+    author = uuid.uuid4().hex
+    items = [_item(f"完成第{i}项", author, "2024-10-21", [], i) for i in range(6)]
+    get_fragment_store().append_many(items)
+    first = _day(author, start="2024-10-20", end="2024-10-22", limit=3).get_json()
+
+    # 翻页期间在已经翻过的位置之前插入记录：下一页不重复、不跳过
+    get_fragment_store().append(_item("补记", author, "2024-10-20", [], 0))
+    second = _day(author, start="2024-10-20", end="2024-10-22", limit=3, cursor=first["next_cursor"]).get_json()
+    assert [i["id"] for i in first["items"] + second["items"]] == [i["id"] for i in items]
+
+
+def test_range_rejects_bad_arguments():
+    assert _day("x", start="2024-10-20").status_code == 400
+    assert _day("x", start="2024-10-20", end="2024-10-22", cursor="not-a-cursor").status_code == 400
+    assert _day("x", start="2024-10-20", end="2024-10-22", limit="ten").status_code == 400
+
+
+# =========================
+# 当天列表的 ETag 与 304
+# =========================
+
+def _conditional(author: str, day: str, etag: str):
+    return client.get("/api/fragments", query_string={"author": author, "date": day},
+                      headers={"If-None-Match": etag})
+
+
+def test_day_listing_answers_304_until_the_day_changes():
+    author, other = uuid.uuid4().hex, uuid.uuid4().hex
+    day = "2024-11-01"
+    client.post("/api/input", json={"text": "完成接口联调", "author": author, "date": day})
+
+    first = _day(author, date=day)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+    cached = _conditional(author, day, etag)
+    assert cached.status_code == 304 and cached.data == b"" and cached.headers["ETag"] == etag
+
+    # 别人在同一天写入、自己在别的日期写入：这一天这个作者的列表没有变化
+    client.post("/api/input", json={"text": "修复样式", "author": other, "date": day})
+    client.post("/api/input", json={"text": "修复样式", "author": author, "date": "2024-11-02"})
+    assert _conditional(author, day, etag).status_code == 304
+    # 所有人的列表变了
+    everyone = _day("all", date=day).headers["ETag"]
+    client.post("/api/input", json={"text": "编写脚本", "author": other, "date": day})
+    assert _conditional("all", day, everyone).status_code == 200
+
+    # 新增、日报、删除都会让 ETag 失效
+    client.post("/api/input", json={"text": "编写脚本", "author": author, "date": day})
+    fresh = _conditional(author, day, etag)
+    assert fresh.status_code == 200 and fresh.get_json()["count"] == 2
+    etag = fresh.headers["ETag"]
+    client.post("/api/input", json={"text": "总结今日", "author": author, "date": day})
+    fresh = _conditional(author, day, etag)
+    assert fresh.status_code == 200 and fresh.headers["ETag"] != etag
+    etag = fresh.headers["ETag"]
+    fragment_id = next(i["id"] for i in fresh.get_json()["items"] if i.get("type") == "fragment")
+    assert client.delete(f"/api/fragments/{fragment_id}").status_code == 200
+    assert _conditional(author, day, etag).status_code == 200
+
+
+def test_day_listing_etag_depends_on_query():
+    author = uuid.uuid4().hex
+    day = "2024-11-03"
+    client.post("/api/input", json={"text": "完成接口联调", "author": author, "date": day})
+    etag = _day(author, date=day).headers["ETag"]
+    assert _day(author, date=day, order="desc").headers["ETag"] != etag
+    assert _day(author, date=day, limit=1).headers["ETag"] != etag
+    assert _day(author, date=day).headers["ETag"] == etag
+
+
+
+# =========================
+# 写入 / 删除的增量响应
+# =========================
+
+def _input(text: str, author: str, day: str, **extra):
+    resp = client.post("/api/input", json={"text": text, "author": author, "date": day, **extra})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()
+
+
+def test_delta_responses_patch_the_day_listing():
+    author = uuid.uuid4().hex
+    day = "2024-11-05"
+    local = {}
+
+    def apply(delta):
+        # 客户端的做法：按 id 覆盖 changed、去掉 deleted_ids
+        for item in delta["changed"]:
+            local[item["id"]] = item
+        for deleted_id in delta["deleted_ids"]:
+            local.pop(deleted_id, None)
+        assert delta["version"] == get_fragments_version(day, author)
+
+    versions = set()
+    steps = (("完成接口联调", "record"), ("打卡", "confirm"), ("总结今日", "summary"),
+             ("修复样式问题", "record"), ("总结今日", "summary"))
+    for text, action in steps:
+        result = _input(text, author, day, response="delta")
+        assert result["action"] == action and "today_fragments" not in result
+        apply(result["delta"])
+        versions.add(result["delta"]["version"])
+    # 每次写入都换版本；重新生成的日报覆盖了旧日报，本地只剩一份
+    assert len(versions) == len(steps)
+    assert sum(1 for item in local.values() if item.get("type") == "summary") == 1
+
+    fragment_id = next(i for i, item in local.items() if item.get("type") == "fragment")
+    result = client.delete(f"/api/fragments/{fragment_id}", query_string={"response": "delta"}).get_json()
+    assert result["ok"] and result["deleted_id"] == fragment_id and result["delta"]["changed"] == []
+    apply(result["delta"])
+
+    full = _day(author, date=day).get_json()["items"]
+    assert sorted(local) == sorted(item["id"] for item in full)
+
+
+def test_query_ignores_delta_mode():
+    author = uuid.uuid4().hex
+    _input("完成接口联调", author, "2024-11-06")
+    result = _input("今天做了啥", author, "2024-11-06", response="delta")
+    assert result["action"] == "query" and "delta" not in result
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,156 @@
+# test_import_export.py
+# 批量导入 / 导出测试：python test_import_export.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；用 Flask test client 调用接口，各用例使用各自的作者
+
+import csv
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import server  # noqa: E402
+import tools  # noqa: E402
+from storage import get_fragment_store  # noqa: E402
+
+client = server.app.test_client()
+
+
+def _ndjson(rows) -> bytes:
+    return "".join((r if isinstance(r, str) else json.dumps(r, ensure_ascii=False)) + "\n" for r in rows).encode("utf-8")
+
+
+# =========================
+# NDJSON 导入
+# =========================
+
+def test_import_reports_rejected_lines():
+    author = uuid.uuid4().hex
+    body = _ndjson([
+        {"content": "完成第一项", "source": "user", "occurred_date": "2024-05-01", "tags": ["导入"]},
+        "",
+        "{not json",
+        {"content": "", "source": "user", "occurred_date": "2024-05-01"},
+        {"content": "完成第二项", "source": "user", "occurred_date": "2024/05/01"},
+        {"content": "完成第三项", "source": "user", "author": "其他人" + author, "occurred_date": "2024-05-01"},
+    ])
+    resp = client.post("/api/fragments/import", data=body, query_string={"author": author},
+                       content_type="application/x-ndjson")
+    result = resp.get_json()
+    assert resp.status_code == 200 and result["accepted"] == 2 and result["rejected"] == 3
+    assert [e["line"] for e in result["errors"]] == [3, 4, 5]
+    assert "invalid json" in result["errors"][0]["error"]
+
+    rows = get_fragment_store().query("2024-05-01", author)
+    assert [(r["content"], list(r["tags"])) for r in rows] == [("完成第一项", ["导入"])]
+    assert len(get_fragment_store().query("2024-05-01", "其他人" + author)) == 1
+
+
+def test_import_rejects_impossible_dates():
+    author = uuid.uuid4().hex
+    body = _ndjson([
+        {"content": "完成第一项", "source": "user", "occurred_date": "2024-13-45"},
+        {"content": "完成第二项", "source": "user", "occurred_date": "2023-02-29"},
+        {"content": "完成第三项", "source": "user", "occurred_date": "2024-02-29"},
+    ])
+    result = client.post("/api/fragments/import", data=body, query_string={"author": author},
+                         content_type="application/x-ndjson").get_json()
+    assert result["accepted"] == 1 and [e["line"] for e in result["errors"]] == [1, 2]
+    assert "2024-13-45" in result["errors"][0]["error"]
+    assert [r["content"] for r in get_fragment_store().query("2024-02-29", author)] == ["完成第三项"]
+    assert get_fragment_store().query("2024-13-45", author) == []
+
+
+def test_import_streams_in_batches():
+    author = uuid.uuid4().hex
+    rows = [{"content": f"完成第{i}项", "source": "user", "author": author, "occurred_date": "2024-05-02"} for i in range(25)]
+    # 小块读取 + 小批量写入：跨块的行、最后一行没有换行都要正确处理
+    lines = tools.iter_ndjson_lines(io.BytesIO(_ndjson(rows)[:-1]), chunk_size=7)
+    result = tools.import_fragments(lines, batch_size=4)
+    assert result == {"ok": True, "accepted": 25, "rejected": 0, "errors": []}
+    assert [r["content"] for r in get_fragment_store().query("2024-05-02", author)] == [r["content"] for r in rows]
+
+
+def test_import_cli():
+    data_dir = tempfile.mkdtemp(prefix="punch_test_")
+    path = os.path.join(data_dir, "in.ndjson")
+    with open(path, "wb") as f:
+        f.write(_ndjson([{"content": "完成CLI导入", "source": "user", "occurred_date": "2024-05-03"}, "[]"]))
+    proc = subprocess.run([sys.executable, "manage.py", "import", path, "--author", "甲"], cwd=BACKEND_DIR,
+                          capture_output=True, text=True, env=dict(os.environ, DATA_DIR=data_dir))
+    result = json.loads(proc.stdout[proc.stdout.index("{"):])
+    assert result["accepted"] == 1 and result["rejected"] == 1
+
+
+# =========================
+# 按日期范围导出
+# =========================
+
+def _export(**params):
+    """流式响应：在发下一个请求之前读完并关闭"""
+    headers = params.pop("headers", {})
+    resp = client.get("/api/fragments/export", query_string=params, headers=headers)
+    resp.get_data()
+    resp.close()
+    return resp
+
+
+def _seed_export(author: str):
+    items = [tools.build_fragment_item(f"完成第{i}项", "user", author, f"2024-05-1{i % 3}", ["导出", "测试"])
+             for i in range(6)]
+    get_fragment_store().append_many(items)
+    return sorted(items, key=lambda i: (i["occurred_date"], i["created_at"], i["id"]))
+
+
+def test_export_ndjson_in_range_order():
+    author = uuid.uuid4().hex
+    items = _seed_export(author)
+    resp = _export(start="2024-05-10", end="2024-05-11", author=author)
+    assert resp.status_code == 200 and resp.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in resp.data.decode("utf-8").splitlines()]
+    assert [r["id"] for r in rows] == [i["id"] for i in items if i["occurred_date"] <= "2024-05-11"]
+    assert rows[0]["tags"] == ["导出", "测试"]
+
+
+def test_export_csv_and_gzip():
+    author = uuid.uuid4().hex
+    items = _seed_export(author)
+    resp = _export(start="2024-05-10", end="2024-05-12", author=author, format="csv")
+    text = resp.data.decode("utf-8")
+    assert text.startswith("﻿") and resp.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(text[1:])))
+    assert [r["id"] for r in rows] == [i["id"] for i in items]
+    assert rows[0]["tags"] == "导出,测试" and list(rows[0]) == tools.EXPORT_CSV_COLUMNS
+
+    gz = _export(start="2024-05-10", end="2024-05-12", author=author, headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    plain = _export(start="2024-05-10", end="2024-05-12", author=author)
+    assert gzip.decompress(gz.data) == plain.data
+
+
+def test_export_rejects_bad_arguments():
+    assert _export(start="2024-05-10").status_code == 400
+    assert _export(start="2024-05-12", end="2024-05-10").status_code == 400
+    assert _export(start="2024-05-10", end="2024-05-12", format="xml").status_code == 400
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
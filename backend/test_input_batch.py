@@ -0,0 +1,91 @@
+# test_input_batch.py
+# 批量输入接口测试（POST /api/input/batch）：python test_input_batch.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；用 Flask test client 调用接口，各用例使用各自的作者
+
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import server  # noqa: E402
+from storage import get_fragment_store  # noqa: E402
+
+client = server.app.test_client()
+
+
+def _batch(items, **extra):
+    resp = client.post("/api/input/batch", json={"items": items, **extra})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()
+
+
+def test_batch_matches_single_inputs():
+    author = uuid.uuid4().hex
+    result = _batch([
+        {"text": "完成接口联调", "author": author, "date": "2024-11-01"},
+        {"text": "打卡", "author": author, "date": "2024-11-01"},
+        {"text": "今天做了啥", "author": author, "date": "2024-11-01"},
+    ])
+    assert result["count"] == 3
+    assert [r["action"] for r in result["results"]] == ["record", "confirm", "query"]
+    # 列表反映整批写入之后的状态，相同 (date, author) 共用一份
+    lists = {r["list"] for r in result["results"]}
+    assert len(lists) == 1
+    assert len(result["lists"][lists.pop()]["items"]) == 2
+    assert len(get_fragment_store().query("2024-11-01", author)) == 2
+
+
+def test_batch_reports_invalid_dates_per_item():
+    author = uuid.uuid4().hex
+    result = _batch([
+        {"text": "完成第一项", "author": author, "date": "2024-11-02"},
+        {"text": "完成第二项", "author": author, "date": "2024-13-45"},
+        {"text": "完成第三项", "author": author, "date": "2024/11/02"},
+        {"text": "完成第四项", "author": author, "date": 20241102},
+        {"text": "完成第五项"},
+    ])
+    oks = [r["ok"] for r in result["results"]]
+    assert oks == [True, False, False, False, False]
+    assert "invalid date" in result["results"][1]["error"] and result["results"][1]["input_text"] == "完成第二项"
+    assert result["results"][4]["error"] == "missing author field"
+    assert [i["content"] for i in get_fragment_store().query("2024-11-02", author)] == ["完成第一项"]
+
+
+def test_single_input_rejects_invalid_date():
+    author = uuid.uuid4().hex
+    for bad in ("2024-13-45", "2024/11/03", "abc"):
+        resp = client.post("/api/input", json={"text": "完成测试", "author": author, "date": bad})
+        assert resp.status_code == 400 and "invalid date" in resp.get_json()["error"]
+    assert client.post("/api/input", json={"text": "完成测试", "author": author, "date": "2024-11-03"}).status_code == 200
+
+
+def test_batch_delta_mode_skips_lists():
+    author = uuid.uuid4().hex
+    result = _batch([{"text": "完成部署", "author": author, "date": "2024-11-04"}], response="delta")
+    entry = result["results"][0]
+    assert entry["list"] is None and result["lists"] == []
+    assert [i["content"] for i in entry["delta"]["changed"]] == ["完成部署"] and entry["delta"]["version"]
+
+
+def test_batch_rejects_bad_payloads():
+    assert client.post("/api/input/batch", json={"items": "x"}).status_code == 400
+    too_many = [{"text": "打卡", "author": "a"}] * (server.INPUT_BATCH_MAX_ITEMS + 1)
+    assert client.post("/api/input/batch", json={"items": too_many}).status_code == 400
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
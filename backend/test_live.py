@@ -0,0 +1,131 @@
+# test_live.py
+# 实时推送测试（GET /api/fragments/stream）：python test_live.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；直接迭代 live.stream 生成器，写入走 Flask test client
+
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+# 跨进程比对由用例手动触发（hub._poll_once），后台轮询不参与
+os.environ.setdefault("LIVE_POLL_SECONDS", "3600")
+
+import live  # noqa: E402
+import server  # noqa: E402
+import storage  # noqa: E402
+from testutil import run_python  # noqa: E402
+
+client = server.app.test_client()
+
+
+def _event(events):
+    """取下一条 SSE 消息，返回 (event, data)"""
+    lines = next(events).strip().splitlines()
+    return lines[0][len("event: "):], json.loads(lines[1][len("data: "):])
+
+
+def _input(text: str, author: str, day: str):
+    resp = client.post("/api/input", json={"text": text, "author": author, "date": day})
+    assert resp.status_code == 200, resp.get_json()
+
+
+def test_stream_pushes_appends_and_deletes_of_the_day():
+    author, other = uuid.uuid4().hex, uuid.uuid4().hex
+    day = "2024-12-01"
+    hub = live.get_hub()
+    events = live.stream(hub, day, author)
+    event, data = _event(events)
+    assert event == "ready" and data["version"]
+
+    # 别人的记录、别的日期的记录都不推送给这个订阅
+    _input("修复样式问题", other, day)
+    _input("编写接口脚本", author, "2024-12-02")
+    _input("完成接口联调", author, day)
+    event, data = _event(events)
+    assert event == "append" and [i["content"] for i in data["items"]] == ["完成接口联调"]
+
+    fragment_id = data["items"][0]["id"]
+    assert client.delete(f"/api/fragments/{fragment_id}").status_code == 200
+    assert _event(events) == ("delete", {"ids": [fragment_id]})
+
+    # 连接断开（生成器关闭）时退订
+    events.close()
+    assert (day, author) not in hub._subscribers
+
+
+def test_stream_for_everyone_sees_all_authors():
+    day = "2024-12-03"
+    events = live.stream(live.get_hub(), day, None)
+    _event(events)
+    authors = [uuid.uuid4().hex, uuid.uuid4().hex]
+    for author in authors:
+        _input("完成接口联调", author, day)
+    assert [_event(events)[1]["items"][0]["author"] for _ in authors] == authors
+    events.close()
+
+
+def test_slow_subscriber_gets_resync():
+    author = uuid.uuid4().hex
+    day = "2024-12-04"
+    size = live.LIVE_QUEUE_SIZE
+    live.LIVE_QUEUE_SIZE = 2
+    try:
+        events = live.stream(live.get_hub(), day, author)
+        _event(events)
+    finally:
+        live.LIVE_QUEUE_SIZE = size
+    for i in range(3):
+        _input(f"完成第{i}轮巡检", author, day)
+    assert _event(events) == ("resync", {"reason": "overflow"})
+    # 之后的变更照常推送
+    _input("完成收尾", author, day)
+    assert _event(events)[1]["items"][0]["content"] == "完成收尾"
+    events.close()
+
+
+def test_writes_from_other_processes_trigger_resync():
+    author = uuid.uuid4().hex
+    day = "2024-12-05"
+    hub = live.get_hub()
+    events = live.stream(hub, day, author)
+    _event(events)
+
+    # 本进程的写入已经推送过：比对时不算漏掉
+    _input("完成接口联调", author, day)
+    assert _event(events)[0] == "append"
+    hub._poll_once()
+
+    code = f"import main; main.run_once_with_structured_response(None, '完成数据迁移', {author!r}, {day!r})"
+    run_python(code, DATA_DIR=storage.DATA_DIR)
+    hub._poll_once()
+    event, data = _event(events)
+    assert event == "resync" and data["version"] == hub._changes((day, author))
+    events.close()
+
+
+def test_stream_route_serves_event_stream():
+    assert client.get("/api/fragments/stream", query_string={"date": "2024-13"}).status_code == 400
+
+    resp = client.get("/api/fragments/stream", query_string={"date": "2024-12-06", "author": "all"})
+    assert resp.status_code == 200 and resp.mimetype == "text/event-stream"
+    assert resp.headers["Cache-Control"] == "no-cache"
+    assert next(resp.response).startswith(b"event: ready")
+    resp.close()
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
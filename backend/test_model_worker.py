@@ -0,0 +1,101 @@
+# test_model_worker.py
+# 异步对话任务（model_worker.py）测试：python test_model_worker.py（也可用 pytest 运行）
+# 不调用模型：runner 用本地协程代替；各用例使用各自的 jobs.db
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import storage  # noqa: E402
+import model_worker  # noqa: E402
+
+
+def _db_path() -> str:
+    return os.path.join(tempfile.mkdtemp(prefix="case_", dir=storage.DATA_DIR), "jobs.db")
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _insert(path: str, job_id: str, status: str, finished_at=None, worker_pid=None) -> None:
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, input, created_at, finished_at, worker_pid) VALUES (?, ?, '你好', ?, ?, ?)",
+            (job_id, status, "2024-01-01T00:00:00", finished_at, worker_pid),
+        )
+    conn.close()
+
+
+def test_submit_runs_job_and_records_reply():
+    async def runner(client, text, executor=None):
+        return f"收到：{text}"
+
+    worker = model_worker.ModelWorker(_db_path())
+    job_id = worker.submit("你好", runner)
+    for _ in range(200):
+        job = worker.get(job_id)
+        if job["status"] != "pending":
+            break
+        time.sleep(0.01)
+    assert job["status"] == "done" and job["reply"] == "收到：你好"
+
+
+def test_orphaned_pending_jobs_are_failed_at_startup():
+    path = _db_path()
+    model_worker.ModelWorker(path)
+    _insert(path, "dead", "pending", worker_pid=_dead_pid())
+    _insert(path, "alive", "pending", worker_pid=os.getppid())
+
+    worker = model_worker.ModelWorker(path)
+    dead = worker.get("dead")
+    assert dead["status"] == "error" and "interrupted" in dead["error"] and dead["finished_at"]
+    assert worker.get("alive")["status"] == "pending"
+
+
+def test_finished_jobs_are_pruned_after_ttl():
+    path = _db_path()
+    model_worker.ModelWorker(path)
+    _insert(path, "old", "done", finished_at="2000-01-01T00:00:00")
+    _insert(path, "recent", "done", finished_at=storage._now_iso())
+
+    worker = model_worker.ModelWorker(path, ttl_seconds=3600)
+    assert worker.get("old") is None
+    assert worker.get("recent")["status"] == "done"
+
+
+def test_old_jobs_db_is_migrated():
+    path = _db_path()
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, input TEXT NOT NULL, reply TEXT, "
+                     "error TEXT, created_at TEXT NOT NULL, finished_at TEXT) WITHOUT ROWID")
+        conn.execute("INSERT INTO jobs (id, status, input, created_at) VALUES ('legacy', 'pending', '你好', '2024-01-01T00:00:00')")
+    conn.close()
+
+    # 升级前留下的 pending 任务没有所属进程，不会再完成
+    assert model_worker.ModelWorker(path).get("legacy")["status"] == "error"
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
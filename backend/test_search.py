@@ -0,0 +1,113 @@
+# test_search.py
+# 全文搜索测试：python test_search.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；用 Flask test client 调用接口
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import server  # noqa: E402
+from storage import get_fragment_store  # noqa: E402
+from testutil import fresh_data_dir, run_python  # noqa: E402
+from tools import build_fragment_item  # noqa: E402
+
+client = server.app.test_client()
+
+
+def test_search_pages_are_not_shortened_by_summaries():
+    author = uuid.uuid4().hex
+    word = "巡检" + uuid.uuid4().hex[:6]
+    for i in range(5):
+        client.post("/api/input", json={"text": f"完成{word}第{i}轮", "author": author, "date": "2024-07-01"})
+    # 日报内容包含当天的碎片，不应出现在搜索结果里、也不应占用 limit
+    client.post("/api/input", json={"text": "总结今日", "author": author, "date": "2024-07-01"})
+
+    result = client.get("/api/search", query_string={"q": word, "author": author, "limit": 3}).get_json()
+    assert result["ok"] and result["count"] == 3
+    assert all(item["type"] == "fragment" for item in result["items"])
+
+    import search
+    docs = search.get_search_index().db.conn().execute("SELECT COUNT(*) FROM docs WHERE author = ?", (author,)).fetchone()[0]
+    assert docs == 5
+
+
+def test_search_index_is_built_from_existing_data():
+    data_dir = fresh_data_dir()
+    ndjson = os.path.join(data_dir, "in.ndjson")
+    with open(ndjson, "w", encoding="utf-8") as f:
+        for i in range(3):
+            f.write(json.dumps({"content": f"完成历史数据迁移{i}", "source": "user", "author": "甲",
+                                "occurred_date": "2024-01-02"}, ensure_ascii=False) + "\n")
+    # 升级前写入的数据：没有 search.db
+    subprocess.run([sys.executable, "manage.py", "import", ndjson], cwd=BACKEND_DIR, capture_output=True, check=True,
+                   env=dict(os.environ, DATA_DIR=data_dir, FRAGMENTS_SEARCH_INDEX="0"))
+    assert not os.path.exists(os.path.join(data_dir, "search.db"))
+
+    count = run_python("import tools; print(tools.search_fragments('历史数据')['count'])", DATA_DIR=data_dir)
+    assert count == "3"
+
+
+def test_old_search_index_is_rebuilt_without_summaries():
+    data_dir = fresh_data_dir()
+    setup = (
+        "import main, search\n"
+        "main.run_once_with_structured_response(None, '完成接口联调', '甲', '2024-01-03')\n"
+        "main.run_once_with_structured_response(None, '总结今日', '甲', '2024-01-03')\n"
+        "from storage import get_summary_store\n"
+        "conn = search.get_search_index().db.conn()\n"
+        # 模拟旧版本：日报也进了索引，user_version 为 0
+        "summary = get_summary_store().get('2024-01-03', '甲')\n"
+        "with conn:\n"
+        "    conn.execute('INSERT INTO docs (docid, id, author, occurred_date) VALUES (1000, ?, ?, ?)', (summary['id'], '甲', '2024-01-03'))\n"
+        "    conn.execute('INSERT INTO fragment_fts (rowid, grams, chars, author) VALUES (1000, ?, ?, ?)', (*search._document(summary['content']), ''))\n"
+        "conn.execute('PRAGMA user_version = 0')\n"
+        "print(conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0])\n"
+    )
+    assert run_python(setup, DATA_DIR=data_dir) == "2"
+    check = "import search; print(search.get_search_index().db.conn().execute('SELECT COUNT(*) FROM docs').fetchone()[0])"
+    assert run_python(check, DATA_DIR=data_dir) == "1"
+
+
+def test_search_matches_chinese_terms_and_filters():
+    author = uuid.uuid4().hex
+    store = get_fragment_store()
+    items = [build_fragment_item(text, "user", author, day) for text, day in (
+        ("完成WMS用例执行", "2024-07-02"), ("修复登录页样式", "2024-07-03"), ("组织用例评审", "2024-07-04"))]
+    store.append_many(items)
+
+    def ids(**params):
+        result = client.get("/api/search", query_string={"author": author, **params}).get_json()
+        assert result["ok"], result
+        return sorted(i["id"] for i in result["items"])
+
+    assert ids(q="用例") == sorted([items[0]["id"], items[2]["id"]])
+    assert ids(q="wms 执行") == [items[0]["id"]]
+    assert ids(q="修") == [items[1]["id"]]
+    assert ids(q="用例", start="2024-07-03", end="2024-07-04") == [items[2]["id"]]
+    assert ids(q="用例评审执行") == []
+
+    store.delete(items[2]["id"])
+    assert ids(q="用例") == [items[0]["id"]]
+    assert client.get("/api/search", query_string={"q": ""}).status_code == 400
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
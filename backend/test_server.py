@@ -0,0 +1,96 @@
+# test_server.py
+# 服务启动与模块加载测试：python test_server.py（也可用 pytest 运行）
+# 每个用例在子进程中运行（各自的 DATA_DIR / 环境变量），不需要启动服务
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from testutil import fresh_data_dir, run_python  # noqa: E402
+
+
+# =========================
+# 源码变更后的热重载
+# =========================
+
+_RELOAD_CHECK = (
+    "import os, sys\n"
+    "sys.path.insert(0, os.getcwd())\n"
+    "import server\n"
+    "first = server.get_main_module()\n"
+    "same = server.get_main_module() is first\n"
+    "with open('main.py', 'a', encoding='utf-8') as f:\n"
+    "    f.write('\\nRELOAD_MARKER = 1\\n')\n"
+    "st = os.stat('main.py')\n"
+    "os.utime('main.py', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))\n"
+    "second = server.get_main_module()\n"
+    "print(same, second is first, hasattr(second, 'RELOAD_MARKER'))\n"
+)
+
+
+def _backend_copy() -> str:
+    """热重载会改动 main.py：在副本里做"""
+    root = tempfile.mkdtemp(prefix="punch_test_")
+    copy = os.path.join(root, "backend")
+    shutil.copytree(BACKEND_DIR, copy, ignore=shutil.ignore_patterns("__pycache__", "*.db", "*.jsonl"))
+    return copy
+
+
+def test_modules_are_loaded_once_by_default():
+    assert run_python(_RELOAD_CHECK, cwd=_backend_copy(), DATA_DIR=fresh_data_dir(), SERVER_HOT_RELOAD="0") == "True True False"
+
+
+def test_hot_reload_picks_up_source_changes():
+    assert run_python(_RELOAD_CHECK, cwd=_backend_copy(), DATA_DIR=fresh_data_dir(), SERVER_HOT_RELOAD="1") == "True False True"
+
+
+# =========================
+# 只用确定性路由时不需要模型
+# =========================
+
+def test_deterministic_mode_needs_no_model_sdk():
+    code = (
+        "import sys, server, main\n"
+        "client = server.app.test_client()\n"
+        "health = client.get('/health').get_json()['deterministic_only']\n"
+        "chat = client.post('/api/chat', json={'text': '你好'}).status_code\n"
+        "punch = client.post('/api/input', json={'text': '打卡', 'author': '甲', 'date': '2024-01-01'}).status_code\n"
+        "try:\n"
+        "    main.get_client()\n"
+        "    refused = False\n"
+        "except RuntimeError:\n"
+        "    refused = True\n"
+        "print(health, chat, punch, refused, 'zhipuai' in sys.modules)\n"
+    )
+    assert run_python(code, DATA_DIR=fresh_data_dir(), ZHIPU_API_KEY=None) == "True 503 200 True False"
+
+
+def test_model_sdk_is_imported_lazily():
+    code = "import sys, server; print(server.main_module.DETERMINISTIC_ONLY, 'zhipuai' in sys.modules)"
+    assert run_python(code, DATA_DIR=fresh_data_dir(), DETERMINISTIC_ONLY="0", ZHIPU_API_KEY="x") == "False False"
+
+
+def test_startup_requires_api_key_without_deterministic_mode():
+    try:
+        run_python("import server", DATA_DIR=fresh_data_dir(), DETERMINISTIC_ONLY="0", ZHIPU_API_KEY=None)
+        assert False, "server started without ZHIPU_API_KEY"
+    except subprocess.CalledProcessError as e:
+        assert "ZHIPU_API_KEY" in e.stderr
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,99 @@
+# test_stats.py
+# 统计接口测试：python test_stats.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；用 Flask test client 调用接口，各用例使用各自的作者
+
+import os
+import sqlite3
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import server  # noqa: E402
+from testutil import fresh_data_dir, run_python  # noqa: E402
+
+client = server.app.test_client()
+
+
+def _stats(author: str, start: str, end: str):
+    resp = client.get("/api/stats", query_string={"start": start, "end": end, "author": author})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()["authors"].get(author)
+
+
+def test_punch_through_input_counts_as_coverage():
+    author = uuid.uuid4().hex
+    for day in ("2024-08-01", "2024-08-02"):
+        result = client.post("/api/input", json={"text": "打卡", "author": author, "date": day}).get_json()
+        assert result["action"] == "confirm"
+    # 同一天打卡两次只算一天；普通记录不算打卡
+    client.post("/api/input", json={"text": "打卡", "author": author, "date": "2024-08-02"})
+    client.post("/api/input", json={"text": "完成接口联调", "author": author, "date": "2024-08-03"})
+
+    entry = _stats(author, "2024-08-01", "2024-08-31")
+    assert entry["punched_dates"] == ["2024-08-01", "2024-08-02"]
+    assert entry["punched_days"] == 2
+    assert entry["totals"]["fragment"] == 4 and entry["active_days"] == 3
+
+    assert _stats(author, "2024-08-02", "2024-08-03")["punched_dates"] == ["2024-08-02"]
+
+
+def test_deleting_punch_removes_coverage():
+    author = uuid.uuid4().hex
+    punch = client.post("/api/input", json={"text": "打卡", "author": author, "date": "2024-08-05"}).get_json()
+    client.post("/api/input", json={"text": "完成日志清理", "author": author, "date": "2024-08-05"})
+    punch_id = next(i["id"] for i in punch["today_fragments"] if i["content"] == server.get_main_module().CONFIRM_CONTENT)
+
+    assert _stats(author, "2024-08-05", "2024-08-05")["punched_days"] == 1
+    assert client.delete(f"/api/fragments/{punch_id}").status_code == 200
+    entry = _stats(author, "2024-08-05", "2024-08-05")
+    assert entry["punched_days"] == 0 and entry["punched_dates"] == []
+    assert entry["totals"]["fragment"] == 1
+
+
+def test_old_stats_db_is_rebuilt_with_punches():
+    data_dir = fresh_data_dir()
+    run_python("import main; main.run_once_with_structured_response(None, '打卡', '甲', '2024-08-06')", DATA_DIR=data_dir)
+
+    # 模拟旧版本的 stats.db：没有打卡记录，user_version 为 0
+    conn = sqlite3.connect(os.path.join(data_dir, "stats.db"))
+    with conn:
+        conn.execute("DELETE FROM punches")
+    conn.execute("PRAGMA user_version = 0")
+    conn.close()
+
+    check = "import tools; print(tools.get_stats('2024-08-06', '2024-08-06')['authors']['甲']['punched_days'])"
+    assert run_python(check, DATA_DIR=data_dir) == "1"
+
+
+def test_daily_counts_by_type_and_range():
+    author = uuid.uuid4().hex
+    for day, text in (("2024-08-10", "完成需求评审"), ("2024-08-10", "完成接口联调"), ("2024-08-12", "修复登录问题"),
+                      ("2024-08-10", "总结今日"), ("2024-09-01", "完成上线")):
+        client.post("/api/input", json={"text": text, "author": author, "date": day})
+
+    entry = _stats(author, "2024-08-01", "2024-08-31")
+    assert entry["totals"] == {"fragment": 3, "summary": 1}
+    assert entry["days"] == {"2024-08-10": {"fragment": 2, "summary": 1}, "2024-08-12": {"fragment": 1}}
+    assert entry["active_days"] == 2 and entry["last_active_date"] == "2024-09-01"
+    assert _stats(author, "2024-08-11", "2024-08-11") is None
+
+    for start, end in (("2024-08-31", "2024-08-01"), ("2024-01-01", "2025-12-31"), ("2024-02-30", "2024-03-01"), (None, None)):
+        assert client.get("/api/stats", query_string={"start": start, "end": end}).status_code == 400
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
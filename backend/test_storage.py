@@ -0,0 +1,691 @@
+# test_storage.py
+# 存储层测试：python test_storage.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；各用例使用各自的临时目录 / 日期 / 作者，互不影响
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import storage  # noqa: E402
+from testutil import fresh_data_dir, run_python  # noqa: E402
+from tools import build_fragment_item  # noqa: E402
+
+
+def _tmpdir() -> str:
+    return tempfile.mkdtemp(prefix="case_", dir=storage.DATA_DIR)
+
+
+def _items(n: int, date: str = "2024-03-01", author: str = "甲", **extra):
+    out = []
+    for i in range(n):
+        item = build_fragment_item(f"完成任务{i}", "user", author, date)
+        item.update(extra)
+        out.append(item)
+    return out
+
+
+def _single_store(root: str) -> storage.JsonlFragmentStore:
+    """与 get_fragment_store() 的单文件布局相同：fragments.jsonl + fragment_ids.idx"""
+    path = os.path.join(root, "fragments.jsonl")
+    return storage.JsonlFragmentStore(path, storage._IdIndex(os.path.join(root, "fragment_ids.idx"), storage.DATA_DIR, lambda: [path]))
+
+
+def _partitioned_store(root: str) -> storage.PartitionedFragmentStore:
+    store = storage.PartitionedFragmentStore(os.path.join(root, "fragments"), os.path.join(root, "fragments.jsonl"))
+    store.enable_id_index(os.path.join(root, "fragment_ids.idx"))
+    return store
+
+
+def _idx_lines(root: str):
+    with open(os.path.join(root, "fragment_ids.idx"), encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+# =========================
+# 持久化 id 索引
+# =========================
+
+def test_id_index_after_partition_conversion():
+    root = _tmpdir()
+    single = _single_store(root)
+    items = _items(2, "2024-03-01", tags=["t"]) + _items(2, "2024-03-02", tags=["t"])
+    single.append_many(items)
+
+    result = _partitioned_store(root).convert_legacy()
+    assert result["copied"] == 4
+
+    # 新进程：只有分片和转换后的 id 索引
+    store = _partitioned_store(root)
+    for item in items:
+        found = store.get(item["id"])
+        assert found is not None and found["content"] == item["content"]
+    assert all("fragments.jsonl" not in line.split("\t")[1] for line in _idx_lines(root) if "\t" in line)
+    assert len(store.get_many([i["id"] for i in items])) == 4
+    assert store.delete(items[0]["id"]) is not None
+    assert store.get(items[0]["id"]) is None
+
+
+def test_partitioned_find_falls_back_when_id_index_misses():
+    root = _tmpdir()
+    store = _partitioned_store(root)
+    items = _items(3, "2024-04-01")
+    store.append_many(items)
+
+    # 索引文件落后于数据文件（例如旧版本转换留下的）
+    with open(os.path.join(root, "fragment_ids.idx"), "w", encoding="utf-8"):
+        pass
+    store = _partitioned_store(root)
+    assert store.get(items[1]["id"])["id"] == items[1]["id"]
+    assert store.delete(items[2]["id"]) is not None
+    assert [r["id"] for r in store.query("2024-04-01")] == [items[0]["id"], items[1]["id"]]
+    assert store.get("no-such-id") is None
+
+
+def test_compaction_rewrites_id_index():
+    root = _tmpdir()
+    store = _single_store(root)
+    items = _items(40, "2024-05-01")
+    store.append_many(items)
+    for item in items[:5]:
+        store.delete(item["id"])
+    assert len(_idx_lines(root)) == 45
+
+    for _ in range(3):
+        store.compact()
+        assert len(_idx_lines(root)) == 35
+
+    store = _single_store(root)
+    assert all(store.get(i["id"]) is not None for i in items[5:])
+    assert store.get(items[0]["id"]) is None
+
+
+def test_compaction_swaps_id_index_without_rescanning():
+    for replace_index in (False, True):
+        root = _tmpdir()
+        store = _single_store(root)
+        items = _items(30, "2024-05-02")
+        store.append_many(items)
+        for item in items[:10]:
+            store.delete(item["id"])
+        late = _items(3, "2024-05-02")
+
+        prepare = store.id_index.prepare_swap
+
+        def during_compaction(*args):
+            # 压缩读完数据文件之后、拿写锁之前：别的请求追加、删除（包括压缩前的记录和新追加的记录）
+            store.append_many(late)
+            store.delete(items[10]["id"])
+            store.delete(late[0]["id"])
+            if replace_index:
+                # 索引文件同时被替换：退回到在当前索引后追加新偏移
+                store.id_index.rebuild()
+            return prepare(*args)
+
+        store.id_index.prepare_swap = during_compaction
+        store.id_index.reindex_file = None  # 压缩不应再重新扫描数据文件
+        assert store.compact()["after"] == 20
+
+        live = items[11:] + late[1:]
+        for fresh in (store, _single_store(root)):
+            assert all(fresh.get(i["id"]) is not None and fresh.get(i["id"])["id"] == i["id"] for i in live)
+            assert all(fresh.get(i["id"]) is None for i in items[:11] + late[:1])
+        # 压缩期间写入的索引行接在新索引后面，下一次压缩时收拢
+        store.id_index.prepare_swap = prepare
+        store.compact()
+        assert len(_idx_lines(root)) == len(live)
+        assert all(_single_store(root).get(i["id"]) is not None for i in live)
+
+
+def test_concurrent_deletes_succeed_once():
+    deleted = []
+    storage.add_change_listener(lambda kind, batch: deleted.extend(i.get("id") for i in batch) if kind == "delete" else None)
+
+    for factory, lookup in ((_single_store, "get"), (_partitioned_store, "_find")):
+        store = factory(_tmpdir())
+        # 放大“查找之后、写 tombstone 之前”的窗口
+        original = getattr(store, lookup)
+        setattr(store, lookup, lambda *args: (time.sleep(0.002), original(*args))[1])
+        for item in _items(10, "2024-06-01", author=uuid.uuid4().hex):
+            store.append(item)
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(store.delete(item["id"], "2024-06-01")))
+                       for _ in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert sum(r is not None for r in results) == 1
+            assert deleted.count(item["id"]) == 1
+
+
+# =========================
+# 进程内索引与 tail read
+# =========================
+
+def test_index_follows_appends_from_other_writers():
+    root = _tmpdir()
+    path = os.path.join(root, "fragments.jsonl")
+    reader, writer = storage.JsonlFragmentStore(path), storage.JsonlFragmentStore(path)
+    assert reader.query("2024-03-01") == []
+
+    items = _items(3, "2024-03-01", author="甲") + _items(2, "2024-03-01", author="乙")
+    writer.append_many(items)
+    assert [r["id"] for r in reader.query("2024-03-01", "甲")] == [i["id"] for i in items[:3]]
+    assert len(reader.query("2024-03-01")) == 5
+    assert len(reader.query("2024-03-01", "")) == 5
+    assert reader.query("2024-03-02") == [] and reader.query("2024-03-01", "丙") == []
+
+    # 其它进程直接追加的行（不经过本进程的存储对象）
+    extra = _items(1, "2024-03-01", author="甲")[0]
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(extra, ensure_ascii=False) + "\n")
+    assert reader.query("2024-03-01", "甲")[-1]["id"] == extra["id"]
+
+
+def test_index_rebuilds_after_file_is_replaced():
+    root = _tmpdir()
+    path = os.path.join(root, "fragments.jsonl")
+    store = storage.JsonlFragmentStore(path)
+    store.append_many(_items(4, "2024-03-03"))
+    assert len(store.query("2024-03-03")) == 4
+
+    # 另一个进程重写了文件（inode 变化，内容变短）
+    replacement = _items(1, "2024-03-03", author="乙")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps(replacement[0], ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    assert [r["id"] for r in store.query("2024-03-03")] == [replacement[0]["id"]]
+
+
+# =========================
+# tombstone 删除与压缩
+# =========================
+
+def test_delete_appends_tombstone_without_rewriting():
+    root = _tmpdir()
+    store = _single_store(root)
+    items = _items(5, "2024-03-05")
+    store.append_many(items)
+    before = os.stat(store.path)
+
+    assert store.delete(items[1]["id"])["id"] == items[1]["id"]
+    assert store.delete(items[1]["id"]) is None
+    assert store.delete_where("2024-03-05", author="甲", type="fragment") == 4
+    after = os.stat(store.path)
+    assert after.st_ino == before.st_ino and after.st_size > before.st_size
+    assert store.query("2024-03-05") == []
+    # 新的存储对象（另一个进程）重放 tombstone 后结果相同
+    assert _single_store(root).query("2024-03-05") == []
+    assert list(store.iter_all()) == []
+
+
+def test_compaction_drops_dead_records():
+    root = _tmpdir()
+    store = _single_store(root)
+    items = _items(6, "2024-03-06")
+    store.append_many(items)
+    for item in items[:2]:
+        store.delete(item["id"])
+
+    assert store.compact() == {"ok": True, "before": 8, "after": 4}
+    with open(store.path, encoding="utf-8") as f:
+        assert [json.loads(line)["id"] for line in f] == [i["id"] for i in items[2:]]
+    assert [r["id"] for r in store.query("2024-03-06")] == [i["id"] for i in items[2:]]
+    assert store.compact() == {"ok": True, "before": 4, "after": 4}
+
+
+def test_compaction_is_scheduled_after_deletes_past_threshold():
+    root = _tmpdir()
+    store = _single_store(root)
+    items = _items(10, "2024-03-07")
+    store.append_many(items)
+    saved = storage.COMPACT_MIN_BYTES, storage.COMPACT_DEAD_RATIO
+    storage.COMPACT_MIN_BYTES, storage.COMPACT_DEAD_RATIO = 0, 0.5
+    try:
+        for item in items[:3]:
+            store.delete(item["id"])
+        # 死记录占比 6/13 < 0.5：不压缩
+        time.sleep(0.05)
+        assert sum(1 for _ in open(store.path, encoding="utf-8")) == 13
+        store.delete(items[3]["id"])
+        for _ in range(100):
+            if sum(1 for _ in open(store.path, encoding="utf-8")) == 6:
+                break
+            time.sleep(0.02)
+    finally:
+        storage.COMPACT_MIN_BYTES, storage.COMPACT_DEAD_RATIO = saved
+    assert sum(1 for _ in open(store.path, encoding="utf-8")) == 6
+    assert [r["id"] for r in store.query("2024-03-07")] == [i["id"] for i in items[4:]]
+
+
+# =========================
+# 各后端行为一致与迁移到 SQLite
+# =========================
+
+def _sqlite_store(root: str) -> storage.SqliteFragmentStore:
+    return storage.SqliteFragmentStore(storage._SqliteDatabase(os.path.join(root, "punch.db")))
+
+
+def test_backends_behave_the_same():
+    for factory in (_single_store, _partitioned_store, _sqlite_store):
+        store = factory(_tmpdir())
+        day1 = _items(3, "2024-03-10", author="甲") + _items(2, "2024-03-10", author="乙")
+        day2 = _items(2, "2024-03-11", author="甲")
+        store.append_many(day1)
+        for item in day2:
+            store.append(item)
+
+        assert [r["id"] for r in store.query("2024-03-10", "甲")] == [i["id"] for i in day1[:3]], factory
+        assert len(store.query("2024-03-10")) == 5 and store.query("2024-03-12") == []
+        assert store.get(day2[1]["id"]) == day2[1]
+        assert [r["id"] for r in store.get_many([day2[1]["id"], "missing", day1[0]["id"]])] == [day2[1]["id"], day1[0]["id"]]
+
+        assert store.delete(day1[0]["id"], "2024-03-10")["id"] == day1[0]["id"]
+        assert store.delete(day1[0]["id"]) is None and store.get(day1[0]["id"]) is None
+        assert store.delete_where("2024-03-10", author="乙") == 2
+        assert store.delete_where("2024-03-10", type="summary") == 0
+
+        live = day1[1:3] + day2
+        expected = sorted(live, key=storage.keyset_key)
+        assert [r["id"] for r in store.iter_range("2024-03-01", "2024-03-31")] == [i["id"] for i in expected], factory
+        after = storage.keyset_key(expected[1])
+        assert [r["id"] for r in store.iter_range("2024-03-01", "2024-03-31", after=after)] == [i["id"] for i in expected[2:]]
+        assert sorted(r["id"] for r in store.iter_all()) == sorted(i["id"] for i in live)
+
+
+def test_migrate_jsonl_to_sqlite():
+    data_dir = fresh_data_dir()
+    setup = (
+        "import tools\n"
+        "from storage import get_fragment_store\n"
+        "ids = [tools.record_fragment(f'完成任务{i}', 'user', '甲', '2024-03-12')['saved']['id'] for i in range(3)]\n"
+        "get_fragment_store().delete(ids[0])\n"
+        "tools.confirm_clock_event('start_work', '2024-03-12T09:00:00', 'web')\n"
+        "print('ok')\n"
+    )
+    assert run_python(setup, DATA_DIR=data_dir) == "ok"
+    subprocess.run([sys.executable, "manage.py", "migrate-sqlite"], cwd=BACKEND_DIR, capture_output=True, check=True,
+                   env=dict(os.environ, DATA_DIR=data_dir))
+
+    check = (
+        "from storage import get_fragment_store, get_clock_store\n"
+        "print(len(get_fragment_store().query('2024-03-12', '甲')), get_clock_store().get_day('2024-03-12')['start_work']['status'])\n"
+    )
+    assert run_python(check, DATA_DIR=data_dir, STORAGE_BACKEND="sqlite") == "2 confirmed"
+
+
+# =========================
+# 按日期分片与旧文件迁移
+# =========================
+
+def test_partitions_are_one_file_per_day():
+    root = _tmpdir()
+    store = _partitioned_store(root)
+    store.append_many(_items(2, "2024-03-20") + _items(1, "2024-03-21"))
+    day20 = os.path.join(root, "fragments", "2024", "03", "20.jsonl")
+    assert sorted(os.listdir(os.path.join(root, "fragments", "2024", "03"))) == ["20.jsonl", "21.jsonl"]
+    before = os.stat(day20)
+
+    store.append(_items(1, "2024-03-21")[0])
+    store.delete(store.query("2024-03-21")[0]["id"])
+    after = os.stat(day20)
+    assert (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns)
+    assert store.partition_dates() == ["2024-03-20", "2024-03-21"]
+    assert len(store.query("2024-03-21")) == 1 and store.query("2024/03/21") == []
+
+    try:
+        store.append(_items(1, "20240321")[0])
+        assert False, "invalid occurred_date accepted"
+    except ValueError:
+        pass
+
+
+def test_legacy_file_stays_readable_until_converted():
+    root = _tmpdir()
+    legacy = _items(3, "2024-03-22")
+    _single_store(root).append_many(legacy)
+    store = _partitioned_store(root)
+    new = _items(1, "2024-03-22")
+    store.append_many(new)
+
+    assert [r["id"] for r in store.query("2024-03-22")] == [i["id"] for i in legacy + new]
+    # 删除旧文件里的记录：tombstone 写到分片，旧文件不变，转换后也不会复活
+    legacy_size = os.path.getsize(os.path.join(root, "fragments.jsonl"))
+    assert store.delete(legacy[0]["id"]) is not None
+    assert os.path.getsize(os.path.join(root, "fragments.jsonl")) == legacy_size
+    expected = [i["id"] for i in legacy[1:] + new]
+    assert [r["id"] for r in store.query("2024-03-22")] == expected
+
+    assert store.convert_legacy()["copied"] == 2
+    assert not os.path.exists(os.path.join(root, "fragments.jsonl"))
+    assert sorted(r["id"] for r in _partitioned_store(root).query("2024-03-22")) == sorted(expected)
+
+
+def test_legacy_deletes_survive_partition_compaction():
+    root = _tmpdir()
+    legacy = _items(3, "2024-03-23")
+    _single_store(root).append_many(legacy)
+    store = _partitioned_store(root)
+    new = _items(2, "2024-03-23")
+    store.append_many(new)
+
+    # 分片里同时有本分片记录的 tombstone 和旧文件记录的 tombstone
+    store.delete(legacy[0]["id"])
+    store.delete(new[0]["id"])
+    expected = [legacy[1]["id"], legacy[2]["id"], new[1]["id"]]
+    result = store.compact()
+    assert result["partitions"]["2024-03-23"]["after"] == 2
+    for fresh in (store, _partitioned_store(root)):
+        assert [r["id"] for r in fresh.query("2024-03-23")] == expected
+        assert fresh.get(legacy[0]["id"]) is None
+    # 只剩指向旧文件的 tombstone：没有可回收的行，不会反复压缩
+    assert store.partition("2024-03-23").index.dead_ratio() == 0
+    assert "2024-03-23" not in store.compact()["partitions"]
+
+    assert store.convert_legacy()["copied"] == 2
+    assert sorted(r["id"] for r in _partitioned_store(root).query("2024-03-23")) == sorted(expected)
+
+
+def _open_files_under(root: str):
+    fd_dir = "/proc/self/fd"
+    out = []
+    for fd in os.listdir(fd_dir):
+        try:
+            target = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if target.startswith(root + os.sep):
+            out.append(target)
+    return out
+
+
+def test_partition_cache_bounds_open_files():
+    if not os.path.isdir("/proc/self/fd"):
+        return
+    root = _tmpdir()
+    days = [f"2024-05-{d:02d}" for d in range(1, 31)]
+    cache_size, group_commit = storage.PARTITION_CACHE_SIZE, storage.GROUP_COMMIT
+    storage.PARTITION_CACHE_SIZE, storage.GROUP_COMMIT = 4, True
+    try:
+        store = _partitioned_store(root)
+        # 组提交写入器和索引的 tail reader 各常驻一个句柄
+        for d in days:
+            store.append_many(_items(2, d))
+            assert len(store.query(d)) == 2
+        assert len(store._partitions) == 4
+        assert len(_open_files_under(os.path.join(root, "fragments"))) <= 2 * 4
+        assert [len(store.query(d)) for d in days] == [2] * len(days)
+        assert list(store._partitions) == days[-4:]
+        # 被关闭的分片再次使用时重新打开
+        store.append(_items(1, days[0])[0])
+        assert len(store.query(days[0])) == 3
+        assert len(_open_files_under(os.path.join(root, "fragments"))) <= 2 * 4
+    finally:
+        storage.PARTITION_CACHE_SIZE, storage.GROUP_COMMIT = cache_size, group_commit
+
+
+# =========================
+# 打卡事件日志
+# =========================
+
+def _clock_store(root: str) -> storage.EventLogClockStore:
+    return storage.EventLogClockStore(os.path.join(root, "clock_events.jsonl"), os.path.join(root, "clock.json"))
+
+
+def test_clock_events_are_appended_and_latest_wins():
+    root = _tmpdir()
+    store, other = _clock_store(root), _clock_store(root)
+    store.set_event("2024-03-25", "start_work", {"status": "timeout"})
+    size = os.path.getsize(store.path)
+    ino = os.stat(store.path).st_ino
+    store.set_event("2024-03-25", "start_work", {"status": "confirmed"})
+    store.set_event("2024-03-25", "end_work", {"status": "confirmed"})
+
+    assert os.stat(store.path).st_ino == ino and os.path.getsize(store.path) > size
+    assert other.get_day("2024-03-25") == {"start_work": {"status": "confirmed"}, "end_work": {"status": "confirmed"}}
+    assert other.get_day("2024-03-26") == {}
+
+    assert store.compact() == {"ok": True, "days": 1}
+    with open(store.path, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+    assert _clock_store(root).load_all() == {"2024-03-25": other.get_day("2024-03-25")}
+
+
+def test_legacy_clock_json_is_imported_once():
+    root = _tmpdir()
+    legacy = {"2024-03-27": {"start_work": {"status": "confirmed"}}}
+    with open(os.path.join(root, "clock.json"), "w", encoding="utf-8") as f:
+        json.dump(legacy, f)
+
+    store = _clock_store(root)
+    assert store.get_day("2024-03-27") == legacy["2024-03-27"]
+    assert not os.path.exists(os.path.join(root, "clock.json"))
+    assert os.path.exists(os.path.join(root, "clock.json.migrated"))
+    store.set_event("2024-03-28", "start_work", {"status": "confirmed"})
+    assert sorted(_clock_store(root).load_all()) == ["2024-03-27", "2024-03-28"]
+
+
+# =========================
+# 多进程共享 DATA_DIR
+# =========================
+
+def test_concurrent_processes_share_data_dir():
+    data_dir = fresh_data_dir()
+    writer = (
+        "import sys, tools\n"
+        "from storage import get_fragment_store\n"
+        "for i in range(40):\n"
+        "    saved = tools.record_fragment(f'完成任务{sys.argv[1]}-{i}', 'user', f'作者{sys.argv[1]}', '2024-04-10')['saved']\n"
+        "    if i % 5 == 0:\n"
+        "        assert get_fragment_store().delete(saved['id']) is not None\n"
+    )
+    compactor = (
+        "from storage import get_fragment_store\n"
+        "for _ in range(20):\n"
+        "    get_fragment_store().compact()\n"
+    )
+    env = dict(os.environ, DATA_DIR=data_dir, DETERMINISTIC_ONLY="1")
+    procs = [subprocess.Popen([sys.executable, "-c", writer, str(n)], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) for n in range(4)]
+    procs.append(subprocess.Popen([sys.executable, "-c", compactor], cwd=BACKEND_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE))
+    for proc in procs:
+        _, err = proc.communicate(timeout=120)
+        assert proc.returncode == 0, err.decode("utf-8", "replace")
+
+    check = (
+        "from storage import get_fragment_store\n"
+        "rows = get_fragment_store().query('2024-04-10')\n"
+        "print(len(rows), len({r['id'] for r in rows}), len({r['author'] for r in rows}))\n"
+    )
+    assert run_python(check, DATA_DIR=data_dir) == "128 128 4"
+    # 派生的统计与原始记录一致（每个进程的变更通知都已写入 stats.db）
+    verify = subprocess.run([sys.executable, "manage.py", "rebuild-stats", "--verify"], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    assert verify.returncode == 0, verify.stdout
+
+
+# =========================
+# 组提交与 fsync 策略
+# =========================
+
+def _group_commit_store(root: str, policy: str) -> storage.JsonlFragmentStore:
+    store = _single_store(root)
+    store._writer = storage._GroupCommitWriter(store, policy, interval_ms=10)
+    return store
+
+
+def test_group_commit_merges_concurrent_appends():
+    for policy in ("always", "batch", "interval"):
+        root = _tmpdir()
+        store = _group_commit_store(root, policy)
+        batches = []
+        write_batch = store._writer._write_batch
+
+        def slow_write(batch, write_batch=write_batch):
+            batches.append(len(batch))
+            time.sleep(0.005)
+            write_batch(batch)
+
+        store._writer._write_batch = slow_write
+        items = _items(80, "2024-04-12", author=uuid.uuid4().hex)
+        threads = [threading.Thread(target=lambda chunk=items[k::8]: [store.append(i) for i in chunk]) for k in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sum(batches) == 80 and len(batches) < 80, (policy, batches)
+        assert sorted(r["id"] for r in store.query("2024-04-12")) == sorted(i["id"] for i in items)
+        # id 索引记录的偏移与合并写入后的实际位置一致
+        fresh = _single_store(root)
+        assert all(fresh.get(i["id"])["content"] == i["content"] for i in items)
+
+
+def test_group_commit_reopens_file_after_compaction():
+    root = _tmpdir()
+    store = _group_commit_store(root, "batch")
+    items = _items(4, "2024-04-13")
+    store.append_many(items)
+    store.delete(items[0]["id"])
+    store.compact()
+    late = _items(1, "2024-04-13")[0]
+    store.append(late)
+    assert [r["id"] for r in _single_store(root).query("2024-04-13")] == [i["id"] for i in items[1:]] + [late["id"]]
+
+    try:
+        storage._GroupCommitWriter(store, "never")
+        assert False, "unknown fsync policy accepted"
+    except ValueError:
+        pass
+
+
+# =========================
+# 索引快照与冷启动
+# =========================
+
+def _cold_query(path: str, dates):
+    """新的存储对象（冷启动），返回 (是否加载了快照, 各日期的查询结果)"""
+    store = storage.JsonlFragmentStore(path)
+    loaded = []
+    load = store.index._load_snapshot
+    store.index._load_snapshot = lambda: loaded.append(load()) or loaded[-1]
+    rows = {d: [r["id"] for r in store.query(d)] for d in dates}
+    return bool(loaded and loaded[0]), rows
+
+
+def test_snapshot_cold_start_matches_full_parse():
+    root = _tmpdir()
+    path = os.path.join(root, "fragments.jsonl")
+    dates = ["2024-04-20", "2024-04-21", "2024-04-22"]
+    saved = storage.SNAPSHOT_LINES
+    storage.SNAPSHOT_LINES = 10
+    try:
+        store = storage.JsonlFragmentStore(path)
+        items = [item for d in dates for item in _items(8, d)]
+        for k in range(0, len(items), 4):
+            store.append_many(items[k:k + 4])
+            store.query(dates[0])
+        store.delete(items[3]["id"])
+        store.delete(items[9]["id"])
+        store.query(dates[0])
+        assert os.path.exists(path + ".snap")
+        # 快照之后再追加（尾部需要解析）
+        tail = _items(2, dates[2], author="乙")
+        storage.JsonlFragmentStore(path).append_many(tail)
+
+        loaded, rows = _cold_query(path, dates)
+        expected = {d: [i["id"] for i in items + tail if i["occurred_date"] == d and i not in (items[3], items[9])]
+                    for d in dates}
+        assert loaded and rows == expected
+    finally:
+        storage.SNAPSHOT_LINES = saved
+
+    # 没有快照时全量解析，结果相同
+    os.remove(path + ".snap")
+    assert _cold_query(path, dates) == (False, expected)
+
+
+def test_stale_or_corrupt_snapshot_is_ignored():
+    root = _tmpdir()
+    path = os.path.join(root, "fragments.jsonl")
+    saved = storage.SNAPSHOT_LINES
+    storage.SNAPSHOT_LINES = 5
+    try:
+        store = storage.JsonlFragmentStore(path)
+        store.append_many(_items(6, "2024-04-23"))
+        store.query("2024-04-23")
+        assert os.path.exists(path + ".snap")
+    finally:
+        storage.SNAPSHOT_LINES = saved
+
+    # 数据文件被其它进程替换：快照记录的 inode 不再匹配
+    replacement = _items(2, "2024-04-23", author="乙")
+    with open(path + ".new", "w", encoding="utf-8") as f:
+        for item in replacement:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    os.replace(path + ".new", path)
+    assert _cold_query(path, ["2024-04-23"]) == (False, {"2024-04-23": [i["id"] for i in replacement]})
+
+    with open(path + ".snap", "wb") as f:
+        f.write(storage._SNAPSHOT_MAGIC + b"\xff\xff\x00\x00garbage")
+    assert _cold_query(path, ["2024-04-23"]) == (False, {"2024-04-23": [i["id"] for i in replacement]})
+
+
+# =========================
+# Fragment 记录的 dict 接口与字符串驻留
+# =========================
+
+def test_fragment_reads_like_a_dict():
+    data = dict(_items(1, "2024-04-25", tags=["a", "b"])[0], extra_field={"k": 1})
+    fragment = storage.Fragment.from_dict(data)
+
+    assert fragment == data and fragment.to_dict() == data
+    assert fragment["content"] == data["content"] and fragment.get("missing", "x") == "x"
+    assert "extra_field" in fragment and "missing" not in fragment
+    assert sorted(fragment.keys()) == sorted(data.keys())
+    assert fragment["tags"] == ("a", "b") and fragment.to_dict()["tags"] == ["a", "b"]
+    try:
+        fragment["missing"]
+        assert False, "missing key did not raise"
+    except KeyError:
+        pass
+    assert json.loads(json.dumps(fragment, default=storage.json_default, ensure_ascii=False)) == data
+    # 缺少的字段不会在 to_dict 里变成 None
+    assert storage.Fragment.from_dict({"id": "x"}).to_dict() == {"id": "x"}
+
+
+def test_fragments_share_interned_strings():
+    root = _tmpdir()
+    store = _single_store(root)
+    store.append_many(_items(3, "2024-04-26", author="作者" + uuid.uuid4().hex[:4], tags=["标签"]))
+    rows = _single_store(root).query("2024-04-26")
+    assert isinstance(rows[0], storage.Fragment)
+    assert rows[0]["author"] is rows[1]["author"] is rows[2]["author"]
+    assert rows[0]["tags"][0] is rows[2]["tags"][0]
+    assert not hasattr(rows[0], "__dict__")
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
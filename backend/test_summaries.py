@@ -0,0 +1,119 @@
+# test_summaries.py
+# 日终批量日报测试：python test_summaries.py（也可用 pytest 运行）
+# 在临时 DATA_DIR 中运行，不需要启动服务；用 Flask test client 调用接口，各用例使用各自的日期
+
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+if "storage" not in sys.modules:
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="punch_test_")
+os.environ.setdefault("DETERMINISTIC_ONLY", "1")
+
+import server  # noqa: E402
+from storage import get_fragment_store, get_summary_store  # noqa: E402
+from tools import build_fragment_item  # noqa: E402
+
+client = server.app.test_client()
+
+
+def _record(day: str, authors: int, per_author: int = 2) -> None:
+    get_fragment_store().append_many([
+        build_fragment_item(f"作者{a} 完成第{i}项", "user", f"作者{a}", day)
+        for a in range(authors) for i in range(per_author)
+    ])
+
+
+# =========================
+# 日终批量生成日报
+# =========================
+
+def test_invalid_workers_are_rejected():
+    for workers in ("4", 0, -1, 1.5, True, [2]):
+        resp = client.post("/api/summaries/batch", json={"date": "2024-09-01", "workers": workers})
+        assert resp.status_code == 400, (workers, resp.get_json())
+        assert "workers" in resp.get_json()["error"]
+
+
+def test_workers_are_clamped_to_cpu_count():
+    _record("2024-09-02", 3)
+    resp = client.post("/api/summaries/batch", json={"date": "2024-09-02", "workers": 100000})
+    result = resp.get_json()
+    assert resp.status_code == 200 and result["generated"] == 3
+    assert 1 <= result["workers"] <= (os.cpu_count() or 1)
+
+
+def test_process_pool_generates_same_summaries():
+    app_main = server.get_main_module()
+    _record("2024-09-03", 6, per_author=3)
+    cpu_count, min_authors = os.cpu_count, app_main.SUMMARY_POOL_MIN_AUTHORS
+    os.cpu_count, app_main.SUMMARY_POOL_MIN_AUTHORS = (lambda: 2), 2
+    try:
+        result = app_main.summarize_all_authors("2024-09-03", workers=2)
+    finally:
+        os.cpu_count, app_main.SUMMARY_POOL_MIN_AUTHORS = cpu_count, min_authors
+    assert result["ok"] and result["workers"] == 2 and result["generated"] == 6
+    for a in range(6):
+        assert f"作者{a} 完成第2项" in get_summary_store().get("2024-09-03", f"作者{a}")["content"]
+
+    # 碎片没有变化：全部复用
+    assert app_main.summarize_all_authors("2024-09-03", workers=1)["reused"] == 6
+
+
+# =========================
+# 日报覆盖写入与复用
+# =========================
+
+def _summaries(author: str, day: str):
+    return [i for i in client.get("/api/fragments", query_string={"date": day, "author": author}).get_json()["items"]
+            if i["type"] == "summary"]
+
+
+def test_summary_is_upserted_per_author_and_day():
+    author = "作者" + uuid.uuid4().hex[:8]
+    client.post("/api/input", json={"text": "完成接口联调", "author": author, "date": "2024-09-10"})
+    first = client.post("/api/input", json={"text": "总结今日", "author": author, "date": "2024-09-10"}).get_json()
+    assert first["action"] == "summary"
+    summary = _summaries(author, "2024-09-10")
+    assert len(summary) == 1 and "完成接口联调" in summary[0]["content"]
+
+    # 碎片没有变化：复用，不重新写入
+    client.post("/api/input", json={"text": "总结今日", "author": author, "date": "2024-09-10"})
+    assert _summaries(author, "2024-09-10")[0]["id"] == summary[0]["id"]
+
+    # 新增碎片后重新生成：仍只有一份，旧日报被覆盖；碎片存储里没有日报
+    client.post("/api/input", json={"text": "修复登录问题", "author": author, "date": "2024-09-10"})
+    client.post("/api/input", json={"text": "总结今日", "author": author, "date": "2024-09-10"})
+    updated = _summaries(author, "2024-09-10")
+    assert len(updated) == 1 and updated[0]["id"] != summary[0]["id"] and "修复登录问题" in updated[0]["content"]
+    assert all(i["type"] == "fragment" for i in get_fragment_store().query("2024-09-10", author))
+    assert get_summary_store().get("2024-09-10", author)["id"] == updated[0]["id"]
+
+    assert client.delete(f"/api/fragments/{updated[0]['id']}").status_code == 200
+    assert _summaries(author, "2024-09-10") == []
+
+
+def test_legacy_summary_in_fragment_log_is_replaced():
+    author = "作者" + uuid.uuid4().hex[:8]
+    legacy = dict(build_fragment_item("旧日报", "system", author, "2024-09-11"), type="summary")
+    get_fragment_store().append_many([build_fragment_item("完成部署", "user", author, "2024-09-11"), legacy])
+    client.post("/api/input", json={"text": "总结今日", "author": author, "date": "2024-09-11"})
+
+    summaries = _summaries(author, "2024-09-11")
+    assert len(summaries) == 1 and summaries[0]["id"] != legacy["id"]
+    assert get_fragment_store().get(legacy["id"]) is None
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+            except Exception as e:
+                failed += 1
+                print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
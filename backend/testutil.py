@@ -0,0 +1,34 @@
+# testutil.py
+# test_*.py 共用的辅助函数（本身不含测试用例）
+
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fresh_data_dir() -> str:
+    """新的临时目录，用作子进程或独立用例的 DATA_DIR"""
+    return tempfile.mkdtemp(prefix="punch_test_")
+
+
+def run_python(code: str, cwd: str = BACKEND_DIR, **env: Optional[str]) -> str:
+    """
+    在新进程里执行一段代码，返回标准输出的最后一行
+
+    环境变量继承当前进程，默认 DETERMINISTIC_ONLY=1；env 覆盖同名变量，值为 None 时去掉该变量。
+    子进程退出码非 0 时抛出 subprocess.CalledProcessError。
+    """
+    full_env = dict(os.environ, DETERMINISTIC_ONLY="1")
+    for key, value in env.items():
+        if value is None:
+            full_env.pop(key, None)
+        else:
+            full_env[key] = value
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=full_env,
+                         capture_output=True, text=True, check=True).stdout
+    lines = out.strip().splitlines()
+    return lines[-1] if lines else ""
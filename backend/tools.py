@@ -1,22 +1,24 @@
 # tools.py
 # v1.0 Tools JSON Schema + 最小本地实现（文件存储）
 #
-# 数据文件：
-# - fragments.jsonl: 每行一条事实碎片
-# - clock.json: 当天打卡状态（按 date 存）
+# 数据文件（默认 JSONL 后端，见 storage.py；STORAGE_BACKEND=sqlite 时为 punch.db）：
+# - fragments.jsonl: 每行一条事实碎片；删除以追加 type="tombstone" 记录表示，后台压缩时物理清除
+# - clock_events.jsonl: 打卡事件日志（每次打卡追加一行；旧的 clock.json 首次使用时自动导入）
 
 from __future__ import annotations
 
+import base64
+import csv
+import io
 import json
-import os
+import re
 import uuid
-from datetime import datetime, date
-from typing import Any, Dict, List, Optional
+import zlib
+from datetime import datetime, date, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-
-DATA_DIR = os.getenv("DATA_DIR", ".")
-FRAGMENTS_PATH = os.path.join(DATA_DIR, "fragments.jsonl")
-CLOCK_PATH = os.path.join(DATA_DIR, "clock.json")
+from storage import get_fragment_store, get_clock_store, get_summary_store, json_default, keyset_key
 
 
 # =========================
@@ -68,6 +70,12 @@ function_schemas: List[Dict[str, Any]] = [
                     "limit": {"type": "integer", "minimum": 1, "maximum": 200, "default": 200},
                     "order": {"type": "string", "enum": ["asc", "desc"], "default": "asc"},
                     "author": {"type": "string", "description": "按作者过滤；不传则不过滤"},
+                    "tags": {
+                        "type": "array",
+                        "items": {"type": "string", "minLength": 1, "maxLength": 20},
+                        "maxItems": 5,
+                        "description": "只返回带有全部这些标签的碎片；不传则不过滤",
+                    },
                 },
                 "required": ["date"],
             },
@@ -142,77 +150,89 @@ function_schemas: List[Dict[str, Any]] = [
 ]
 
 
-# =========================
-# 2) Minimal storage helpers
-# =========================
-
-def _ensure_data_dir() -> None:
-    os.makedirs(DATA_DIR, exist_ok=True)
-
-
-def _now_iso() -> str:
-    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-
+_SCHEMAS_BY_NAME = {s["function"]["name"]: s["function"]["parameters"] for s in function_schemas}
 
-def _load_clock() -> Dict[str, Any]:
-    _ensure_data_dir()
-    if not os.path.exists(CLOCK_PATH):
-        return {}
-    try:
-        with open(CLOCK_PATH, "r", encoding="utf-8") as f:
-            return json.load(f) or {}
-    except Exception:
-        return {}
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "boolean": bool,
+}
 
 
-def _save_clock(clock: Dict[str, Any]) -> None:
-    _ensure_data_dir()
-    with open(CLOCK_PATH, "w", encoding="utf-8") as f:
-        json.dump(clock, f, ensure_ascii=False, indent=2)
+def _validate(schema: Dict[str, Any], value: Any, path: str) -> Optional[str]:
+    """按上面 schema 用到的 JSON Schema 子集校验；通过返回 None，否则返回第一条错误"""
+    t = schema.get("type")
+    if t and (not isinstance(value, _JSON_TYPES[t]) or (t == "integer" and isinstance(value, bool))):
+        return f"{path or 'args'}: expected {t}"
+    if "enum" in schema and value not in schema["enum"]:
+        return f"{path}: must be one of {schema['enum']}"
+    if t == "string":
+        if len(value) < schema.get("minLength", 0) or len(value) > schema.get("maxLength", len(value)):
+            return f"{path}: length out of range"
+        if "pattern" in schema and not re.search(schema["pattern"], value):
+            return f"{path}: does not match {schema['pattern']}"
+    elif t == "integer":
+        if value < schema.get("minimum", value) or value > schema.get("maximum", value):
+            return f"{path}: out of range"
+    elif t == "array":
+        if len(value) > schema.get("maxItems", len(value)):
+            return f"{path}: too many items"
+        for i, v in enumerate(value):
+            err = _validate(schema.get("items", {}), v, f"{path}[{i}]")
+            if err:
+                return err
+    elif t == "object":
+        props = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                return f"{path}.{key}: required" if path else f"{key}: required"
+        for key, v in value.items():
+            sub = props.get(key)
+            if sub is None:
+                if schema.get("additionalProperties", True) is False:
+                    return f"{key}: unexpected property"
+                continue
+            err = _validate(sub, v, f"{path}.{key}" if path else key)
+            if err:
+                return err
+    return None
 
 
-def _append_jsonl(path: str, obj: Dict[str, Any]) -> None:
-    _ensure_data_dir()
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+def validate_tool_args(name: str, args: Any) -> Optional[str]:
+    """
+    用 function_schemas 校验工具参数
 
+    Returns:
+        None 表示通过，否则为错误描述（如 "content: required"）
+    """
+    schema = _SCHEMAS_BY_NAME.get(name)
+    if schema is None:
+        return f"unknown tool: {name}"
+    return _validate(schema, args, "")
 
-def _read_jsonl(path: str) -> List[Dict[str, Any]]:
-    if not os.path.exists(path):
-        return []
-    out: List[Dict[str, Any]] = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                out.append(json.loads(line))
-            except Exception:
-                continue
-    return out
 
+# =========================
+# 2) Storage（具体实现见 storage.py）
+# =========================
 
-def _rewrite_jsonl_filtered(path: str, filter_fn) -> None:
-    """
-    重写 JSONL 文件，过滤掉不符合条件的记录
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
-    Args:
-        path: JSONL 文件路径
-        filter_fn: 过滤函数，接受一个 Dict，返回 True 表示保留
-    """
-    if not os.path.exists(path):
-        return
 
-    items = _read_jsonl(path)
-    filtered_items = [item for item in items if filter_fn(item)]
+def is_valid_date(value: Any) -> bool:
+    """YYYY-MM-DD 格式且是存在的日期"""
+    if not isinstance(value, str) or not _DATE_RE.match(value):
+        return False
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
 
-    _ensure_data_dir()
-    with open(path, "w", encoding="utf-8") as f:
-        for item in filtered_items:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
 
-    print(f"[DEBUG] Rewrote {path}: {len(items)} -> {len(filtered_items)} items")
+def _now_iso() -> str:
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
 
 
 def generate_fragment_id() -> str:
@@ -220,61 +240,54 @@ def generate_fragment_id() -> str:
     return uuid.uuid4().hex
 
 
-def delete_fragment_by_id(fragment_id: str) -> Dict[str, Any]:
+def delete_fragment_by_id(fragment_id: str, occurred_date: Optional[str] = None, delta: bool = False) -> Dict[str, Any]:
     """
     按 ID 删除 fragment
 
     Args:
         fragment_id: fragment 的 id 字段
+        occurred_date: 可选，碎片所在日期（分片布局下只打开这一天的分片）
+        delta: True 时只返回被删 id 与删除后的列表版本号，不重新读取列表
 
     Returns:
         {"ok": true, "deleted_id": "...", "today_fragments": [...]}
+        delta=True 时 {"ok": true, "deleted_id": "...", "delta": {"changed": [], "deleted_ids": ["..."], "version": "..."}}
         或 {"ok": false, "error": "..."}
     """
     if not fragment_id:
         return {"ok": False, "error": "missing fragment_id"}
 
-    # 读取所有碎片
-    all_fragments = _read_jsonl(FRAGMENTS_PATH)
-
-    # 找到要删除的碎片
-    target_fragment = None
-    for frag in all_fragments:
-        if frag.get("id") == fragment_id:
-            target_fragment = frag
-            break
-
+    store = get_fragment_store()
+    # 日报单独存放：碎片里找不到时再按 id 删日报
+    target_fragment = store.delete(fragment_id, occurred_date=occurred_date)
+    if not target_fragment:
+        target_fragment = get_summary_store().delete(fragment_id, occurred_date=occurred_date)
     if not target_fragment:
         return {"ok": False, "error": f"fragment not found: {fragment_id}"}
 
+    print(f"[DEBUG] Deleted fragment {fragment_id}")
+
     # 获取该碎片的日期和作者（用于查询更新后的列表）
     occurred_date = target_fragment.get("occurred_date")
     author = target_fragment.get("author")
 
-    # 过滤掉该碎片
-    filtered_fragments = [f for f in all_fragments if f.get("id") != fragment_id]
-
-    # 重写文件
-    _ensure_data_dir()
-    with open(FRAGMENTS_PATH, "w", encoding="utf-8") as f:
-        for item in filtered_fragments:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
-
-    print(f"[DEBUG] Deleted fragment {fragment_id}, {len(all_fragments)} -> {len(filtered_fragments)} items")
+    if delta:
+        return {
+            "ok": True,
+            "deleted_id": fragment_id,
+            "delta": build_delta(occurred_date, author, deleted_ids=[fragment_id]),
+        }
 
     # 如果有日期和作者，返回更新后的今日碎片
     if occurred_date and author:
-        from datetime import date
         today_str = date.today().strftime("%Y-%m-%d")
 
-        # 如果是今天的碎片，返回今日列表
+        # 如果是今天的碎片，返回该作者的今日列表
         if occurred_date == today_str:
-            # 只返回该作者的碎片
-            today_fragments = [f for f in filtered_fragments if f.get("occurred_date") == today_str and f.get("author") == author]
             return {
                 "ok": True,
                 "deleted_id": fragment_id,
-                "today_fragments": today_fragments
+                "today_fragments": _day_items(today_str, author)
             }
 
     return {
@@ -284,14 +297,196 @@ def delete_fragment_by_id(fragment_id: str) -> Dict[str, Any]:
     }
 
 
+def get_fragment_by_id(fragment_id: str) -> Dict[str, Any]:
+    """
+    按 ID 查询单条 fragment（只读）
+
+    Returns:
+        {"ok": true, "item": {...}} 或 {"ok": false, "error": "..."}
+    """
+    if not fragment_id:
+        return {"ok": False, "error": "missing fragment_id"}
+    item = get_fragment_store().get(fragment_id) or get_summary_store().get_by_id(fragment_id)
+    if not item:
+        return {"ok": False, "error": f"fragment not found: {fragment_id}"}
+    return {"ok": True, "item": item}
+
+
+def compact_fragments() -> Dict[str, Any]:
+    """手动触发压缩（JSONL 后端物理清除已删除记录）"""
+    return get_fragment_store().compact()
+
+
+IMPORT_BATCH_SIZE = 5000
+IMPORT_CHUNK_SIZE = 1024 * 1024
+IMPORT_MAX_ERRORS = 20
+
+
+def iter_ndjson_lines(stream, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """按块读取二进制流（文件 / request.stream），逐行产出，不把整个请求体读进内存"""
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def import_fragments(lines: Iterable[bytes], author: Optional[str] = None,
+                     batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    批量导入事实碎片（NDJSON，每行一个 record_fragment 参数对象）
+
+    每行按 record_fragment 的 schema 校验（occurred_date 还须是存在的日期），通过的分配 id / created_at，
+    按 batch_size 批量写入。
+
+    Args:
+        lines: NDJSON 行（bytes），空行跳过
+        author: 行内没有 author 时使用的默认作者
+        batch_size: 每批写入条数
+
+    Returns:
+        {"ok": true, "accepted": n, "rejected": m, "errors": [{"line": 行号, "error": "..."}]}
+        errors 只保留前 IMPORT_MAX_ERRORS 条
+    """
+    store = get_fragment_store()
+    today = date.today().strftime("%Y-%m-%d")
+    accepted = rejected = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[Dict[str, Any]] = []
+    created_at = _now_iso()
+
+    for lineno, raw in enumerate(lines, 1):
+        if not raw.strip():
+            continue
+        try:
+            args = json.loads(raw)
+        except ValueError as e:
+            err = f"invalid json: {e}"
+        else:
+            if isinstance(args, dict) and author and "author" not in args:
+                args["author"] = author
+            err = validate_tool_args("record_fragment", args)
+            # schema 只校验格式：2024-13-45 这样的日期在分片布局下会建出无效的分片，也会进到 stats / 标签索引
+            if not err and args.get("occurred_date") and not is_valid_date(args["occurred_date"]):
+                err = f"invalid occurred_date: {args['occurred_date']!r}, expected YYYY-MM-DD"
+        if err:
+            rejected += 1
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({"line": lineno, "error": err})
+            continue
+
+        batch.append({
+            "id": generate_fragment_id(),
+            "type": "fragment",
+            "content": args["content"].strip(),
+            "occurred_date": args.get("occurred_date") or today,
+            "source": args["source"],
+            "author": args["author"],
+            "tags": args.get("tags") or [],
+            "created_at": created_at,
+        })
+        if len(batch) >= batch_size:
+            store.append_many(batch)
+            accepted += len(batch)
+            batch = []
+            created_at = _now_iso()
+
+    if batch:
+        store.append_many(batch)
+        accepted += len(batch)
+
+    print(f"[DEBUG] import_fragments: accepted={accepted}, rejected={rejected}")
+    return {"ok": True, "accepted": accepted, "rejected": rejected, "errors": errors}
+
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_CSV_COLUMNS = ["id", "occurred_date", "author", "type", "content", "tags", "source", "created_at"]
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def check_export_args(start: Optional[str], end: Optional[str], fmt: str) -> Optional[str]:
+    """校验导出参数；通过返回 None，否则返回错误描述"""
+    if not start or not end or not _DATE_RE.match(start) or not _DATE_RE.match(end):
+        return "start and end are required (YYYY-MM-DD)"
+    if start > end:
+        return "start must not be after end"
+    if fmt not in EXPORT_FORMATS:
+        return f"format must be one of {list(EXPORT_FORMATS)}"
+    return None
+
+
+def export_fragments(start: str, end: str, author: Optional[str] = None, fmt: str = "ndjson") -> Iterator[bytes]:
+    """
+    按日期范围导出碎片，按块产出 UTF-8 字节（约 EXPORT_CHUNK_SIZE 一块）
+
+    只读取范围内的分片 / 索引桶，边读边写，内存占用与范围大小无关。
+
+    Args:
+        start / end: YYYY-MM-DD（含两端）
+        author: 可选，按作者过滤
+        fmt: "ndjson"（每行一条原始记录）或 "csv"（EXPORT_CSV_COLUMNS 列，tags 以逗号连接）
+    """
+    rows = get_fragment_store().iter_range(start, end, author or None)
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buf)
+        # BOM：Excel 直接打开时按 UTF-8 识别中文
+        buf.write("\ufeff")
+        writer.writerow(EXPORT_CSV_COLUMNS)
+    count = 0
+    for item in rows:
+        if fmt == "csv":
+            row = [item.get(k, "") for k in EXPORT_CSV_COLUMNS]
+            tags = item.get("tags")
+            if isinstance(tags, (list, tuple)):
+                row[EXPORT_CSV_COLUMNS.index("tags")] = ",".join(tags)
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps(item, ensure_ascii=False, default=json_default))
+            buf.write("\n")
+        count += 1
+        if buf.tell() >= EXPORT_CHUNK_SIZE:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+    print(f"[DEBUG] export_fragments: start={start}, end={end}, author={author}, format={fmt}, count={count}")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """把字节块流式压缩成 gzip（wbits=31 输出 gzip 头 / 尾）"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
 # =========================
 # 3) Tool implementations
 # =========================
 
-def record_fragment(content: str, source: str, author: str, occurred_date: Optional[str] = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+# 打卡路由写入的碎片内容（见 main.py）；统计据此计算打卡覆盖
+PUNCH_CONTENT = "今天正常出勤，已完成打卡"
+
+
+def is_punch(item: Any) -> bool:
+    return item.get("type", "fragment") == "fragment" and (item.get("content") or "").strip() == PUNCH_CONTENT
+
+
+def build_fragment_item(content: str, source: str, author: str, occurred_date: Optional[str] = None,
+                        tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    """record_fragment 要写入的记录（分配 id / created_at），批量写入时由调用方收集后 append_many"""
     if not occurred_date:
         occurred_date = date.today().strftime("%Y-%m-%d")
-    item = {
+    return {
         "id": generate_fragment_id(),
         "type": "fragment",
         "content": content.strip(),
@@ -301,66 +496,293 @@ def record_fragment(content: str, source: str, author: str, occurred_date: Optio
         "tags": tags or [],
         "created_at": _now_iso(),
     }
-    _append_jsonl(FRAGMENTS_PATH, item)
+
+
+def record_fragment(content: str, source: str, author: str, occurred_date: Optional[str] = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    item = build_fragment_item(content, source, author, occurred_date, tags)
+    get_fragment_store().append(item)
     return {"ok": True, "saved": item}
 
 
-def get_fragments_by_date(date: str, limit: int = 200, order: str = "asc", author: Optional[str] = None) -> Dict[str, Any]:
-    rows = [r for r in _read_jsonl(FRAGMENTS_PATH) if r.get("occurred_date") == date]
+def _day_items(date: str, author: Optional[str] = None) -> List[Any]:
+    """某天的碎片，日报（单独的日报存储）排在最后"""
+    return get_fragment_store().query(date, author) + get_summary_store().query(date, author)
 
-    # 按 author 过滤（如果提供了有效的 author）
+
+def get_fragments_by_date(date: str, limit: int = 200, order: str = "asc", author: Optional[str] = None,
+                          tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    # 走存储后端的索引（JSONL：进程内索引 + tail read；SQLite：(occurred_date, author) 索引）
     # author=None 或 author="" 都表示不过滤，返回所有人的记录
-    if author is not None and author != "":
-        rows = [r for r in rows if r.get("author") == author]
+    # tags 非空时由标签索引查出 id 再按 id 取数（日报没有标签）
+    if tags:
+        from tag_index import get_tag_index
+        keys = get_tag_index().query_keys(tags, date, date, author or None)
+        rows = get_fragment_store().get_many([k[2] for k in keys])
+    else:
+        rows = _day_items(date, author)
 
     if order == "desc":
         rows = list(reversed(rows))
     rows = rows[: max(1, min(int(limit), 200))]
 
     # 调试日志
-    print(f"[DEBUG] get_fragments_by_date: date={date}, author_filter={author}, returned_count={len(rows)}")
+    print(f"[DEBUG] get_fragments_by_date: date={date}, author_filter={author}, tags_filter={tags}, returned_count={len(rows)}")
 
     return {"ok": True, "date": date, "count": len(rows), "items": rows}
 
 
+def get_fragments_version(date: str, author: Optional[str] = None) -> str:
+    """
+    某天（某作者或所有人）列表的版本号：碎片 / 日报新增、删除后改变，用作 GET /api/fragments?date= 的 ETag
+
+    取自 stats.db 的变更计数，不读取记录本身。
+    """
+    from stats import get_daily_stats
+    return get_daily_stats().changes(date, author or None)
+
+
+def build_delta(date: str, author: Optional[str], changed: Optional[List[Any]] = None,
+                deleted_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    增量响应：本次新增 / 覆盖的记录、删除的 id，以及写入后该日期（author 为 None 时所有人）列表的版本号
+
+    客户端据此修补本地列表，不必重新拉取整天的列表。
+    """
+    return {
+        "changed": list(changed or []),
+        "deleted_ids": list(deleted_ids or []),
+        "version": get_fragments_version(date, author),
+    }
+
+
+RANGE_DEFAULT_LIMIT = 200
+RANGE_MAX_LIMIT = 1000
+
+
+def _encode_cursor(key: Tuple[str, str, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key), ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Optional[Tuple[str, str, str]]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(key, list) or len(key) != 3 or not all(isinstance(k, str) for k in key):
+        return None
+    return key[0], key[1], key[2]
+
+
+def get_fragments_by_range(start: str, end: str, author: Optional[str] = None,
+                           cursor: Optional[str] = None, limit: int = RANGE_DEFAULT_LIMIT,
+                           tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    按日期范围分页查询事实碎片（只读）
+
+    按 (occurred_date, created_at, id) 排序；cursor 是上一页返回的 next_cursor（不透明字符串），
+    从该位置继续读，不管翻到第几页都只读取当前页需要的记录。
+
+    Args:
+        start / end: YYYY-MM-DD（含两端）
+        author: 可选，按作者过滤
+        cursor: 可选，上一页的 next_cursor
+        limit: 每页条数（1..RANGE_MAX_LIMIT）
+        tags: 可选，只返回带有全部这些标签的碎片（走标签索引）
+
+    Returns:
+        {"ok": true, "start": ..., "end": ..., "count": n, "items": [...], "next_cursor": "..." | null}
+        或 {"ok": false, "error": "..."}
+    """
+    if not start or not end or not _DATE_RE.match(start) or not _DATE_RE.match(end):
+        return {"ok": False, "error": "start and end are required (YYYY-MM-DD)"}
+    after = None
+    if cursor:
+        after = _decode_cursor(cursor)
+        if after is None:
+            return {"ok": False, "error": "invalid cursor"}
+    limit = max(1, min(int(limit), RANGE_MAX_LIMIT))
+
+    next_cursor = None
+    if tags:
+        # 标签索引按同样的 keyset 顺序返回 id；游标取自索引键，个别记录缺失也不影响翻页
+        from tag_index import get_tag_index
+        keys = get_tag_index().query_keys(tags, start, end, author or None, after=after, limit=limit + 1)
+        if len(keys) > limit:
+            keys = keys[:limit]
+            next_cursor = _encode_cursor(keys[-1])
+        rows = get_fragment_store().get_many([k[2] for k in keys])
+    else:
+        # 多取一条判断是否还有下一页；生成器在取够之后就停止，不会读完整个范围
+        rows = list(islice(get_fragment_store().iter_range(start, end, author or None, after=after), limit + 1))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(keyset_key(rows[-1]))
+
+    print(f"[DEBUG] get_fragments_by_range: start={start}, end={end}, author_filter={author}, tags_filter={tags}, returned_count={len(rows)}")
+
+    return {"ok": True, "start": start, "end": end, "count": len(rows), "items": rows, "next_cursor": next_cursor}
+
+
+TAG_FACETS_DEFAULT_LIMIT = 50
+
+
+def get_tag_facets(author: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+                   limit: int = TAG_FACETS_DEFAULT_LIMIT) -> Dict[str, Any]:
+    """
+    每个作者的标签使用次数（只读，走标签索引）
+
+    Args:
+        author: 可选，只返回该作者
+        start / end: 可选，YYYY-MM-DD（含两端）；不传则统计全部日期
+        limit: 每个作者最多返回的标签数
+
+    Returns:
+        {"ok": true, "facets": {"作者": [{"tag": "...", "count": n}, ...]}} 或 {"ok": false, "error": "..."}
+    """
+    from tag_index import get_tag_index
+
+    for d in (start, end):
+        if d and not _DATE_RE.match(d):
+            return {"ok": False, "error": "start / end must be YYYY-MM-DD"}
+    facets = get_tag_index().facets(author or None, start or None, end or None, limit=max(1, int(limit)))
+    return {"ok": True, "facets": facets}
+
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+def search_fragments(q: str, author: Optional[str] = None, start: Optional[str] = None,
+                     end: Optional[str] = None, limit: int = SEARCH_DEFAULT_LIMIT) -> Dict[str, Any]:
+    """
+    按内容全文搜索事实碎片（只读，中文按二元组匹配，空格分隔的多个词需同时出现）
+
+    Args:
+        q: 搜索词
+        author: 可选，按作者过滤
+        start / end: 可选，YYYY-MM-DD（含两端）
+        limit: 返回条数（1..SEARCH_MAX_LIMIT）
+
+    Returns:
+        {"ok": true, "q": ..., "count": n, "items": [...]}（按相关度排序）或 {"ok": false, "error": "..."}
+    """
+    from search import get_search_index
+
+    if not q or not q.strip():
+        return {"ok": False, "error": "q is required"}
+    for d in (start, end):
+        if d and not _DATE_RE.match(d):
+            return {"ok": False, "error": "start / end must be YYYY-MM-DD"}
+    limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+
+    store = get_fragment_store()
+    hits = get_search_index().search(q, author=author or None, start=start or None, end=end or None, limit=limit)
+    items = [item for item in (store.get(fragment_id) for fragment_id, _ in hits) if item is not None]
+
+    print(f"[DEBUG] search_fragments: q={q!r}, author_filter={author}, returned_count={len(items)}")
+
+    return {"ok": True, "q": q, "count": len(items), "items": items}
+
+
+STATS_MAX_DAYS = 366
+
+
+def get_stats(start: str, end: str, author: Optional[str] = None) -> Dict[str, Any]:
+    """
+    按作者、按天的记录统计与打卡覆盖情况（只读，读物化计数，不扫描原始记录）
+
+    Args:
+        start / end: YYYY-MM-DD（含两端），最多 STATS_MAX_DAYS 天
+        author: 可选，只返回该作者
+
+    Returns:
+        {
+            "ok": true, "start": ..., "end": ...,
+            "authors": {"作者": {"totals": {"fragment": n, "summary": m}, "active_days": k,
+                                 "last_active_date": "YYYY-MM-DD", "days": {"YYYY-MM-DD": {"fragment": n, ...}},
+                                 "punched_days": p, "punched_dates": ["YYYY-MM-DD", ...]}},
+            "clock": {"days": 天数, "start_work": {"confirmed": n, "timeout": m}, "end_work": {...}}
+        }
+        或 {"ok": false, "error": "..."}；last_active_date 不限于查询范围；
+        punched_* 来自打卡路由写入的打卡碎片（PUNCH_CONTENT），clock 来自 confirm_clock_event / mark_clock_timeout 记录的打卡事件
+    """
+    from stats import get_daily_stats
+
+    if not start or not end or not _DATE_RE.match(start) or not _DATE_RE.match(end):
+        return {"ok": False, "error": "start and end are required (YYYY-MM-DD)"}
+    try:
+        first, last = date.fromisoformat(start), date.fromisoformat(end)
+    except ValueError:
+        return {"ok": False, "error": "start and end must be valid dates"}
+    days = (last - first).days + 1
+    if days < 1 or days > STATS_MAX_DAYS:
+        return {"ok": False, "error": f"start must not be after end, and the range is at most {STATS_MAX_DAYS} days"}
+
+    daily = get_daily_stats()
+    authors: Dict[str, Dict[str, Any]] = {}
+    for row_author, occurred_date, type_, n in daily.query(start, end, author or None):
+        entry = authors.setdefault(row_author, {"totals": {}, "active_days": 0, "last_active_date": None, "days": {}})
+        entry["totals"][type_] = entry["totals"].get(type_, 0) + n
+        entry["days"].setdefault(occurred_date, {})[type_] = n
+    last_active = daily.last_active_dates(author or None)
+    punched = daily.punched_dates(start, end, author or None)
+    for row_author, entry in authors.items():
+        entry["active_days"] = len(entry["days"])
+        entry["last_active_date"] = last_active.get(row_author)
+        entry["punched_dates"] = punched.get(row_author, [])
+        entry["punched_days"] = len(entry["punched_dates"])
+
+    # 打卡状态本身就按天存储，逐天读取
+    clock_store = get_clock_store()
+    clock: Dict[str, Any] = {"days": days}
+    for i in range(days):
+        for event_type, state in clock_store.get_day((first + timedelta(days=i)).isoformat()).items():
+            status = (state or {}).get("status") or "unknown"
+            bucket = clock.setdefault(event_type, {})
+            bucket[status] = bucket.get(status, 0) + 1
+
+    print(f"[DEBUG] get_stats: start={start}, end={end}, author_filter={author}, authors={len(authors)}")
+
+    return {"ok": True, "start": start, "end": end, "authors": authors, "clock": clock}
+
+
 def confirm_clock_event(event_type: str, confirmed_at: str, channel: str, note: str = "") -> Dict[str, Any]:
-    clock = _load_clock()
     d = confirmed_at.split("T", 1)[0]
-    clock.setdefault(d, {})
-    clock[d][event_type] = {
+    state = {
         "status": "confirmed",
         "confirmed_at": confirmed_at,
         "channel": channel,
         "note": note,
         "updated_at": _now_iso(),
     }
-    _save_clock(clock)
-    return {"ok": True, "date": d, "event_type": event_type, "state": clock[d][event_type]}
+    store = get_clock_store()
+    with store.lock():
+        store.set_event(d, event_type, state)
+    return {"ok": True, "date": d, "event_type": event_type, "state": state}
 
 
 def mark_clock_timeout(event_type: str, deadline_at: str, timeout_at: str, reason: str) -> Dict[str, Any]:
-    clock = _load_clock()
     d = deadline_at.split("T", 1)[0]
-    clock.setdefault(d, {})
-    # 若已确认，不覆盖（从严：超时事实可以记录，但不篡改“已确认”）
-    existing = clock[d].get(event_type)
-    if existing and existing.get("status") == "confirmed":
-        return {"ok": True, "skipped": True, "reason": "already_confirmed", "existing": existing}
-
-    clock[d][event_type] = {
-        "status": "timeout",
-        "deadline_at": deadline_at,
-        "timeout_at": timeout_at,
-        "reason": reason,
-        "updated_at": _now_iso(),
-    }
-    _save_clock(clock)
-    return {"ok": True, "date": d, "event_type": event_type, "state": clock[d][event_type]}
+    store = get_clock_store()
+    with store.lock():
+        # 若已确认，不覆盖（从严：超时事实可以记录，但不篡改“已确认”）
+        existing = store.get_day(d).get(event_type)
+        if existing and existing.get("status") == "confirmed":
+            return {"ok": True, "skipped": True, "reason": "already_confirmed", "existing": existing}
+
+        state = {
+            "status": "timeout",
+            "deadline_at": deadline_at,
+            "timeout_at": timeout_at,
+            "reason": reason,
+            "updated_at": _now_iso(),
+        }
+        store.set_event(d, event_type, state)
+    return {"ok": True, "date": d, "event_type": event_type, "state": state}
 
 
 def get_clock_status(date: str | None = None, event_type: str = "all") -> Dict[str, Any]:
-    clock = _load_clock()
-    day = clock.get(date, {})
+    day = get_clock_store().get_day(date) if date else {}
     if event_type == "all":
         return {"ok": True, "date": date, "items": day}
     return {"ok": True, "date": date, "event_type": event_type, "item": day.get(event_type)}
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { submitInput, deleteFragment, type ApiResponse, type Fragment } from './api';
+import { submitInput, deleteFragment, getFragmentsByDate, getStats, subscribeFragments, applyDelta, type ApiResponse, type Fragment, type FragmentsDelta } from './api';
 import { getAuthor, setAuthor, clearAuthor } from './storage';
 import './App.css';
 
@@ -13,6 +13,7 @@ function App() {
   const [error, setError] = useState('');
   const [toast, setToast] = useState('');
   const [clockedIn, setClockedIn] = useState(false);
+  const [monthPunchedDays, setMonthPunchedDays] = useState<number | null>(null);
   const [summary, setSummary] = useState<string | null>(null);
   const [isAllView, setIsAllView] = useState(false);
   // 日期选择：每次刷新页面都回到今天，不持久化到 localStorage
@@ -34,14 +35,10 @@ function App() {
       setAuthorState(savedAuthor);
 
       // 自动查询今日碎片
-      submitInput({
-        text: '今天做了啥',
-        author: savedAuthor,
-        date: selectedDate,
-      }).then(response => {
+      getFragmentsByDate(selectedDate, savedAuthor).then(response => {
         if (response.ok) {
-          if (response.today_fragments.length > 0) {
-            updateFragments(response.today_fragments);
+          if (response.items.length > 0) {
+            updateFragments(response.items);
           }
         }
       }).catch(err => {
@@ -52,6 +49,38 @@ function App() {
     }
   }, []);
 
+  // 实时同步：其他人（或其他标签页）的记录 / 删除通过 SSE 推送过来，直接修补本地列表
+  useEffect(() => {
+    if (!author) return;
+    const viewAuthor = isAllView ? 'all' : author;
+    return subscribeFragments(selectedDate, viewAuthor, {
+      onDelta: delta => {
+        patchFragments(delta);
+      },
+      onResync: () => {
+        getFragmentsByDate(selectedDate, viewAuthor).then(response => {
+          if (response.ok) {
+            updateFragments(response.items);
+          }
+        }).catch(err => {
+          console.error('重新同步失败:', err);
+        });
+      },
+    });
+  }, [author, selectedDate, isAllView]);
+
+  // 本月打卡天数：取 /api/stats 的打卡覆盖（所选日期的月初到当天），打卡状态变化后重新获取
+  useEffect(() => {
+    if (!author) return;
+    getStats(`${selectedDate.slice(0, 8)}01`, selectedDate, author).then(response => {
+      if (response.ok) {
+        setMonthPunchedDays(response.authors[author]?.punched_days ?? 0);
+      }
+    }).catch(err => {
+      console.error('查询打卡统计失败:', err);
+    });
+  }, [author, selectedDate, clockedIn]);
+
   // 提取 summary（辅助函数）
   const extractSummary = (fragmentsList: Fragment[]): string | null => {
     // 查找最新的 type="summary" 的记录
@@ -63,23 +92,29 @@ function App() {
     return null;
   };
 
-  // 更新 fragments 并同步状态
-  const updateFragments = (fragmentsList: Fragment[]) => {
-    setFragments(fragmentsList);
-
+  // 打卡状态和 summary 由当前列表推导：整表替换、请求返回的增量、SSE 推送都会触发
+  useEffect(() => {
     // 同步打卡状态
-    const hasClockIn = fragmentsList.some(f =>
+    const hasClockIn = fragments.some(f =>
       f.content.includes('打卡') || f.content.includes('出勤')
     );
-    if (hasClockIn !== clockedIn) {
-      setClockedIn(hasClockIn);
-    }
+    setClockedIn(hasClockIn);
 
     // 同步 summary
-    const summaryText = extractSummary(fragmentsList);
+    const summaryText = extractSummary(fragments);
     if (summaryText) {
       setSummary(summaryText);
     }
+  }, [fragments]);
+
+  // 用整个列表替换 fragments
+  const updateFragments = (fragmentsList: Fragment[]) => {
+    setFragments(fragmentsList);
+  };
+
+  // 按增量修补 fragments：函数式更新基于最新的列表，请求进行中收到的 SSE 推送不会被请求发起时的旧列表覆盖
+  const patchFragments = (delta: Pick<FragmentsDelta, 'changed' | 'deleted_ids'>) => {
+    setFragments(prev => applyDelta(prev, delta));
   };
 
   // 日期变更处理
@@ -88,14 +123,10 @@ function App() {
 
     // 查询该日期的数据
     try {
-      const response = await submitInput({
-        text: '今天做了啥',
-        author: isAllView ? 'all' : author!,
-        date: newDate,
-      });
+      const response = await getFragmentsByDate(newDate, isAllView ? 'all' : author!);
 
       if (response.ok) {
-        updateFragments(response.today_fragments);
+        updateFragments(response.items);
       }
     } catch (err) {
       console.error('切换日期失败:', err);
@@ -126,11 +157,14 @@ function App() {
         text: textToSubmit,
         author: isAllView ? 'all' : author,
         date: selectedDate,
+        response: 'delta',
       });
 
       if (response.ok) {
-        // 更新碎片列表和状态
-        if (response.today_fragments.length > 0) {
+        // 更新碎片列表和状态：写入类动作只返回变更，查询类返回整个列表
+        if (response.delta) {
+          patchFragments(response.delta);
+        } else if (response.today_fragments && response.today_fragments.length > 0) {
           updateFragments(response.today_fragments);
         }
 
@@ -173,13 +207,9 @@ function App() {
     // 重新加载碎片
     if (fragments.length > 0) {
       try {
-        const response = await submitInput({
-          text: '今天做了啥',
-          author: newValue ? 'all' : author!,
-          date: selectedDate,
-        });
+        const response = await getFragmentsByDate(selectedDate, newValue ? 'all' : author!);
         if (response.ok) {
-          updateFragments(response.today_fragments);
+          updateFragments(response.items);
         }
       } catch (err) {
         console.error('切换视图失败:', err);
@@ -204,6 +234,7 @@ function App() {
         text: '今天正常出勤，已完成打卡',
         author: author,
         date: selectedDate,
+        response: 'delta',
       });
 
       if (response.ok) {
@@ -212,7 +243,9 @@ function App() {
         setTimeout(() => setToast(''), 2000);
 
         // 更新碎片列表和状态
-        if (response.today_fragments.length > 0) {
+        if (response.delta) {
+          patchFragments(response.delta);
+        } else if (response.today_fragments && response.today_fragments.length > 0) {
           updateFragments(response.today_fragments);
         }
       } else {
@@ -231,11 +264,13 @@ function App() {
     setError('');
 
     try {
-      const response = await deleteFragment(fragment.id);
+      const response = await deleteFragment(fragment.id, fragment.occurred_date, true);
 
       if (response.ok) {
-        // 用返回的 today_fragments 更新列表
-        if (response.today_fragments) {
+        // 按返回的被删 id 修补本地列表
+        if (response.delta) {
+          patchFragments(response.delta);
+        } else if (response.today_fragments) {
           updateFragments(response.today_fragments);
         }
         setToast('删除成功');
@@ -267,6 +302,11 @@ function App() {
           <span className="clock-status">
             今日打卡：{clockedIn ? '已完成' : '未完成'}
           </span>
+          {monthPunchedDays !== null && (
+            <span className="clock-status">
+              本月打卡：{monthPunchedDays} 天
+            </span>
+          )}
           <span className="author-display">
             当前: {isAllView ? '全组视图' : author || '未设置'}
           </span>
@@ -3,11 +3,19 @@ export interface ApiResponse {
   ok: boolean;
   action: 'record' | 'query' | 'confirm' | 'reject';
   tool_called: string | null;
-  today_fragments: Fragment[];
+  today_fragments?: Fragment[]; // 增量模式下写入类动作不返回，改为 delta
+  delta?: FragmentsDelta;
   input_text: string;
   error?: string;
 }
 
+// 增量响应：本次新增 / 覆盖的记录、删除的 id，以及写入后当天列表的版本号
+export interface FragmentsDelta {
+  changed: Fragment[];
+  deleted_ids: string[];
+  version: string;
+}
+
 export interface Fragment {
   id: string;
   type: string;
@@ -23,6 +31,7 @@ export interface SubmitRequest {
   text: string;
   author: string;
   date?: string; // 可选参数，格式 YYYY-MM-DD
+  response?: 'delta'; // 写入类动作只返回变更（用 applyDelta 修补本地列表）
 }
 
 export async function submitInput(request: SubmitRequest): Promise<ApiResponse> {
@@ -44,12 +53,18 @@ export async function submitInput(request: SubmitRequest): Promise<ApiResponse>
 export interface DeleteResponse {
   ok: boolean;
   deleted_id?: string;
-  today_fragments: Fragment[];
+  today_fragments?: Fragment[];
+  delta?: FragmentsDelta;
   error?: string;
 }
 
-export async function deleteFragment(fragmentId: string): Promise<DeleteResponse> {
-  const response = await fetch(`/api/fragments/${fragmentId}`, {
+export async function deleteFragment(fragmentId: string, date?: string, delta = false): Promise<DeleteResponse> {
+  // date 为碎片所在日期，后端可据此直接定位存储分片；delta 为 true 时只返回被删 id
+  const params = new URLSearchParams();
+  if (date) params.set('date', date);
+  if (delta) params.set('response', 'delta');
+  const query = params.toString() ? `?${params.toString()}` : '';
+  const response = await fetch(`/api/fragments/${fragmentId}${query}`, {
     method: 'DELETE',
   });
 
@@ -59,3 +74,104 @@ export async function deleteFragment(fragmentId: string): Promise<DeleteResponse
 
   return await response.json();
 }
+
+export function applyDelta(fragments: Fragment[], delta: Pick<FragmentsDelta, 'changed' | 'deleted_ids'>): Fragment[] {
+  // 与后端列表顺序一致：碎片按写入顺序，日报排在最后
+  const removed = new Set([...delta.deleted_ids, ...delta.changed.map(f => f.id)]);
+  const kept = fragments.filter(f => !removed.has(f.id));
+  const items = [...kept.filter(f => f.type !== 'summary'), ...delta.changed.filter(f => f.type !== 'summary')];
+  const summaries = [...kept.filter(f => f.type === 'summary'), ...delta.changed.filter(f => f.type === 'summary')];
+  return [...items, ...summaries];
+}
+
+export interface FragmentsStreamHandlers {
+  onDelta: (delta: Pick<FragmentsDelta, 'changed' | 'deleted_ids'>) => void;
+  onResync: () => void; // 可能漏掉了变更，应重新拉取列表
+}
+
+export function subscribeFragments(date: string, author: string | undefined, handlers: FragmentsStreamHandlers): () => void {
+  // 订阅当天列表的实时变更（SSE），返回取消订阅函数
+  const params = new URLSearchParams({ date });
+  if (author) params.set('author', author);
+  const source = new EventSource(`/api/fragments/stream?${params.toString()}`);
+  const parse = (e: Event) => JSON.parse((e as MessageEvent).data);
+  let connected = false;
+
+  source.addEventListener('ready', () => {
+    // EventSource 断线后自动重连，断开期间的变更收不到：重连成功后拉取一次
+    if (connected) handlers.onResync();
+    connected = true;
+  });
+  source.addEventListener('append', e => handlers.onDelta({ changed: parse(e).items, deleted_ids: [] }));
+  source.addEventListener('delete', e => handlers.onDelta({ changed: [], deleted_ids: parse(e).ids }));
+  source.addEventListener('resync', () => handlers.onResync());
+
+  return () => source.close();
+}
+
+export interface DayFragments {
+  ok: boolean;
+  date: string;
+  count: number;
+  items: Fragment[];
+  error?: string;
+}
+
+// 按 URL 缓存最近一次的 ETag 和响应体：列表没有变化时后端返回 304，直接复用缓存
+const dayCache = new Map<string, { etag: string; data: DayFragments }>();
+
+export async function getFragmentsByDate(date: string, author?: string): Promise<DayFragments> {
+  // 刷新当天列表（author 为 'all' 或不传时返回所有人），代替 POST “今天做了啥”
+  const params = new URLSearchParams({ date });
+  if (author) params.set('author', author);
+  const url = `/api/fragments?${params.toString()}`;
+  const cached = dayCache.get(url);
+  const response = await fetch(url, {
+    cache: 'no-store',
+    headers: cached ? { 'If-None-Match': cached.etag } : {},
+  });
+
+  if (response.status === 304 && cached) {
+    return cached.data;
+  }
+  if (!response.ok && response.status !== 400) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const data: DayFragments = await response.json();
+  const etag = response.headers.get('ETag');
+  if (data.ok && etag) {
+    dayCache.set(url, { etag, data });
+  }
+  return data;
+}
+
+export interface AuthorStats {
+  totals: Record<string, number>; // 记录类型（fragment / summary）-> 条数
+  active_days: number;
+  last_active_date: string | null;
+  days: Record<string, Record<string, number>>; // YYYY-MM-DD -> 记录类型 -> 条数
+  punched_days: number; // 范围内通过“打卡”记录了出勤的天数
+  punched_dates: string[]; // 这些日期（升序）
+}
+
+export interface StatsResponse {
+  ok: boolean;
+  start: string;
+  end: string;
+  authors: Record<string, AuthorStats>;
+  clock: { days: number } & Record<string, unknown>; // event_type -> { status: 天数 }
+  error?: string;
+}
+
+export async function getStats(start: string, end: string, author?: string): Promise<StatsResponse> {
+  const params = new URLSearchParams({ start, end });
+  if (author) params.set('author', author);
+  const response = await fetch(`/api/stats?${params.toString()}`);
+
+  if (!response.ok && response.status !== 400) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  return await response.json();
+}